@@ -1,5 +1,6 @@
 #!/bin/bash
-# Скрипт для запуска дополнительных процессов обработки (резервный)
+# Скрипт для запуска дополнительных процессов обработки (резервный):
+# долгоживущий обработчик папки INPUT_DIR, завершается по SIGTERM
 
 echo "Starting decoder process..."
-python /app/source/main.py "$@"
\ No newline at end of file
+exec python /app/source/main.py --serve "$@"
@@ -0,0 +1,338 @@
+import json
+import math
+from dataclasses import dataclass, field, asdict
+from typing import Dict, List, Optional, Tuple
+
+from .paths import *
+
+
+@dataclass
+class AudioAnalysis:
+    """Результат анализа аудио за один проход декодирования"""
+    sample_rate: int = SAMPLE_RATE
+    channels: int = 1
+    duration: float = 0.0
+    rms_level: Optional[float] = None
+    peak_level: Optional[float] = None
+    noise_floor: Optional[float] = None
+    crest_factor: Optional[float] = None
+    integrated_loudness: Optional[float] = None
+    loudness_range: Optional[float] = None
+    speech_regions: List[Tuple[float, float]] = field(default_factory=list)
+    silence_regions: List[Tuple[float, float]] = field(default_factory=list)
+    # Замеры loudnorm для линейной нормализации (второй проход)
+    loudness: Dict = field(default_factory=dict)
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'AudioAnalysis':
+        """Восстановление из to_dict (после JSON интервалы снова кортежи)"""
+        data = dict(data)
+        for key in ('speech_regions', 'silence_regions'):
+            data[key] = [tuple(interval) for interval in data.get(key, [])]
+        return cls(**data)
+
+    def summary(self) -> Dict:
+        """Краткая сводка без списков интервалов"""
+        result = self.to_dict()
+        result['speech_regions_count'] = len(result.pop('speech_regions'))
+        result['silence_regions_count'] = len(result.pop('silence_regions'))
+        return result
+
+
+def _log_text(line: str) -> str:
+    """Строка лога ffmpeg без префикса фильтра [Parsed_astats_1 @ 0x...]"""
+    return line.split(']', 1)[-1].strip() if line.lstrip().startswith('[') else line.strip()
+
+
+def _to_float(value: str) -> Optional[float]:
+    try:
+        return float(value.split()[0])
+    except (ValueError, IndexError):
+        return None
+
+
+def parse_astats(stderr: str) -> Dict:
+    """Разбор итоговой статистики astats из вывода ffmpeg
+
+    Значения берутся из раздела Overall; чего в нем нет (Crest factor
+    печатается только по каналам), для моно берется из раздела Channel: 1.
+    Бесконечные значения (-inf у тишины) заменяются на None.
+    """
+    sections = {}
+    section = None
+
+    for line in stderr.split('\n'):
+        text = _log_text(line)
+        if text == 'Overall' or text.startswith('Channel:'):
+            section = text
+            sections.setdefault(section, {})
+            continue
+        if section is None or ':' not in text:
+            continue
+
+        key, value = text.split(':', 1)
+        number = _to_float(value.strip())
+        if number is not None:
+            sections[section][key.strip()] = number if math.isfinite(number) else None
+
+    stats = dict(sections.get('Overall', {}))
+    channels = [name for name in sections if name.startswith('Channel:')]
+    if len(channels) == 1:
+        for key, value in sections[channels[0]].items():
+            stats.setdefault(key, value)
+
+    return {
+        'rms_level': stats.get('RMS level dB'),
+        'peak_level': stats.get('Peak level dB'),
+        'noise_floor': stats.get('Noise floor dB'),
+        'crest_factor': stats.get('Crest factor'),
+        'samples': stats.get('Number of samples'),
+    }
+
+
+def parse_ebur128(stderr: str) -> Dict:
+    """Разбор итоговой сводки ebur128: интегральная громкость и LRA"""
+    result = {'integrated_loudness': None, 'loudness_range': None}
+    summary = False
+
+    for line in stderr.split('\n'):
+        text = _log_text(line)
+        if text == 'Summary:':
+            summary = True
+        elif summary and text.startswith('I:'):
+            result['integrated_loudness'] = _to_float(text[2:].strip())
+        elif summary and text.startswith('LRA:'):
+            result['loudness_range'] = _to_float(text[4:].strip())
+
+    return result
+
+
+def parse_silencedetect(stderr: str) -> List[Tuple[float, float]]:
+    """Разбор интервалов тишины из вывода silencedetect"""
+    silences = []
+    silence_start = None
+
+    for line in stderr.split('\n'):
+        if 'silence_start:' in line:
+            silence_start = float(line.split('silence_start:')[1].split()[0])
+        elif 'silence_end:' in line and silence_start is not None:
+            silence_end = float(line.split('silence_end:')[1].split('|')[0])
+            silences.append((max(silence_start, 0.0), silence_end))
+            silence_start = None
+
+    # Тишина до конца файла: конец уточняется по длительности
+    if silence_start is not None:
+        silences.append((max(silence_start, 0.0), float('inf')))
+
+    return silences
+
+
+def parse_loudnorm(stderr: str) -> Dict:
+    """Разбор JSON-замеров loudnorm из вывода ffmpeg"""
+    start = stderr.rfind('{')
+    end = stderr.rfind('}')
+    if start == -1 or end < start:
+        return {}
+
+    try:
+        measured = json.loads(stderr[start:end + 1])
+    except ValueError:
+        return {}
+
+    keys = ('input_i', 'input_tp', 'input_lra', 'input_thresh', 'target_offset')
+    if not all(key in measured for key in keys):
+        return {}
+
+    # loudnorm отдает -inf для полной тишины, линейный режим с ним не работает
+    try:
+        loudness = {key: float(measured[key]) for key in keys}
+    except ValueError:
+        return {}
+    if any(value in (float('inf'), float('-inf')) for value in loudness.values()):
+        return {}
+
+    return loudness
+
+
+def invert_intervals(intervals: List[Tuple[float, float]],
+                     duration: float) -> List[Tuple[float, float]]:
+    """Дополнение интервалов до [0, duration]: из тишины получаем речь"""
+    result = []
+    position = 0.0
+
+    for start, end in sorted(intervals):
+        if start > position:
+            result.append((position, min(start, duration)))
+        position = max(position, end)
+
+    if duration > position:
+        result.append((position, duration))
+
+    return [(start, end) for start, end in result if end > start]
+
+
+def parse_analysis(stderr: str, sample_rate: int = SAMPLE_RATE) -> AudioAnalysis:
+    """Сборка результата анализа из вывода astats, ebur128, silencedetect и loudnorm"""
+    stats = parse_astats(stderr)
+    loudness_stats = parse_ebur128(stderr)
+    silences = parse_silencedetect(stderr)
+
+    duration = (stats['samples'] or 0) / sample_rate
+    # Открытая в конце файла тишина закрывается по длительности
+    if silences and duration:
+        silences = [(start, min(end, duration)) for start, end in silences]
+
+    return AudioAnalysis(
+        sample_rate=sample_rate,
+        duration=duration,
+        rms_level=stats['rms_level'],
+        peak_level=stats['peak_level'],
+        noise_floor=stats['noise_floor'],
+        crest_factor=stats['crest_factor'],
+        integrated_loudness=loudness_stats['integrated_loudness'],
+        loudness_range=loudness_stats['loudness_range'],
+        speech_regions=invert_intervals(silences, duration),
+        silence_regions=silences,
+        loudness=parse_loudnorm(stderr),
+    )
+
+
+def merge_intervals(intervals: List[Tuple[float, float]], margin: float = 0.0,
+                    min_gap: float = 0.0, max_count: int = 0) -> List[Tuple[float, float]]:
+    """Расширение интервалов на запас и слияние близких
+
+    Интервалы с промежутком меньше min_gap сливаются; если интервалов больше
+    max_count, сливаются по самым коротким промежуткам.
+    """
+    merged = []
+    for start, end in sorted(intervals):
+        start, end = max(0.0, start - margin), end + margin
+        if merged and start - merged[-1][1] < min_gap:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+
+    if max_count and len(merged) > max_count:
+        gaps = sorted(range(len(merged) - 1),
+                      key=lambda i: merged[i + 1][0] - merged[i][1])
+        # Промежутки, которые остаются, - самые длинные
+        keep = set(gaps[len(merged) - max_count:])
+        result = [merged[0]]
+        for i in range(1, len(merged)):
+            if i - 1 in keep:
+                result.append(merged[i])
+            else:
+                result[-1] = (result[-1][0], max(result[-1][1], merged[i][1]))
+        merged = result
+
+    return merged
+
+
+def split_filter_logs(stderr: str) -> Dict[str, str]:
+    """Разделение вывода ffmpeg по экземплярам фильтров ("Parsed_astats_3" и т.п.)
+
+    Строки без префикса (продолжение многострочного сообщения) относятся
+    к последнему встреченному фильтру.
+    """
+    logs = {}
+    current = None
+    for line in stderr.split('\n'):
+        stripped = line.lstrip()
+        if stripped.startswith('[') and ' @ ' in stripped:
+            current = stripped[1:stripped.index(' @ ')]
+        if current is not None:
+            logs.setdefault(current, []).append(line)
+    return {name: '\n'.join(lines) for name, lines in logs.items()}
+
+
+def split_window_logs(stderr: str) -> List[str]:
+    """Вывод анализа по окнам выборки
+
+    В графе на каждое окно своя цепочка astats, silencedetect и ebur128;
+    i-е по номеру экземпляры фильтров относятся к i-му окну.
+    """
+    by_filter = {}
+    for name, log in split_filter_logs(stderr).items():
+        parts = name.rsplit('_', 2)
+        if len(parts) == 3 and parts[1] in ('astats', 'silencedetect', 'ebur128') \
+                and parts[2].isdigit():
+            by_filter.setdefault(parts[1], []).append((int(parts[2]), log))
+
+    windows = []
+    for filter_logs in by_filter.values():
+        for i, (_, log) in enumerate(sorted(filter_logs)):
+            if len(windows) <= i:
+                windows.append([])
+            windows[i].append(log)
+    return ['\n'.join(logs) for logs in windows]
+
+
+def sample_windows(duration: float, count: int, window: float) -> List[float]:
+    """Начала count равномерно расставленных окон длиной window"""
+    step = duration / count
+    return [round(min(max(0.0, (i + 0.5) * step - window / 2), duration - window), 3)
+            for i in range(count)]
+
+
+def estimate(values: List[Optional[float]], population: int) -> Optional[Dict]:
+    """Среднее по выборке окон с 95% доверительным интервалом
+
+    Учитывается поправка на конечную совокупность: population - число окон
+    такой длины во всем файле.
+    """
+    values = [value for value in values if value is not None and math.isfinite(value)]
+    if not values:
+        return None
+
+    count = len(values)
+    mean = sum(values) / count
+    margin = None
+    if count > 1:
+        std = math.sqrt(sum((value - mean) ** 2 for value in values) / (count - 1))
+        correction = math.sqrt(max(population - count, 0) / (population - 1)) \
+            if population > 1 else 0.0
+        margin = 1.96 * std / math.sqrt(count) * correction
+
+    return {
+        'mean': round(mean, 3),
+        'ci95': round(margin, 3) if margin is not None else None,
+        'min': round(min(values), 3),
+        'max': round(max(values), 3),
+    }
+
+
+def sampled_summary(windows: List[AudioAnalysis], starts: List[float],
+                    window: float, duration: float) -> Dict:
+    """Оценка характеристик всего файла по окнам выборки"""
+    population = max(1, int(duration / window))
+    speech_ratio = [sum(end - start for start, end in analysis.speech_regions) / analysis.duration
+                    for analysis in windows if analysis.duration]
+    ratio = estimate(speech_ratio, population)
+    peaks = [analysis.peak_level for analysis in windows if analysis.peak_level is not None]
+
+    return {
+        'duration': duration,
+        'windows': len(windows),
+        'window_seconds': window,
+        'coverage': round(min(1.0, len(windows) * window / duration), 4) if duration else 0.0,
+        'rms_level': estimate([analysis.rms_level for analysis in windows], population),
+        'noise_floor': estimate([analysis.noise_floor for analysis in windows], population),
+        'crest_factor': estimate([analysis.crest_factor for analysis in windows], population),
+        'integrated_loudness': estimate([analysis.integrated_loudness for analysis in windows],
+                                        population),
+        'loudness_range': estimate([analysis.loudness_range for analysis in windows], population),
+        # Пик по выборке - только нижняя граница пика файла
+        'peak_level_lower_bound': max(peaks) if peaks else None,
+        'speech_ratio': ratio,
+        'speech_seconds': {
+            'mean': round(ratio['mean'] * duration, 1),
+            'ci95': round(ratio['ci95'] * duration, 1) if ratio['ci95'] is not None else None,
+        } if ratio else None,
+        # Участки речи внутри окон, в координатах файла
+        'speech_regions': [(round(start + s, 3), round(start + e, 3))
+                           for start, analysis in zip(starts, windows)
+                           for s, e in analysis.speech_regions],
+    }
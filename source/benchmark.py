@@ -0,0 +1,273 @@
+import json
+import os
+import platform
+import statistics
+import tempfile
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from .log import logger
+from .analysis import parse_astats, split_filter_logs
+from .runner import FFmpegRunError, run_ffmpeg
+
+# Сетка синтетических тестов: длительность (с), амплитуда шума, видеокодек
+BENCHMARK_DURATIONS = [10, 60]
+BENCHMARK_NOISE_LEVELS = [0.05, 0.2]
+BENCHMARK_CODECS = ['mpeg4', 'libx264']
+
+# "Речь" в тестах - тон внутри полосы речи, шум - розовый с фиксированным seed
+BENCHMARK_TONE_FREQUENCY = 440
+BENCHMARK_NOISE_SEED = 42
+
+# Число прогонов каждого случая: в результат идет медиана времени
+BENCHMARK_REPEATS = 3
+
+# Допустимое ухудшение скорости относительно базового замера; на коротких
+# прогонах шум больше 15%, поэтому замедление меньше порога в секундах не считается
+BENCHMARK_RTF_TOLERANCE = 0.15
+BENCHMARK_MIN_SLOWDOWN_SECONDS = 0.5
+BENCHMARK_SNR_TOLERANCE_DB = 1.0
+
+
+def generate_fixture(path: str, duration: float, noise: float, codec: str) -> bool:
+    """Генерация детерминированного тестового видео: тон + шум поверх testsrc"""
+    cmd = [
+        'ffmpeg', '-hide_banner', '-nostats', '-loglevel', 'error', '-y',
+        '-f', 'lavfi', '-i', f'testsrc=size=320x240:rate=25:duration={duration}',
+        '-f', 'lavfi', '-i', f'sine=frequency={BENCHMARK_TONE_FREQUENCY}:'
+                             f'sample_rate=48000:duration={duration}',
+        '-f', 'lavfi', '-i', f'anoisesrc=color=pink:amplitude={noise}:sample_rate=48000:'
+                             f'duration={duration}:seed={BENCHMARK_NOISE_SEED}',
+        '-filter_complex', '[1:a][2:a]amix=inputs=2:normalize=0[a]',
+        '-map', '0:v', '-map', '[a]',
+        '-c:v', codec, '-c:a', 'aac', '-b:a', '128k',
+        '-fflags', '+bitexact', '-flags:v', '+bitexact', '-flags:a', '+bitexact',
+        path,
+    ]
+    try:
+        # Входы lavfi ffprobe не измерит: предел времени по заданной длительности
+        result = run_ffmpeg(cmd, duration=duration)
+    except FFmpegRunError as e:
+        logger.error(f"Error generating fixture {os.path.basename(path)}: {e}")
+        return False
+    if result.returncode != 0:
+        logger.error(f"Error generating fixture {os.path.basename(path)}: {result.stderr.strip()}")
+        return False
+    return True
+
+
+def measure_snr(path: str) -> Optional[float]:
+    """Оценка SNR: уровень тона против уровня всего остального сигнала"""
+    band = f"f={BENCHMARK_TONE_FREQUENCY}:width_type=q:w=20"
+    graph = ";".join([
+        "[0:a:0]aformat=channel_layouts=mono,asplit=2[tone][rest]",
+        f"[tone]bandpass={band},astats,anullsink",
+        f"[rest]bandreject={band},astats[out]",
+    ])
+    cmd = [
+        'ffmpeg', '-hide_banner', '-nostats',
+        '-i', path,
+        '-filter_complex', graph,
+        '-map', '[out]',
+        '-f', 'null', '-',
+    ]
+    try:
+        result = run_ffmpeg(cmd, stderr_limit=None)
+    except FFmpegRunError as e:
+        logger.warning(f"Warning: could not measure SNR of {os.path.basename(path)}: {e}")
+        return None
+    if result.returncode != 0:
+        return None
+
+    # Экземпляры нумеруются в порядке описания графа: сначала тон, потом остаток
+    logs = [(int(name.rsplit('_', 1)[1]), log)
+            for name, log in split_filter_logs(result.stderr).items()
+            if name.startswith('Parsed_astats_')]
+    levels = [parse_astats(log)['rms_level'] for _, log in sorted(logs)]
+    if len(levels) != 2 or None in levels:
+        return None
+
+    tone, rest = levels
+    return round(tone - rest, 2)
+
+
+def directory_size(path: str) -> int:
+    """Суммарный размер файлов в директории"""
+    total = 0
+    for root, _, files in os.walk(path):
+        for file in files:
+            try:
+                total += os.path.getsize(os.path.join(root, file))
+            except OSError:
+                pass
+    return total
+
+
+class ScratchMonitor:
+    """Фоновый замер пикового объема временных файлов"""
+
+    def __init__(self, path: str, interval: float = 0.1):
+        self.path = path
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, directory_size(self.path))
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, directory_size(self.path))
+
+
+def time_stages(client, input_path: str, work_dir: str) -> Dict[str, float]:
+    """Время каждого этапа FFmpegClient по отдельности"""
+    timings = {}
+    audio = os.path.join(work_dir, "stage_audio.wav")
+    cleaned = os.path.join(work_dir, "stage_cleaned.wav")
+    output = os.path.join(work_dir, "stage_output.mp4")
+
+    started = time.monotonic()
+    client.extract_audio(input_path, audio)
+    timings['extract'] = time.monotonic() - started
+
+    started = time.monotonic()
+    analysis = client.analyze_audio(audio)
+    timings['analyze'] = time.monotonic() - started
+
+    started = time.monotonic()
+    client.apply_noise_reduction(audio, cleaned, loudness=analysis.loudness if analysis else None)
+    timings['clean'] = time.monotonic() - started
+
+    started = time.monotonic()
+    client.merge_audio_video(input_path, cleaned, output)
+    timings['merge'] = time.monotonic() - started
+
+    return {stage: round(seconds, 3) for stage, seconds in timings.items()}
+
+
+def run_benchmark(cleaner, durations: List[float] = None, noise_levels: List[float] = None,
+                  codecs: List[str] = None, repeats: int = BENCHMARK_REPEATS) -> Dict:
+    """Прогон сетки синтетических тестов через VoiceCleaner"""
+    durations = durations or BENCHMARK_DURATIONS
+    noise_levels = noise_levels or BENCHMARK_NOISE_LEVELS
+    codecs = codecs or BENCHMARK_CODECS
+
+    cases = []
+    with tempfile.TemporaryDirectory(prefix="voice_cleaner_bench_") as bench_dir:
+        for duration in durations:
+            for noise in noise_levels:
+                for codec in codecs:
+                    name = f"d{duration:g}_n{noise:g}_{codec}"
+                    logger.info(f"\nBenchmark case: {name}")
+
+                    fixture = os.path.join(bench_dir, f"{name}.mp4")
+                    if not generate_fixture(fixture, duration, noise, codec):
+                        cases.append({'name': name, 'error': 'fixture generation failed'})
+                        continue
+
+                    stages_dir = tempfile.mkdtemp(prefix="stages_", dir=bench_dir)
+                    stages = time_stages(cleaner.ffmpeg_client, fixture, stages_dir)
+
+                    output = os.path.join(bench_dir, f"{name}_cleaned.mp4")
+                    timings = []
+                    with ScratchMonitor(cleaner.job_work_dir(fixture, output)) as monitor:
+                        for _ in range(max(1, repeats)):
+                            started = time.monotonic()
+                            success = cleaner.process_video(fixture, output)
+                            timings.append(time.monotonic() - started)
+                            if not success:
+                                break
+                    elapsed = statistics.median(timings)
+
+                    snr_in = measure_snr(fixture)
+                    snr_out = measure_snr(output) if success else None
+                    cases.append({
+                        'name': name,
+                        'duration': duration,
+                        'noise': noise,
+                        'codec': codec,
+                        'success': success,
+                        'stages': stages,
+                        'end_to_end': round(elapsed, 3),
+                        'runs': [round(seconds, 3) for seconds in timings],
+                        'rtf': round(elapsed / duration, 4),
+                        'speed': round(duration / elapsed, 2) if elapsed else None,
+                        'peak_scratch_bytes': monitor.peak,
+                        'snr_in': snr_in,
+                        'snr_out': snr_out,
+                        'snr_improvement': (round(snr_out - snr_in, 2)
+                                            if snr_in is not None and snr_out is not None
+                                            else None),
+                    })
+
+    return {
+        'created_at': datetime.now().isoformat(),
+        'host': platform.node(),
+        'cpu_count': os.cpu_count(),
+        'mode': cleaner.mode,
+        'cases': cases,
+    }
+
+
+def compare_with_baseline(results: Dict, baseline: Dict,
+                          rtf_tolerance: float = BENCHMARK_RTF_TOLERANCE,
+                          snr_tolerance: float = BENCHMARK_SNR_TOLERANCE_DB,
+                          min_slowdown: float = BENCHMARK_MIN_SLOWDOWN_SECONDS) -> List[str]:
+    """Список регрессий относительно базового замера"""
+    regressions = []
+    previous = {case['name']: case for case in baseline.get('cases', [])}
+
+    for case in results['cases']:
+        old = previous.get(case['name'])
+        if not old or not case.get('success') or not old.get('success'):
+            continue
+
+        slowdown = (case['rtf'] - old['rtf']) * case['duration']
+        if case['rtf'] > old['rtf'] * (1 + rtf_tolerance) and slowdown > min_slowdown:
+            regressions.append(f"{case['name']}: real-time factor {old['rtf']} -> {case['rtf']}")
+        if (case['snr_improvement'] is not None and old.get('snr_improvement') is not None
+                and case['snr_improvement'] < old['snr_improvement'] - snr_tolerance):
+            regressions.append(f"{case['name']}: SNR improvement "
+                               f"{old['snr_improvement']} -> {case['snr_improvement']} dB")
+
+    return regressions
+
+
+def print_benchmark(results: Dict):
+    """Таблица результатов бенчмарка"""
+    logger.info(f"\n{'=' * 60}")
+    logger.info("BENCHMARK RESULTS")
+    logger.info(f"{'=' * 60}")
+    for case in results['cases']:
+        if 'error' in case:
+            logger.info(f"{case['name']}: {case['error']}")
+            continue
+        logger.info(f"{case['name']}: {case['end_to_end']:.2f}s, RTF {case['rtf']:.3f}, "
+                    f"scratch {case['peak_scratch_bytes'] / 1024 ** 2:.1f} MiB, "
+                    f"SNR +{case['snr_improvement']} dB, stages {case['stages']}")
+
+
+def save_benchmark(results: Dict, path: str):
+    """Сохранение результатов в JSON (может служить базовым замером)"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+
+
+def load_benchmark(path: str) -> Dict:
+    """Загрузка базового замера"""
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
@@ -0,0 +1,128 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+from typing import Dict
+
+from .paths import *
+from .log import logger
+
+# Сколько байт с начала и с конца файла входит в частичный хэш
+PARTIAL_HASH_BYTES = 1024 * 1024
+
+
+def file_fingerprint(path: str) -> Dict:
+    """Быстрый отпечаток файла: размер, время изменения и хэш начала и конца"""
+    stat = os.stat(path)
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        digest.update(f.read(PARTIAL_HASH_BYTES))
+        if stat.st_size > 2 * PARTIAL_HASH_BYTES:
+            f.seek(-PARTIAL_HASH_BYTES, os.SEEK_END)
+            digest.update(f.read(PARTIAL_HASH_BYTES))
+
+    return {
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'partial_sha256': digest.hexdigest(),
+    }
+
+
+class ResultCache:
+    """Кэш готовых результатов по отпечатку входа и параметрам обработки"""
+
+    def __init__(self, cache_dir: str = CACHE_DIR, max_bytes: int = CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(input_path: str, settings: Dict) -> str:
+        """Ключ кэша: содержимое входа, цепочка фильтров и параметры обработки"""
+        payload = {
+            'input': file_fingerprint(input_path),
+            'settings': settings,
+            'params': {
+                'sample_rate': SAMPLE_RATE,
+                'speech_band': list(SPEECH_BAND),
+                'noise_reduction_level': NOISE_REDUCTION_LEVEL,
+                'compression_ratio': COMPRESSION_RATIO,
+            },
+        }
+        encoded = json.dumps(payload, sort_keys=True).encode('utf-8')
+        return hashlib.sha256(encoded).hexdigest()
+
+    def _entry_path(self, key: str, output_path: str) -> str:
+        ext = os.path.splitext(output_path)[1]
+        return os.path.join(self.cache_dir, key[:2], key + ext)
+
+    def fetch(self, key: str, output_path: str) -> bool:
+        """Выдача результата из кэша: жесткая ссылка или копия"""
+        entry = self._entry_path(key, output_path)
+        if not os.path.exists(entry):
+            return False
+
+        try:
+            # Отметка использования для LRU
+            os.utime(entry)
+            if os.path.lexists(output_path):
+                os.remove(output_path)
+            output_dir = os.path.dirname(output_path)
+            if output_dir:
+                os.makedirs(output_dir, exist_ok=True)
+            try:
+                os.link(entry, output_path)
+            except OSError:
+                shutil.copy2(entry, output_path)
+            return True
+        except OSError as e:
+            logger.warning(f"Warning: cache fetch failed: {e}")
+            return False
+
+    def store(self, key: str, output_path: str):
+        """Сохранение результата в кэш"""
+        entry = self._entry_path(key, output_path)
+        tmp_entry = f"{entry}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+        try:
+            os.makedirs(os.path.dirname(entry), exist_ok=True)
+            try:
+                os.link(output_path, tmp_entry)
+            except OSError:
+                shutil.copy2(output_path, tmp_entry)
+            os.replace(tmp_entry, entry)
+        except OSError as e:
+            logger.warning(f"Warning: cache store failed: {e}")
+            if os.path.exists(tmp_entry):
+                os.remove(tmp_entry)
+            return
+
+        self.evict()
+
+    def evict(self):
+        """Удаление давно не использованных записей сверх лимита размера"""
+        with self._lock:
+            entries = []
+            total = 0
+            for root, _, files in os.walk(self.cache_dir):
+                for file in files:
+                    if file.endswith('.tmp'):
+                        continue
+                    path = os.path.join(root, file)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, path))
+                    total += stat.st_size
+
+            entries.sort()
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
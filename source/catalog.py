@@ -0,0 +1,196 @@
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from .paths import *
+from .log import logger
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS media (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    probe TEXT,
+    analysis TEXT,
+    status TEXT NOT NULL DEFAULT 'new',
+    output TEXT,
+    settings TEXT,
+    updated_at TEXT
+);
+CREATE TABLE IF NOT EXISTS directories (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    files TEXT NOT NULL,
+    subdirs TEXT NOT NULL
+);
+"""
+
+
+class MediaCatalog:
+    """SQLite-каталог медиафайлов с кэшем в памяти процесса
+
+    Запись файла действительна, пока совпадают его размер и время изменения.
+    Для директорий хранится их содержимое: директория, время изменения которой
+    не поменялось, повторно не читается.
+    """
+
+    def __init__(self, db_path: str = CATALOG_PATH):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._memo: Dict[str, Dict] = {}
+        self._conn = None
+
+    def _connection(self) -> sqlite3.Connection:
+        # База открывается при первом обращении, а не в конструкторе
+        if self._conn is None:
+            directory = os.path.dirname(self.db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._conn.row_factory = sqlite3.Row
+            # WAL: пакетная обработка и обработчик папки могут читать одновременно
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(SCHEMA)
+        return self._conn
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def lookup(self, path: str) -> Optional[Dict]:
+        """Запись о файле, если он не менялся с момента записи"""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        path = os.path.abspath(path)
+
+        with self._lock:
+            record = self._memo.get(path)
+            if record is None:
+                row = self._connection().execute(
+                    "SELECT * FROM media WHERE path = ?", (path,)).fetchone()
+                if row is None:
+                    return None
+                record = {
+                    'size': row['size'],
+                    'mtime_ns': row['mtime_ns'],
+                    'probe': json.loads(row['probe']) if row['probe'] else None,
+                    'analysis': json.loads(row['analysis']) if row['analysis'] else None,
+                    'status': row['status'],
+                    'output': row['output'],
+                    'settings': row['settings'],
+                }
+                self._memo[path] = record
+
+        if record['size'] != stat.st_size or record['mtime_ns'] != stat.st_mtime_ns:
+            return None
+        return record
+
+    def update(self, path: str, **fields):
+        """Обновление полей probe, analysis, status, output, settings для текущей версии файла"""
+        stat = os.stat(path)
+        path = os.path.abspath(path)
+        record = self.lookup(path) or {'probe': None, 'analysis': None,
+                                       'status': 'new', 'output': None, 'settings': None}
+        record = {**record, **fields, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO media "
+                    "(path, size, mtime_ns, probe, analysis, status, output, settings, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (path, record['size'], record['mtime_ns'],
+                     json.dumps(record['probe']) if record['probe'] else None,
+                     json.dumps(record['analysis']) if record['analysis'] else None,
+                     record['status'], record['output'], record['settings'],
+                     datetime.now().isoformat()))
+            self._memo[path] = record
+
+    def probe(self, path: str, probe_func: Callable[[str], Dict]) -> Dict:
+        """Результат ffprobe из каталога или новый запуск probe_func"""
+        record = self.lookup(path)
+        if record and record['probe']:
+            return record['probe']
+
+        probe = probe_func(path)
+        if probe:
+            self.update(path, probe=probe)
+        return probe
+
+    def scan(self, root: str, extensions: List[str] = None) -> List[str]:
+        """Список медиафайлов в дереве; читаются только изменившиеся директории"""
+        extensions = extensions or VIDEO_EXTENSIONS
+        files = []
+        visited = []
+        rescanned = 0
+        stack = [os.path.abspath(root)]
+
+        while stack:
+            directory = stack.pop()
+            try:
+                mtime_ns = os.stat(directory).st_mtime_ns
+            except OSError:
+                continue
+            visited.append(directory)
+
+            # Время изменения директории меняется при добавлении, удалении
+            # и переименовании файлов; изменение файла на месте проверяет lookup
+            with self._lock:
+                row = self._connection().execute(
+                    "SELECT * FROM directories WHERE path = ?", (directory,)).fetchone()
+            if row is not None and row['mtime_ns'] == mtime_ns:
+                names, subdirs = json.loads(row['files']), json.loads(row['subdirs'])
+            else:
+                names, subdirs = self._list_directory(directory)
+                rescanned += 1
+                with self._lock:
+                    conn = self._connection()
+                    with conn:
+                        conn.execute(
+                            "INSERT OR REPLACE INTO directories (path, mtime_ns, files, subdirs) "
+                            "VALUES (?, ?, ?, ?)",
+                            (directory, mtime_ns, json.dumps(names), json.dumps(subdirs)))
+
+            files.extend(os.path.join(directory, name) for name in names
+                         if any(name.lower().endswith(ext) for ext in extensions))
+            stack.extend(os.path.join(directory, name) for name in subdirs)
+
+        self._forget_directories(os.path.abspath(root), set(visited))
+        logger.info(f"Catalog scan: {len(files)} file(s), "
+                    f"{rescanned}/{len(visited)} director(ies) re-read")
+        return sorted(files)
+
+    @staticmethod
+    def _list_directory(directory: str):
+        names, subdirs = [], []
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.name)
+                    else:
+                        names.append(entry.name)
+        except OSError as e:
+            logger.warning(f"Warning: could not list {directory}: {e}")
+        return sorted(names), sorted(subdirs)
+
+    def _forget_directories(self, root: str, visited: set):
+        """Удаление записей о директориях, которых больше нет в дереве"""
+        with self._lock:
+            conn = self._connection()
+            prefix = root.rstrip(os.sep) + os.sep
+            rows = conn.execute(
+                "SELECT path FROM directories WHERE path = ? OR substr(path, 1, ?) = ?",
+                (root, len(prefix), prefix)).fetchall()
+            stale = [(row['path'],) for row in rows if row['path'] not in visited]
+            if stale:
+                with conn:
+                    conn.executemany("DELETE FROM directories WHERE path = ?", stale)
@@ -0,0 +1,57 @@
+import wave
+from typing import List, Tuple
+
+from .paths import *
+
+
+def wav_frames(audio_path: str) -> int:
+    """Точное число сэмплов в WAV файле по заголовку"""
+    with wave.open(audio_path, 'rb') as wav:
+        return wav.getnframes()
+
+
+def plan_chunks(total_samples: int, silences: List[Tuple[float, float]],
+                chunk_seconds: float = CHUNK_SECONDS,
+                sample_rate: int = SAMPLE_RATE) -> List[Tuple[int, int]]:
+    """Разбиение на части с границами в серединах пауз
+
+    Возвращает интервалы [start, end) в сэмплах, покрывающие весь файл без
+    пропусков. Граница ставится в паузу, ближайшую к целевой длине части;
+    если пауз рядом нет, файл режется ровно по целевой длине.
+    """
+    chunk = int(chunk_seconds * sample_rate)
+    midpoints = sorted(int((start + end) / 2 * sample_rate) for start, end in silences)
+
+    boundaries = [0]
+    # Последняя часть может быть до полутора целевых длин, чтобы не было огрызков
+    while total_samples - boundaries[-1] > chunk * 3 // 2:
+        position = boundaries[-1]
+        target = position + chunk
+        low = position + chunk // 2
+        high = min(position + chunk * 3 // 2, total_samples - chunk // 2)
+
+        candidates = [m for m in midpoints if low <= m <= high]
+        if candidates:
+            boundaries.append(min(candidates, key=lambda m: abs(m - target)))
+        else:
+            boundaries.append(target)
+
+    boundaries.append(total_samples)
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+def extend_chunks(chunks: List[Tuple[int, int]], overlap: int) -> List[Tuple[int, int]]:
+    """Расширение частей на половину перекрытия с каждой внутренней стороны
+
+    Соседние части перекрываются ровно на overlap сэмплов, поэтому после
+    склейки через acrossfade длина совпадает с исходной до сэмпла.
+    """
+    half = overlap // 2
+    extended = []
+    for i, (start, end) in enumerate(chunks):
+        if i > 0:
+            start -= half
+        if i < len(chunks) - 1:
+            end += half
+        extended.append((start, end))
+    return extended
@@ -0,0 +1,168 @@
+import asyncio
+import os
+import signal
+from typing import Dict, List, Optional, Tuple
+
+from .paths import *
+from .log import logger
+from .journal import partial_path
+
+
+class WatchWorker:
+    """Долгоживущий обработчик папки: поиск новых файлов и очередь задач
+
+    Новые файлы находятся опросом директории. Файл попадает в очередь, только
+    когда его размер и время изменения не менялись WATCH_STABLE_POLLS опросов
+    подряд, чтобы не забирать файлы, которые еще записываются. Очередь
+    ограничена: пока она заполнена, поиск новых файлов приостанавливается.
+    """
+
+    def __init__(self, cleaner, watch_dir: str, output_dir: str,
+                 poll_interval: float = WATCH_POLL_INTERVAL,
+                 stable_polls: int = WATCH_STABLE_POLLS,
+                 queue_size: int = WATCH_QUEUE_SIZE,
+                 extensions: List[str] = None):
+        self.cleaner = cleaner
+        self.watch_dir = watch_dir
+        self.output_dir = output_dir
+        self.poll_interval = poll_interval
+        self.stable_polls = stable_polls
+        self.queue_size = queue_size
+        self.extensions = extensions or VIDEO_EXTENSIONS
+        # Кандидаты: путь -> (подпись файла, число одинаковых опросов)
+        self._pending: Dict[str, Tuple[Tuple[int, int], int]] = {}
+        # Поставленные в очередь и обработанные файлы: путь -> подпись
+        self._seen: Dict[str, Tuple[int, int]] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._stopping: Optional[asyncio.Event] = None
+        self.processed = 0
+        self.failed = 0
+
+    def stop(self):
+        """Остановка: новые файлы не берутся, начатые задачи доводятся до конца"""
+        if self._stopping and not self._stopping.is_set():
+            logger.info("Stop requested, finishing jobs in progress...")
+            self._stopping.set()
+
+    async def run(self) -> Dict:
+        """Основной цикл до SIGTERM/SIGINT"""
+        os.makedirs(self.output_dir, exist_ok=True)
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._stopping = asyncio.Event()
+
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, self.stop)
+
+        logger.info(f"Watching {self.watch_dir} with {self.cleaner.jobs} worker(s), "
+                    f"output to {self.output_dir}")
+        workers = [asyncio.create_task(self._worker()) for _ in range(self.cleaner.jobs)]
+        watcher = asyncio.create_task(self._watch())
+
+        await self._stopping.wait()
+        watcher.cancel()
+        # Файлы из очереди остаются во входной папке и будут найдены при следующем запуске
+        dropped = 0
+        while not self._queue.empty():
+            self._queue.get_nowait()
+            self._queue.task_done()
+            dropped += 1
+        if dropped:
+            logger.info(f"Left {dropped} queued file(s) for the next run")
+
+        for _ in workers:
+            await self._queue.put(None)
+        await asyncio.gather(watcher, *workers, return_exceptions=True)
+
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.remove_signal_handler(sig)
+
+        logger.info(f"Stopped: {self.processed} processed, {self.failed} failed")
+        return {'processed': self.processed, 'failed': self.failed, 'dropped': dropped}
+
+    async def _watch(self):
+        """Периодический опрос директории и постановка стабильных файлов в очередь"""
+        while not self._stopping.is_set():
+            for input_path in self._scan():
+                # При заполненной очереди ожидание здесь приостанавливает поиск
+                await self._queue.put(input_path)
+
+            try:
+                await asyncio.wait_for(self._stopping.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def _scan(self) -> List[str]:
+        """Один опрос: файлы, которые перестали меняться и еще не обработаны"""
+        ready = []
+        present = set()
+        output_dir = os.path.abspath(self.output_dir)
+
+        for root, _, files in os.walk(self.watch_dir):
+            root_dir = os.path.abspath(root)
+            if root_dir == output_dir or root_dir.startswith(output_dir + os.sep):
+                continue
+            for file in files:
+                if file.startswith('.') or \
+                        not any(file.lower().endswith(ext) for ext in self.extensions):
+                    continue
+                input_path = os.path.join(root, file)
+                try:
+                    stat = os.stat(input_path)
+                except OSError:
+                    continue
+                present.add(input_path)
+
+                signature = (stat.st_size, stat.st_mtime_ns)
+                if self._seen.get(input_path) == signature:
+                    continue
+                if self._is_done(input_path, stat.st_mtime):
+                    self._seen[input_path] = signature
+                    continue
+
+                previous, polls = self._pending.get(input_path, (None, 0))
+                polls = polls + 1 if previous == signature else 1
+                if polls >= self.stable_polls:
+                    self._pending.pop(input_path, None)
+                    self._seen[input_path] = signature
+                    ready.append(input_path)
+                else:
+                    self._pending[input_path] = (signature, polls)
+
+        # Удаленные файлы больше не отслеживаются
+        for tracked in (self._pending, self._seen):
+            for input_path in list(tracked):
+                if input_path not in present:
+                    del tracked[input_path]
+
+        return ready
+
+    def _output_path(self, input_path: str) -> str:
+        """Имя выходного файла, как при обработке директории"""
+        name, ext = os.path.splitext(os.path.basename(input_path))
+        return os.path.join(self.output_dir, f"{name}_cleaned{ext}")
+
+    def _is_done(self, input_path: str, input_mtime: float) -> bool:
+        """Файл уже обработан до перезапуска: выход новее входа"""
+        try:
+            return os.path.getmtime(self._output_path(input_path)) >= input_mtime
+        except OSError:
+            return False
+
+    async def _worker(self):
+        """Обработчик очереди; None - сигнал завершения"""
+        while True:
+            input_path = await self._queue.get()
+            try:
+                if input_path is None:
+                    return
+                output_path = self._output_path(input_path)
+                if await self.cleaner.process_video_async(input_path, output_path):
+                    self.processed += 1
+                else:
+                    self.failed += 1
+                    # Прежний готовый выход не трогается, убирается только недописанный
+                    if os.path.exists(partial_path(output_path)):
+                        os.remove(partial_path(output_path))
+            finally:
+                self._queue.task_done()
@@ -0,0 +1,197 @@
+import math
+import os
+import struct
+import wave
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    # NumPy нужен только спектральному шумоподавлению
+    np = None
+
+from .paths import *
+from .log import logger
+
+
+def numpy_available() -> bool:
+    return np is not None
+
+
+def wav_layout(audio_path: str) -> Tuple[int, int, int]:
+    """Смещение данных, число сэмплов и частота 16-битного моно WAV"""
+    with open(audio_path, 'rb') as f:
+        header = f.read(12)
+        if len(header) < 12 or header[:4] != b'RIFF' or header[8:12] != b'WAVE':
+            raise ValueError(f"Not a WAV file: {audio_path}")
+
+        channels = bits = sample_rate = None
+        while True:
+            chunk = f.read(8)
+            if len(chunk) < 8:
+                raise ValueError(f"No data chunk in {audio_path}")
+            chunk_id, size = chunk[:4], struct.unpack('<I', chunk[4:])[0]
+
+            if chunk_id == b'fmt ':
+                fmt = f.read(size)
+                _, channels, sample_rate, _, _, bits = struct.unpack('<HHIIHH', fmt[:16])
+                f.seek(size % 2, os.SEEK_CUR)
+            elif chunk_id == b'data':
+                if channels != 1 or bits != 16:
+                    raise ValueError(f"Expected 16-bit mono WAV: {audio_path}")
+                offset = f.tell()
+                # Размер в заголовке может быть не дописан, если запись шла в поток
+                available = os.path.getsize(audio_path) - offset
+                return offset, min(size, available) // 2, sample_rate
+            else:
+                f.seek(size + size % 2, os.SEEK_CUR)
+
+
+def open_samples(audio_path: str):
+    """Сэмплы WAV как memmap: в память читаются только используемые блоки"""
+    offset, frames, _ = wav_layout(audio_path)
+    return np.memmap(audio_path, dtype='<i2', mode='r', offset=offset, shape=(frames,))
+
+
+def _window():
+    return np.hanning(DENOISE_FFT_SIZE + 1)[:-1].astype(np.float32)
+
+
+def _stft(signal):
+    """STFT с нулевыми краями, чтобы каждый сэмпл покрывали все окна"""
+    tail = (-len(signal)) % DENOISE_HOP
+    padded = np.pad(signal, (DENOISE_FFT_SIZE, DENOISE_FFT_SIZE + tail))
+    frames = np.lib.stride_tricks.sliding_window_view(padded, DENOISE_FFT_SIZE)[::DENOISE_HOP]
+    return np.fft.rfft(frames * _window(), axis=1)
+
+
+def _overlap_add(frames):
+    overlap = DENOISE_FFT_SIZE // DENOISE_HOP
+    count = frames.shape[0]
+    result = np.zeros((count + overlap - 1) * DENOISE_HOP, dtype=np.float32)
+    for k in range(overlap):
+        part = frames[:, k * DENOISE_HOP:(k + 1) * DENOISE_HOP].reshape(-1)
+        result[k * DENOISE_HOP:k * DENOISE_HOP + count * DENOISE_HOP] += part
+    return result
+
+
+def _istft(spectrum, length: int):
+    window = _window()
+    frames = np.fft.irfft(spectrum, n=DENOISE_FFT_SIZE, axis=1).astype(np.float32) * window
+    signal = _overlap_add(frames)
+    norm = _overlap_add(np.tile(window ** 2, (spectrum.shape[0], 1)))
+    signal /= np.maximum(norm, 1e-8)
+    return signal[DENOISE_FFT_SIZE:DENOISE_FFT_SIZE + length]
+
+
+def _moving_average(values, width: int, axis: int):
+    """Скользящее среднее той же длины (края повторяются)"""
+    if width <= 1:
+        return values
+    values = np.moveaxis(values, axis, 0)
+    before = width // 2
+    padded = np.pad(values, [(before, width - 1 - before)] + [(0, 0)] * (values.ndim - 1),
+                    mode='edge')
+    total = np.cumsum(padded, axis=0)
+    total = np.concatenate([np.zeros_like(total[:1]), total])
+    return np.moveaxis((total[width:] - total[:-width]) / width, 0, axis)
+
+
+def _magnitude_db(spectrum):
+    return 20 * np.log10(np.abs(spectrum) + 1e-10)
+
+
+def noise_threshold(samples, silence_regions: List[Tuple[float, float]],
+                    sample_rate: int = SAMPLE_RATE):
+    """Порог шума по частотам из профиля пауз: среднее + N отклонений в дБ"""
+    limit = int(DENOISE_PROFILE_SECONDS * sample_rate)
+    pieces = []
+    collected = 0
+    for start, end in silence_regions:
+        first = int(start * sample_rate)
+        last = len(samples) if math.isinf(end) else min(int(end * sample_rate), len(samples))
+        last = min(last, first + limit - collected)
+        if last - first >= DENOISE_FFT_SIZE:
+            pieces.append(_magnitude_db(_stft(samples[first:last].astype(np.float32) / 32768)))
+            collected += last - first
+        if collected >= limit:
+            break
+
+    if pieces:
+        profile = np.concatenate(pieces)
+    else:
+        # Пауз не найдено: профилем служат самые тихие кадры начала файла
+        spectra = _magnitude_db(_stft(samples[:limit].astype(np.float32) / 32768))
+        energy = spectra.mean(axis=1)
+        profile = spectra[energy <= np.percentile(energy, 20)]
+        logger.warning("   Warning: no pauses for the noise profile, using quietest frames")
+
+    return (profile.mean(axis=0)
+            + DENOISE_THRESHOLD_STD * profile.std(axis=0)).astype(np.float32)
+
+
+def spectral_gate(signal, threshold):
+    """Спектральное шумоподавление: ослабление бинов ниже порога шума"""
+    spectrum = _stft(signal)
+    mask = (_magnitude_db(spectrum) > threshold).astype(np.float32)
+    # Сглаживание маски убирает "музыкальный шум" от одиночных бинов
+    mask = _moving_average(_moving_average(mask, DENOISE_SMOOTH_FRAMES, 0),
+                           DENOISE_SMOOTH_BINS, 1)
+    floor = 10 ** (DENOISE_ATTENUATION_DB / 20)
+    return _istft(spectrum * (floor + (1 - floor) * mask), len(signal))
+
+
+def denoise_block(audio_path: str, start: int, end: int, threshold) -> bytes:
+    """Очистка сэмплов [start, end) с запасом по краям для непрерывности STFT"""
+    samples = open_samples(audio_path)
+    # Запас кратен шагу STFT: сетка окон совпадает с обработкой файла целиком
+    pad = 4 * DENOISE_FFT_SIZE
+    low, high = max(0, start - pad), min(len(samples), end + pad)
+    signal = samples[low:high].astype(np.float32) / 32768
+
+    cleaned = spectral_gate(signal, threshold)[start - low:end - low]
+    return (np.clip(cleaned, -1.0, 32767 / 32768) * 32768).astype('<i2').tobytes()
+
+
+def denoise_wav(input_audio: str, output_audio: str,
+                silence_regions: List[Tuple[float, float]], workers: int = 1) -> bool:
+    """Спектральное шумоподавление WAV блоками, с профилем шума из пауз"""
+    if np is None:
+        logger.error("Error: spectral denoiser requires numpy")
+        return False
+
+    try:
+        samples = open_samples(input_audio)
+        _, total, sample_rate = wav_layout(input_audio)
+        threshold = noise_threshold(samples, silence_regions, sample_rate)
+
+        block = int(DENOISE_BLOCK_SECONDS * sample_rate) // DENOISE_HOP * DENOISE_HOP
+        blocks = [(start, min(start + block, total)) for start in range(0, total, block)]
+
+        with wave.open(output_audio, 'wb') as output:
+            output.setnchannels(1)
+            output.setsampwidth(2)
+            output.setframerate(sample_rate)
+
+            if workers <= 1 or len(blocks) <= 1:
+                for start, end in blocks:
+                    output.writeframes(denoise_block(input_audio, start, end, threshold))
+                return True
+
+            # Не больше двух блоков на процесс в работе: память не растет с длиной файла
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                pending = deque()
+                for start, end in blocks:
+                    pending.append(executor.submit(denoise_block, input_audio, start, end,
+                                                   threshold))
+                    if len(pending) >= 2 * workers:
+                        output.writeframes(pending.popleft().result())
+                while pending:
+                    output.writeframes(pending.popleft().result())
+        return True
+
+    except Exception as e:
+        logger.error(f"Error in spectral denoising: {e}")
+        return False
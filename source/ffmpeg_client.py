@@ -1,8 +1,18 @@
+import json
+import os
 import subprocess
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
 import ffmpeg
 
 from .paths import *
+from .log import logger
+from .metrics import latency_summary
+from .runner import (FFmpegProcess, FFmpegRunError, media_duration, run_timeout, run_ffmpeg,
+                     run_ffmpeg_async, run_stream)
+from .analysis import (AudioAnalysis, parse_analysis, parse_loudnorm, merge_intervals,
+                       split_window_logs, sample_windows, sampled_summary)
+from .presets import preset_filters
+from . import vad
 
 
 class FFmpegClient:
@@ -12,223 +22,924 @@ class FFmpegClient:
     def probe_video(filepath: str) -> Dict:
         """Получение информации о видео файле"""
         try:
-            probe = ffmpeg.probe(filepath)
-            return probe
-        except ffmpeg.Error as e:
-            print(f"Error probing video: {e}")
+            result = run_ffmpeg(FFmpegClient.build_probe_command(filepath),
+                                capture_stdout=True, timeout=FFMPEG_TIMEOUT_BASE).check()
+            return json.loads(result.stdout)
+        except (ffmpeg.Error, ValueError) as e:
+            logger.error(f"Error probing video: {e}")
             return {}
 
     @staticmethod
-    def extract_audio(video_path: str, audio_path: str) -> bool:
+    def build_probe_command(filepath: str) -> List[str]:
+        """Команда ffprobe с тем же JSON, что возвращает ffmpeg.probe"""
+        return ['ffprobe', '-v', 'error', '-print_format', 'json',
+                '-show_format', '-show_streams', filepath]
+
+    @staticmethod
+    async def probe_video_async(filepath: str) -> Dict:
+        """Получение информации о видео файле без блокировки цикла событий"""
+        returncode, stdout, stderr = await FFmpegClient.run_async(
+            FFmpegClient.build_probe_command(filepath))
+        if returncode != 0:
+            logger.error(f"Error probing video: {stderr.strip()}")
+            return {}
+        try:
+            return json.loads(stdout)
+        except ValueError as e:
+            logger.error(f"Error probing video: {e}")
+            return {}
+
+    @staticmethod
+    async def run_async(cmd: List[str],
+                        stderr_limit: Optional[int] = FFMPEG_STDERR_LIMIT) -> Tuple[int, str, str]:
+        """Запуск команды без блокировки цикла событий: код возврата, stdout, stderr
+
+        Отмена задачи завершает группу процессов ffmpeg; превышение предела
+        времени дает код -1 с причиной в конце stderr.
+        """
+        try:
+            result = await run_ffmpeg_async(cmd, capture_stdout=True,
+                                            stderr_limit=stderr_limit)
+        except FFmpegRunError as e:
+            return -1, '', f"{e.stderr}\n{os.path.basename(e.cmd[0])} {e.reason}"
+        return (result.returncode,
+                (result.stdout or b'').decode(errors='replace'),
+                result.stderr)
+
+    @staticmethod
+    def extract_audio(video_path: str, audio_path: str, threads: int = 0) -> bool:
         """Извлечение аудио из видео"""
         try:
-            (
+            run_stream(
                 ffmpeg
                 .input(video_path)
-                .output(audio_path, acodec='pcm_s16le', ac=1, ar=SAMPLE_RATE)
+                .output(audio_path, acodec='pcm_s16le', ac=1, ar=SAMPLE_RATE,
+                        threads=threads)
                 .overwrite_output()
-                .run(quiet=True)
             )
             return True
         except ffmpeg.Error as e:
-            print(f"Error extracting audio: {e}")
+            logger.error(f"Error extracting audio: {e}")
             return False
 
+    @staticmethod
+    def build_analysis_filter() -> str:
+        """Цепочка анализа: статистика, громкость EBU R128 и поиск тишины"""
+        # ebur128 пишет покадровый лог только на уровне verbose, итог - на info
+        return ",".join([
+            "astats",
+            f"silencedetect=noise={SILENCE_NOISE}:d={SILENCE_DURATION}",
+            "ebur128=framelog=verbose",
+        ])
+
+    @staticmethod
+    def analyze_audio(input_path: str,
+                      reduction_level: float = NOISE_REDUCTION_LEVEL,
+                      measure_loudness: bool = True,
+                      threads: int = 0,
+                      denoiser: str = 'afftdn',
+                      preset: Optional[str] = None) -> Optional[AudioAnalysis]:
+        """Анализ аудио за одно декодирование"""
+        try:
+            cmd = FFmpegClient.build_analysis_command(input_path, reduction_level,
+                                                      measure_loudness, threads, denoiser,
+                                                      preset)
+
+            # Замеры разбираются из stderr: вывод не обрезается
+            result = run_ffmpeg(cmd, stderr_limit=None)
+
+            if result.returncode != 0:
+                tail = "\n".join(result.stderr.strip().split("\n")[-5:])
+                logger.error(f"Error analyzing audio: {tail}")
+                return None
+
+            return parse_analysis(result.stderr)
+
+        except Exception as e:
+            logger.error(f"Error analyzing audio: {e}")
+            return None
+
+    @staticmethod
+    async def analyze_audio_async(input_path: str,
+                                  reduction_level: float = NOISE_REDUCTION_LEVEL,
+                                  measure_loudness: bool = True,
+                                  threads: int = 0,
+                                  preset: Optional[str] = None) -> Optional[AudioAnalysis]:
+        """Анализ аудио как asyncio подпроцесс"""
+        cmd = FFmpegClient.build_analysis_command(input_path, reduction_level,
+                                                  measure_loudness, threads, preset=preset)
+        returncode, _, stderr = await FFmpegClient.run_async(cmd, stderr_limit=None)
+        if returncode != 0:
+            tail = "\n".join(stderr.strip().split("\n")[-5:])
+            logger.error(f"Error analyzing audio: {tail}")
+            return None
+
+        return parse_analysis(stderr)
+
+    @staticmethod
+    def build_analysis_command(input_path: str,
+                               reduction_level: float = NOISE_REDUCTION_LEVEL,
+                               measure_loudness: bool = True,
+                               threads: int = 0,
+                               denoiser: str = 'afftdn',
+                               preset: Optional[str] = None) -> List[str]:
+        """Сборка команды анализа: статистика, громкость и паузы"""
+        # Ветка raw - статистика исходного сигнала, ветка pre - замер
+        # громкости в точке цепочки очистки, где стоит loudnorm
+        prepare = f"[0:a:0]aformat=channel_layouts=mono,aresample={SAMPLE_RATE}"
+        if measure_loudness:
+            # Порог гейта пресета здесь по умолчанию: уровень шума еще не известен,
+            # а паузы в интегральную громкость почти не входят
+            pre_filter = FFmpegClient.build_cleaning_filter(reduction_level, normalize=False,
+                                                            denoiser=denoiser, preset=preset)
+            graph = ";".join([
+                f"{prepare},asplit=2[raw][pre]",
+                f"[raw]{FFmpegClient.build_analysis_filter()}[out]",
+                f"[pre]{pre_filter},"
+                f"{FFmpegClient.build_loudnorm_filter(print_json=True)},anullsink",
+            ])
+        else:
+            graph = f"{prepare},{FFmpegClient.build_analysis_filter()}[out]"
+
+        # Явный map, иначе ffmpeg добавит в null-выход и декодирование видео
+        return [
+            'ffmpeg', '-hide_banner', '-nostats',
+            '-i', input_path,
+            '-filter_complex', graph,
+            '-map', '[out]',
+            '-threads', str(threads),
+            '-f', 'null',
+            '-'
+        ]
+
     @staticmethod
     def analyze_audio_spectrum(audio_path: str) -> Dict:
         """Анализ спектра аудио для определения характеристик"""
+        analysis = FFmpegClient.analyze_audio(audio_path, measure_loudness=False)
+        return analysis.to_dict() if analysis else {}
+
+    @staticmethod
+    def window_inputs(input_path: str, starts: List[float], window: float) -> List[str]:
+        """Входы-окна: перемотка на стороне входа, декодируется только окно"""
+        args = []
+        for start in starts:
+            args += ['-ss', f"{start:.3f}", '-t', f"{window:.3f}", '-i', input_path]
+        return args
+
+    @staticmethod
+    def build_sampled_analysis_command(input_path: str, starts: List[float], window: float,
+                                       threads: int = 0) -> List[str]:
+        """Команда анализа окон выборки: своя цепочка анализа на каждое окно"""
+        chains = [f"[{i}:a:0]aformat=channel_layouts=mono,aresample={SAMPLE_RATE},"
+                  f"{FFmpegClient.build_analysis_filter()}[w{i}]"
+                  for i in range(len(starts))]
+        maps = []
+        for i in range(len(starts)):
+            maps += ['-map', f'[w{i}]']
+
+        return [
+            'ffmpeg', '-hide_banner', '-nostats',
+            *FFmpegClient.window_inputs(input_path, starts, window),
+            '-filter_complex', ";".join(chains),
+            *maps,
+            '-threads', str(threads),
+            '-f', 'null',
+            '-'
+        ]
+
+    @staticmethod
+    def analyze_sampled(input_path: str, duration: float,
+                        windows: int = QUICK_WINDOWS,
+                        window: float = QUICK_WINDOW_SECONDS,
+                        threads: int = 0) -> Optional[Dict]:
+        """Быстрый анализ по равномерной выборке окон с оценкой погрешности"""
         try:
-            # Используем ffmpeg для анализа спектра
-            cmd = [
-                'ffmpeg',
-                '-i', audio_path,
-                '-af', 'astats=metadata=1:reset=1',
-                '-f', 'null',
-                '-'
-            ]
+            starts = sample_windows(duration, windows, window)
+            cmd = FFmpegClient.build_sampled_analysis_command(input_path, starts, window,
+                                                              threads)
 
-            result = subprocess.run(
-                cmd,
-                capture_output=True,
-                text=True,
-                timeout=30
-            )
+            result = run_ffmpeg(cmd, stderr_limit=None)
 
-            # Парсим вывод для получения информации об аудио
-            analysis = {
-                'sample_rate': SAMPLE_RATE,
-                'channels': 1,
-                'duration': 0,
-                'rms_level': -30,  # по умолчанию
-                'peak_level': -6,  # по умолчанию
-            }
+            if result.returncode != 0:
+                tail = "\n".join(result.stderr.strip().split("\n")[-5:])
+                logger.error(f"Error in sampled analysis: {tail}")
+                return None
 
-            # Получаем длительность
-            probe = FFmpegClient.probe_video(audio_path)
-            if probe and 'format' in probe:
-                analysis['duration'] = float(probe['format'].get('duration', 0))
+            analyses = [parse_analysis(log) for log in split_window_logs(result.stderr)]
+            if len(analyses) != len(starts):
+                logger.error(f"Error in sampled analysis: expected {len(starts)} windows, "
+                             f"parsed {len(analyses)}")
+                return None
 
-            return analysis
+            return sampled_summary(analyses, starts, window, duration)
 
         except Exception as e:
-            print(f"Error analyzing audio spectrum: {e}")
-            return {}
+            logger.error(f"Error in sampled analysis: {e}")
+            return None
 
     @staticmethod
-    def apply_noise_reduction(input_audio: str, output_audio: str,
-                              reduction_level: float = NOISE_REDUCTION_LEVEL) -> bool:
-        """Применение шумоподавления"""
-        try:
-            # Комплексный фильтр для подавления шумов и музыки
-            # 1. Бандпас фильтр для выделения полосы речи
-            # 2. Динамическая компрессия
-            # 3. Подавление шума
-            # 4. Нормализация
+    def build_cleaning_filter(reduction_level: float = NOISE_REDUCTION_LEVEL,
+                              loudness: Optional[Dict] = None,
+                              normalize: bool = True,
+                              speech_regions: Optional[List[Tuple[float, float]]] = None,
+                              duration: float = 0.0,
+                              denoiser: str = 'afftdn',
+                              preset: Optional[str] = None,
+                              noise_floor: Optional[float] = None,
+                              band: Tuple[float, float] = SPEECH_BAND,
+                              compression_ratio: float = COMPRESSION_RATIO) -> str:
+        """Сборка цепочки фильтров очистки речи; preset заменяет параметры по умолчанию"""
+        # Комплексный фильтр для подавления шумов и музыки
+        # 1. Бандпас фильтр для выделения полосы речи
+        # 2. Динамическая компрессия
+        # 3. Подавление шума
+        # 4. Нормализация
+        filter_chain = [
+            # Бандпас фильтр для выделения полосы речи
+            f"highpass=f={band[0]:g}",
+            f"lowpass=f={band[1]:g}",
+        ]
+
+        # Подавление шумов; спектральное шумоподавление выполняется до ffmpeg
+        denoise = [f"afftdn=nf={reduction_level}:nt=w"] if denoiser == 'afftdn' else []
+
+        if preset:
+            # Пресет: своя полоса, гейт пауз после шумоподавления и компрессор
+            filter_chain, dynamics = preset_filters(preset, noise_floor)
+            heavy_filters = denoise + dynamics
+        else:
+            heavy_filters = [
+                # Динамическая компрессия для улучшения речи
+                f"acompressor=threshold=-30dB:ratio={compression_ratio}:attack=50:release=500",
+            ] + denoise
 
-            filter_chain = [
-                # Бандпас фильтр для выделения полосы речи
-                f"highpass=f={SPEECH_BAND[0]}",
-                f"lowpass=f={SPEECH_BAND[1]}",
+        if speech_regions is not None:
+            filter_chain.append(
+                FFmpegClient.build_gated_filter(heavy_filters, speech_regions, duration))
+        else:
+            filter_chain.append(",".join(heavy_filters).replace("{label}", "sc"))
 
-                # Динамическая компрессия для улучшения речи
-                f"acompressor=threshold=-30dB:ratio={COMPRESSION_RATIO}:attack=50:release=500",
+        # Нормализация
+        if normalize:
+            filter_chain.append(FFmpegClient.build_loudnorm_filter(loudness))
 
-                # Подавление шумов
-                f"afftdn=nf={reduction_level}:nt=w",
+        return ",".join(filter_chain)
 
-                # Нормализация
-                "loudnorm=I=-16:LRA=11:TP=-1.5",
+    @staticmethod
+    def build_gated_filter(heavy_filters: List[str],
+                           speech_regions: List[Tuple[float, float]],
+                           duration: float = 0.0) -> str:
+        """Тяжелые фильтры только на участках речи, паузы - дешевое ослабление"""
+        regions = merge_intervals(speech_regions, SPEECH_GATE_MARGIN,
+                                  SPEECH_GATE_MIN_GAP, SPEECH_GATE_MAX_REGIONS)
+        gap_filter = f"volume={SPEECH_GATE_ATTENUATION_DB}dB"
+
+        # Сегменты чередуются: пауза, речь, пауза...; asegment режет по сэмплам
+        points = []
+        kinds = []
+        position = 0
+        end_sample = int(round(duration * SAMPLE_RATE)) if duration else 0
+        for start, end in regions:
+            start = int(round(start * SAMPLE_RATE))
+            end = int(round(end * SAMPLE_RATE))
+            if end_sample:
+                end = min(end, end_sample)
+            if end <= max(start, position):
+                continue
+            if start > position:
+                points.append(start)
+                kinds.append('gap')
+            else:
+                start = position
+            # Речь до конца файла - последний сегмент, без точки разреза
+            if end_sample and end >= end_sample:
+                kinds.append('speech')
+                position = None
+                break
+            points.append(end)
+            kinds.append('speech')
+            position = end
+        if position is not None:
+            kinds.append('gap')
+
+        if 'speech' not in kinds:
+            return gap_filter
+        if len(kinds) == 1:
+            return ",".join(heavy_filters).replace("{label}", "sc")
+
+        labels = [f"sg{i}" for i in range(len(kinds))]
+        parts = [f"asegment=samples={'|'.join(str(p) for p in points)}"
+                 + "".join(f"[{label}]" for label in labels)]
+        for label, kind in zip(labels, kinds):
+            # Метки внутренних веток цепочки уникальны для каждого сегмента
+            chain = ",".join(heavy_filters).replace("{label}", f"{label}sc") \
+                if kind == 'speech' else gap_filter
+            parts.append(f"[{label}]{chain}[{label}o]")
+        parts.append("".join(f"[{label}o]" for label in labels)
+                     + f"concat=n={len(labels)}:v=0:a=1")
+
+        return ";".join(parts)
+
+    @staticmethod
+    def build_loudnorm_filter(loudness: Optional[Dict] = None,
+                              print_json: bool = False) -> str:
+        """Фильтр loudnorm: линейный по замерам первого прохода или динамический"""
+        params = [f"I={LOUDNORM_I}", f"LRA={LOUDNORM_LRA}", f"TP={LOUDNORM_TP}"]
+
+        if loudness:
+            params += [
+                f"measured_I={loudness['input_i']}",
+                f"measured_LRA={loudness['input_lra']}",
+                f"measured_TP={loudness['input_tp']}",
+                f"measured_thresh={loudness['input_thresh']}",
+                f"offset={loudness['target_offset']}",
+                "linear=true",
             ]
 
-            filter_str = ",".join(filter_chain)
+        if print_json:
+            params.append("print_format=json")
+
+        return "loudnorm=" + ":".join(params)
 
-            (
+    @staticmethod
+    def apply_noise_reduction(input_audio: str, output_audio: str,
+                              reduction_level: float = NOISE_REDUCTION_LEVEL,
+                              loudness: Optional[Dict] = None,
+                              threads: int = 0,
+                              cleaning_filter: Optional[str] = None) -> bool:
+        """Применение шумоподавления"""
+        try:
+            filter_str = cleaning_filter or FFmpegClient.build_cleaning_filter(reduction_level,
+                                                                               loudness)
+
+            run_stream(
                 ffmpeg
                 .input(input_audio)
-                .output(output_audio, af=filter_str, acodec='pcm_s16le', ar=SAMPLE_RATE)
+                .output(output_audio, af=filter_str, acodec='pcm_s16le', ar=SAMPLE_RATE,
+                        threads=threads)
                 .overwrite_output()
-                .run(quiet=True)
             )
             return True
 
         except ffmpeg.Error as e:
-            print(f"Error applying noise reduction: {e}")
+            logger.error(f"Error applying noise reduction: {e}")
             return False
 
     @staticmethod
-    def merge_audio_video(original_video: str, cleaned_audio: str,
-                          output_video: str) -> bool:
-        """Объединение очищенного аудио с оригинальным видео"""
+    def clean_chunk(input_audio: str, output_audio: str, start_sample: int,
+                    num_samples: int, reduction_level: float = NOISE_REDUCTION_LEVEL,
+                    cleaning_filter: Optional[str] = None) -> bool:
+        """Очистка части WAV файла без нормализации громкости"""
         try:
-            # Сохраняем оригинальное видео без аудио
-            video_stream = ffmpeg.input(original_video).video
-
-            # Добавляем очищенное аудио
-            audio_stream = ffmpeg.input(cleaned_audio).audio
-
-            # Объединяем
-            (
+            # Точный по сэмплам срез: seek по PCM, затем обрезка и добивка до длины
+            filter_str = ",".join([
+                cleaning_filter or FFmpegClient.build_cleaning_filter(reduction_level,
+                                                                      normalize=False),
+                f"atrim=end_sample={num_samples}",
+                f"apad=whole_len={num_samples}",
+            ])
+
+            # Предел времени и процент - по длине части, а не всего файла
+            run_stream(
                 ffmpeg
-                .output(video_stream, audio_stream, output_video,
-                        vcodec='copy', acodec='aac', audio_bitrate='128k',
-                        shortest=None)  # Используем длительность видео
-                .overwrite_output()
-                .run(quiet=True)
+                .input(input_audio, ss=start_sample / SAMPLE_RATE)
+                .output(output_audio, af=filter_str, acodec='pcm_s16le', ar=SAMPLE_RATE,
+                        threads=1)
+                .overwrite_output(),
+                duration=num_samples / SAMPLE_RATE
             )
             return True
 
         except ffmpeg.Error as e:
-            print(f"Error merging audio with video: {e}")
+            logger.error(f"Error cleaning chunk at sample {start_sample}: {e}")
+            return False
+
+    @staticmethod
+    def stitch_chunks(chunk_paths: List[str], output_audio: str, overlap_samples: int,
+                      measure_loudness: bool = True) -> Optional[Dict]:
+        """Склейка частей с перекрестным затуханием и замером громкости целиком"""
+        try:
+            parts = []
+            current = "[0:a]"
+            for i in range(1, len(chunk_paths)):
+                parts.append(f"{current}[{i}:a]acrossfade=ns={overlap_samples}:c1=tri:c2=tri[x{i}]")
+                current = f"[x{i}]"
+
+            # Громкость замеряется по всей склеенной дорожке, а не по частям
+            if measure_loudness:
+                parts.append(f"{current}asplit=2[out][measure]")
+                parts.append(f"[measure]{FFmpegClient.build_loudnorm_filter(print_json=True)},"
+                             f"anullsink")
+            else:
+                parts.append(f"{current}anull[out]")
+
+            cmd = ['ffmpeg', '-hide_banner', '-nostats', '-y']
+            for path in chunk_paths:
+                cmd += ['-i', path]
+            cmd += [
+                '-filter_complex', ";".join(parts),
+                '-map', '[out]',
+                '-c:a', 'pcm_s16le',
+                '-ar', str(SAMPLE_RATE),
+                output_audio,
+            ]
+
+            result = run_ffmpeg(cmd, stderr_limit=None)
+
+            if result.returncode != 0:
+                tail = "\n".join(result.stderr.strip().split("\n")[-5:])
+                logger.error(f"Error stitching chunks: {tail}")
+                return None
+
+            return parse_loudnorm(result.stderr) if measure_loudness else {}
+
+        except Exception as e:
+            logger.error(f"Error stitching chunks: {e}")
+            return None
+
+    @staticmethod
+    def build_merge_command(original_video: str, cleaned_audio: str, output_video: str,
+                            threads: int = 0, audio_filter: Optional[str] = None) -> List[str]:
+        """Команда сборки очищенного аудио с оригинальным видео; "-" - вывод в stdout"""
+        # Фильтр на аудио при сборке (например, финальный loudnorm)
+        filter_args = ['-af', audio_filter, '-ar', str(SAMPLE_RATE)] if audio_filter else []
+        return [
+            'ffmpeg', '-hide_banner', '-nostats', '-y',
+            '-i', original_video,
+            '-i', cleaned_audio,
+            # Видео копируется без перекодирования, аудио - очищенное
+            '-map', '0:v', '-map', '1:a',
+            '-c:v', 'copy',
+            '-c:a', OUTPUT_AUDIO_CODEC,
+            '-b:a', OUTPUT_AUDIO_BITRATE,
+            '-threads', str(threads),
+            '-shortest',
+            *filter_args,
+            *FFmpegClient.output_args(output_video),
+        ]
+
+    @staticmethod
+    def merge_audio_video(original_video: str, cleaned_audio: str,
+                          output_video: str, threads: int = 0,
+                          audio_filter: Optional[str] = None) -> bool:
+        """Объединение очищенного аудио с оригинальным видео"""
+        try:
+            cmd = FFmpegClient.build_merge_command(original_video, cleaned_audio, output_video,
+                                                   threads, audio_filter)
+            # Вывод в stdout идет прямо через наш stdout
+            run_ffmpeg(cmd, stdout=None if output_video == '-' else subprocess.DEVNULL).check()
+            return True
+
+        except ffmpeg.Error as e:
+            logger.error(f"Error merging audio with video: {e}")
             return False
 
+    @staticmethod
+    def build_fused_command(input_video: str, output_video: str,
+                            reduction_level: float = NOISE_REDUCTION_LEVEL,
+                            loudness: Optional[Dict] = None,
+                            threads: int = 0,
+                            cleaning_filter: Optional[str] = None,
+                            progressive: Optional[str] = None) -> List[str]:
+        """Сборка команды однопроходной обработки видео"""
+        if cleaning_filter is None:
+            cleaning_filter = FFmpegClient.build_cleaning_filter(reduction_level, loudness)
+
+        # Аудио декодируется один раз и делится на ветку очистки
+        # и ветку анализа, видео копируется без перекодирования
+        graph = ";".join([
+            f"[0:a:0]aformat=channel_layouts=mono,aresample={SAMPLE_RATE},asplit=2[clean][probe]",
+            f"[clean]{cleaning_filter},"
+            f"aresample={SAMPLE_RATE}[aout]",
+            f"[probe]{FFmpegClient.build_analysis_filter()},anullsink",
+        ])
+
+        return [
+            'ffmpeg', '-hide_banner', '-nostats', '-y',
+            '-i', FFmpegClient.input_url(input_video),
+            '-filter_complex', graph,
+            '-map', '0:v?',
+            '-map', '[aout]',
+            '-c:v', 'copy',
+            '-c:a', OUTPUT_AUDIO_CODEC,
+            '-b:a', OUTPUT_AUDIO_BITRATE,
+            '-threads', str(threads),
+            '-shortest',
+            *(FFmpegClient.progressive_output_args(output_video, progressive) if progressive
+              else FFmpegClient.output_args(output_video)),
+        ]
+
+    @staticmethod
+    def progressive_output_args(path: str, progressive: str) -> List[str]:
+        """Аргументы выхода, который можно читать до конца обработки
+
+        fmp4 - фрагментированный MP4; hls и dash - сегменты fMP4 и манифест,
+        который ffmpeg переписывает после каждого готового сегмента.
+        """
+        segment = PROGRESSIVE_SEGMENT_SECONDS
+        if progressive == 'fmp4':
+            # empty_moov: заголовок без индекса, файл читается с первого фрагмента
+            args = ['-movflags', '+frag_keyframe+empty_moov+default_base_moof',
+                    '-frag_duration', str(int(segment * 1e6))]
+            return args + (['-f', 'mp4', 'pipe:1'] if path == '-' else [path])
+
+        directory = os.path.dirname(path)
+        name = os.path.splitext(os.path.basename(path))[0]
+        if progressive == 'hls':
+            # Плейлист типа event: сегменты только добавляются, ENDLIST в конце
+            return ['-f', 'hls',
+                    '-hls_time', str(segment),
+                    '-hls_playlist_type', 'event',
+                    '-hls_segment_type', 'fmp4',
+                    '-hls_fmp4_init_filename', f"{name}_init.mp4",
+                    '-hls_segment_filename', os.path.join(directory, f"{name}_%05d.m4s"),
+                    '-hls_flags', 'independent_segments+temp_file',
+                    path]
+        # Манифест DASH остается dynamic до конца записи, затем становится static
+        return ['-f', 'dash',
+                '-seg_duration', str(segment),
+                '-use_template', '1',
+                '-use_timeline', '1',
+                '-init_seg_name', f"{name}_init_$RepresentationID$.m4s",
+                '-media_seg_name', f"{name}_$RepresentationID$_$Number%05d$.m4s",
+                path]
+
+    @staticmethod
+    def process_fused(input_video: str, output_video: str,
+                      reduction_level: float = NOISE_REDUCTION_LEVEL,
+                      loudness: Optional[Dict] = None,
+                      threads: int = 0,
+                      cleaning_filter: Optional[str] = None,
+                      progressive: Optional[str] = None) -> Optional[AudioAnalysis]:
+        """Однопроходная очистка: декодирование, фильтрация, анализ и сборка видео"""
+        try:
+            cmd = FFmpegClient.build_fused_command(input_video, output_video,
+                                                   reduction_level, loudness, threads,
+                                                   cleaning_filter, progressive)
+
+            # Вход из stdin и вывод в stdout идут прямо через наши stdin и stdout
+            result = run_ffmpeg(cmd,
+                                stdin=None if input_video == '-' else subprocess.DEVNULL,
+                                stdout=None if output_video == '-' else subprocess.DEVNULL,
+                                stderr_limit=None)
+
+            if result.returncode != 0:
+                tail = "\n".join(result.stderr.strip().split("\n")[-5:])
+                logger.error(f"Error in fused processing: {tail}")
+                return None
+
+            return parse_analysis(result.stderr)
+
+        except Exception as e:
+            logger.error(f"Error in fused processing: {e}")
+            return None
+
+    @staticmethod
+    async def process_fused_async(input_video: str, output_video: str,
+                                  reduction_level: float = NOISE_REDUCTION_LEVEL,
+                                  loudness: Optional[Dict] = None,
+                                  threads: int = 0,
+                                  cleaning_filter: Optional[str] = None) -> Optional[AudioAnalysis]:
+        """Однопроходная очистка как asyncio подпроцесс (только вывод в файл)"""
+        cmd = FFmpegClient.build_fused_command(input_video, output_video,
+                                               reduction_level, loudness, threads,
+                                               cleaning_filter)
+        returncode, _, stderr = await FFmpegClient.run_async(cmd, stderr_limit=None)
+        if returncode != 0:
+            tail = "\n".join(stderr.strip().split("\n")[-5:])
+            logger.error(f"Error in fused processing: {tail}")
+            return None
+
+        return parse_analysis(stderr)
+
+    @staticmethod
+    def input_url(path: str) -> str:
+        """Путь входа для ffmpeg: "-" означает stdin"""
+        return 'pipe:0' if path == '-' else path
+
+    @staticmethod
+    def output_args(path: str) -> List[str]:
+        """Аргументы выхода для ffmpeg: "-" означает stdout"""
+        if path == '-':
+            return ['-f', PIPE_OUTPUT_FORMAT, 'pipe:1']
+        return [path]
+
+    @staticmethod
+    def process_streaming(input_video: str, output_video: str,
+                          reduction_level: float = NOISE_REDUCTION_LEVEL,
+                          loudness: Optional[Dict] = None,
+                          threads: int = 0,
+                          cleaning_filter: Optional[str] = None) -> bool:
+        """Этапы извлечения, очистки и сборки, соединенные каналами ОС"""
+        # Между процессами идет сырой PCM; буфер канала ОС ограничен,
+        # поэтому быстрый этап ждет медленный вместо записи на диск
+        pcm_args = ['-f', 's16le', '-ac', '1', '-ar', str(SAMPLE_RATE)]
+
+        extract_cmd = [
+            'ffmpeg', '-hide_banner', '-nostats', '-loglevel', 'error',
+            '-i', input_video,
+            '-map', '0:a:0', '-vn',
+            '-threads', str(threads),
+            *pcm_args, 'pipe:1',
+        ]
+        clean_cmd = [
+            'ffmpeg', '-hide_banner', '-nostats', '-loglevel', 'error',
+            *pcm_args, '-i', 'pipe:0',
+            '-af', cleaning_filter or FFmpegClient.build_cleaning_filter(reduction_level, loudness),
+            '-threads', str(threads),
+            *pcm_args, 'pipe:1',
+        ]
+        merge_cmd = [
+            'ffmpeg', '-hide_banner', '-nostats', '-loglevel', 'error', '-y',
+            '-i', input_video,
+            *pcm_args, '-i', 'pipe:0',
+            '-map', '0:v?', '-map', '1:a',
+            '-c:v', 'copy',
+            '-c:a', OUTPUT_AUDIO_CODEC,
+            '-b:a', OUTPUT_AUDIO_BITRATE,
+            '-threads', str(threads),
+            '-shortest',
+            *FFmpegClient.output_args(output_video),
+        ]
+
+        processes = []
+        duration = media_duration(extract_cmd)
+
+        try:
+            stdin = subprocess.DEVNULL
+            stages = [('extract', extract_cmd), ('clean', clean_cmd), ('merge', merge_cmd)]
+            for i, (name, cmd) in enumerate(stages):
+                last = i == len(stages) - 1
+                if last:
+                    stdout = None if output_video == '-' else subprocess.DEVNULL
+                else:
+                    stdout = subprocess.PIPE
+                # Длительность известна по входному видео; процент выводит последний этап
+                process = FFmpegProcess(cmd, stdin=stdin, stdout=stdout,
+                                        duration=duration if last else None)
+                # Родителю копия канала не нужна: EOF должен дойти до следующего этапа
+                if processes:
+                    processes[-1][1].process.stdout.close()
+                processes.append((name, process))
+                stdin = process.process.stdout
+
+            timeout = run_timeout(duration)
+            results = {name: process.wait(timeout)
+                       for name, process in reversed(processes)}
+
+            success = all(result.returncode == 0 for result in results.values())
+            if not success:
+                for name, _ in processes:
+                    if results[name].returncode != 0:
+                        logger.error(f"Error in streaming {name} stage: "
+                                     f"{results[name].stderr.strip()}")
+            return success
+
+        except Exception as e:
+            logger.error(f"Error in streaming processing: {e}")
+            for _, process in processes:
+                process.terminate()
+            return False
+
+    @staticmethod
+    def build_live_filter(reduction_level: float = NOISE_REDUCTION_LEVEL,
+                          latency_budget: float = LIVE_LATENCY_BUDGET) -> str:
+        """Цепочка очистки без упреждения: задержка ограничена длиной кадра"""
+        # Короткие кадры: каждый фильтр ждет не больше одного кадра
+        frame = max(1, int(min(LIVE_FRAME_SECONDS, latency_budget / 10) * SAMPLE_RATE))
+        return ",".join([
+            f"aformat=sample_rates={SAMPLE_RATE}:channel_layouts=mono",
+            f"asetnsamples=n={frame}:p=0",
+            f"highpass=f={SPEECH_BAND[0]}",
+            f"lowpass=f={SPEECH_BAND[1]}",
+            f"afftdn=nf={reduction_level}:nt=w",
+            # Двухпроходный loudnorm невозможен, а однопроходный копит 3 с:
+            # уровень выравнивает быстрый компрессор, пики срезает лимитер
+            f"acompressor=threshold=-30dB:ratio={COMPRESSION_RATIO}"
+            f":attack={LIVE_COMPRESSOR_ATTACK_MS}:release={LIVE_COMPRESSOR_RELEASE_MS}"
+            f":makeup={10 ** (LIVE_MAKEUP_DB / 20):.3f}",
+            f"alimiter=limit={10 ** (LIVE_LIMIT_DB / 20):.3f}:attack=1:release=20:level=0",
+        ])
+
+    @staticmethod
+    def live_output_args(path: str) -> List[str]:
+        """Аргументы живого выхода: stdout, сетевой протокол или файл"""
+        if path == '-':
+            return ['-f', LIVE_OUTPUT_FORMAT, 'pipe:1']
+        scheme = path.split('://', 1)[0].lower() if '://' in path else None
+        if scheme in LIVE_PROTOCOL_FORMATS:
+            return ['-f', LIVE_PROTOCOL_FORMATS[scheme], path]
+        return [path]
+
+    @staticmethod
+    def build_live_command(input_path: str, output_path: str,
+                           latency_budget: float = LIVE_LATENCY_BUDGET,
+                           threads: int = 0,
+                           live_filter: Optional[str] = None) -> List[str]:
+        """Команда живой очистки: буферы ввода и мультиплексора ограничены бюджетом"""
+        cmd = ['ffmpeg', '-hide_banner', '-nostats', '-loglevel', 'error', '-y']
+        # Обычный файл заменяет живой источник: читается в реальном времени
+        if input_path != '-' and os.path.isfile(input_path):
+            cmd.append('-re')
+        cmd += [
+            '-fflags', 'nobuffer', '-flags', 'low_delay',
+            '-probesize', '32768',
+            '-analyzeduration', str(int(latency_budget * 1e6)),
+            '-i', FFmpegClient.input_url(input_path),
+            '-map', '0:v?', '-map', '0:a:0',
+            '-c:v', 'copy',
+            '-af', live_filter or FFmpegClient.build_live_filter(latency_budget=latency_budget),
+            '-c:a', OUTPUT_AUDIO_CODEC,
+            '-b:a', OUTPUT_AUDIO_BITRATE,
+            '-threads', str(threads),
+            # Пакеты уходят сразу, мультиплексор ничего не копит
+            '-flush_packets', '1',
+            '-muxdelay', '0',
+            '-muxpreload', '0',
+            # Отчеты -progress добавляет запуск через runner
+            '-stats_period', str(LIVE_STATS_PERIOD),
+            *FFmpegClient.live_output_args(output_path),
+        ]
+        return cmd
+
+    @staticmethod
+    def process_live(input_path: str, output_path: str,
+                     latency_budget: float = LIVE_LATENCY_BUDGET,
+                     threads: int = 0,
+                     live_filter: Optional[str] = None) -> Optional[Dict]:
+        """Живая очистка до конца потока или прерывания
+
+        Задержка меряется по отчетам -progress как отставание выведенного
+        времени от реального с первого отчета: к нему вход уже открыт и
+        прочитан пробой, так что запуск в задержку не входит. Источник отдает
+        медиа в реальном времени, поэтому это отставание выхода от живого
+        входа, включая буферы ввода, фильтров, кодека и мультиплексора.
+        Возвращает замеры задержки или None при ошибке.
+        """
+        cmd = FFmpegClient.build_live_command(input_path, output_path,
+                                              latency_budget, threads, live_filter)
+        samples = []
+        media_seconds = 0.0
+        started = None
+
+        def on_progress(progress: Dict):
+            nonlocal media_seconds, started
+            if started is None:
+                started = progress['elapsed_seconds']
+            media_seconds = progress['out_seconds']
+            if media_seconds <= 0:
+                return
+            latency = progress['elapsed_seconds'] - started - media_seconds
+            samples.append(latency)
+            if latency > latency_budget and (len(samples) == 1 or
+                                             samples[-2] <= latency_budget):
+                logger.warning(f"   Warning: latency {latency * 1000:.0f} ms "
+                               f"exceeds budget {latency_budget * 1000:.0f} ms")
+            logger.debug(f"   Live: {media_seconds:.1f}s out, "
+                         f"latency {latency * 1000:.0f} ms")
+
+        # Поток не ограничен по длительности, а живой источник может замолкать:
+        # пределов времени нет. Ctrl+C передается ffmpeg, и он дописывает выход
+        try:
+            result = run_ffmpeg(cmd,
+                                stdin=None if input_path == '-' else subprocess.DEVNULL,
+                                stdout=None if output_path == '-' else subprocess.DEVNULL,
+                                timeout=None, stall_timeout=None,
+                                on_progress=on_progress, interruptible=True)
+        except OSError as e:
+            logger.error(f"Error starting live processing: {e}")
+            return None
+        interrupted = result.interrupted
+
+        # После SIGINT ffmpeg дописывает выход и завершается с кодом 255
+        if result.returncode != 0 and not (interrupted and result.returncode == 255):
+            logger.error(f"Error in live processing: {result.stderr.strip()}")
+            return None
+
+        return {
+            'media_seconds': round(media_seconds, 3),
+            'wall_seconds': result.usage['wall_seconds'],
+            'interrupted': interrupted,
+            'startup_seconds': round(started, 3) if started is not None else None,
+            'latency': latency_summary(samples, latency_budget),
+        }
+
     @staticmethod
     def normalize_audio_levels(audio_path: str, output_path: str) -> bool:
         """Нормализация уровней аудио для предотвращения клиппинга"""
         try:
-            (
+            run_stream(
                 ffmpeg
                 .input(audio_path)
                 .output(output_path,
-                        af="loudnorm=I=-16:LRA=11:TP=-1.5",
+                        af=FFmpegClient.build_loudnorm_filter(),
                         acodec='pcm_s16le',
                         ar=SAMPLE_RATE)
                 .overwrite_output()
-                .run(quiet=True)
             )
             return True
         except ffmpeg.Error as e:
-            print(f"Error normalizing audio: {e}")
+            logger.error(f"Error normalizing audio: {e}")
             return False
 
     @staticmethod
     def detect_speech_regions(audio_path: str) -> List[Tuple[float, float]]:
         """Обнаружение участков с речью"""
+        # WAV читается детектором на NumPy без запуска ffmpeg
+        if vad.numpy_available() and audio_path.lower().endswith('.wav'):
+            try:
+                return [(start, end) for start, end, _ in vad.detect_speech(audio_path)]
+            except Exception as e:
+                logger.warning(f"Warning: VAD failed, falling back to silencedetect: {e}")
+
+        return FFmpegClient.detect_speech_regions_silencedetect(audio_path)
+
+    @staticmethod
+    def detect_speech_regions_silencedetect(audio_path: str) -> List[Tuple[float, float]]:
+        """Обнаружение участков с речью фильтром silencedetect"""
         try:
-            # Используем простой детектор активности
+            # Используем простой детектор активности; astats дает число
+            # сэмплов, чтобы закрыть последний участок речи концом файла
             cmd = [
                 'ffmpeg',
                 '-i', audio_path,
-                '-af', 'silencedetect=noise=-30dB:d=0.5',
+                '-af', f'aformat=channel_layouts=mono,aresample={SAMPLE_RATE},astats,'
+                       f'silencedetect=noise={SILENCE_NOISE}:d={SILENCE_DURATION}',
                 '-f', 'null',
                 '-'
             ]
 
-            result = subprocess.run(
-                cmd,
-                capture_output=True,
-                text=True,
-                timeout=30
-            )
+            result = run_ffmpeg(cmd, stderr_limit=None)
+            if result.returncode != 0:
+                tail = "\n".join(result.stderr.strip().split("\n")[-5:])
+                logger.error(f"Error detecting speech regions: {tail}")
+                return []
 
-            # Парсим результаты silencedetect
-            regions = []
-            lines = result.stderr.split('\n')
-            silence_start = None
-
-            for line in lines:
-                if 'silence_start' in line:
-                    parts = line.split(' ')
-                    for i, part in enumerate(parts):
-                        if part == 'silence_start:':
-                            silence_start = float(parts[i + 1])
-                            break
-                elif 'silence_end' in line and silence_start is not None:
-                    parts = line.split(' ')
-                    for i, part in enumerate(parts):
-                        if part == 'silence_end:':
-                            silence_end = float(parts[i + 1].split('|')[0])
-                            # Речь - это интервалы между тишиной
-                            if silence_start > 0:  # Начало не с нуля
-                                regions.append((0, silence_start))
-                            # Добавляем region после тишины
-                            regions.append((silence_end, None))
-                            silence_start = None
-                            break
-
-            # Если последний region не закрыт
-            if silence_start is not None:
-                regions.append((silence_start, None))
-
-            return regions
+            # Речь - это интервалы между тишиной
+            return parse_analysis(result.stderr).speech_regions
 
         except Exception as e:
-            print(f"Error detecting speech regions: {e}")
+            logger.error(f"Error detecting speech regions: {e}")
             return []
 
+    @staticmethod
+    def create_spectrograms(input_path: str, images: Dict[str, str],
+                            windows: Optional[Tuple[List[float], float]] = None) -> bool:
+        """Спектрограммы нескольких размеров за одно декодирование
+
+        images - размер ("1024x512") -> путь к картинке. Если заданы окна
+        (начала, длина), спектрограмма строится по склеенным окнам выборки.
+        """
+        try:
+            if windows:
+                starts, window = windows
+                inputs = FFmpegClient.window_inputs(input_path, starts, window)
+                sources = "".join(f"[{i}:a:0]" for i in range(len(starts)))
+                graph = [f"{sources}concat=n={len(starts)}:v=0:a=1[a]"]
+            else:
+                inputs = ['-i', input_path]
+                graph = ["[0:a:0]anull[a]"]
+
+            sizes = list(images)
+            graph.append("[a]asplit=" + str(len(sizes)) +
+                         "".join(f"[s{i}]" for i in range(len(sizes))))
+            outputs = []
+            for i, size in enumerate(sizes):
+                graph.append(f"[s{i}]showspectrumpic=s={size}:mode=combined[p{i}]")
+                outputs += ['-map', f'[p{i}]', '-frames:v', '1', images[size]]
+
+            cmd = [
+                'ffmpeg', '-hide_banner', '-nostats', '-y',
+                *inputs,
+                '-filter_complex', ";".join(graph),
+                *outputs,
+            ]
+
+            result = run_ffmpeg(cmd)
+
+            if result.returncode != 0:
+                tail = "\n".join(result.stderr.strip().split("\n")[-5:])
+                logger.error(f"Error creating spectrogram: {tail}")
+                return False
+            return True
+
+        except Exception as e:
+            logger.error(f"Error creating spectrogram: {e}")
+            return False
+
     @staticmethod
     def create_spectrogram(audio_path: str, output_image: str) -> bool:
         """Создание спектрограммы для анализа"""
         try:
-            (
+            run_stream(
                 ffmpeg
                 .input(audio_path)
                 .output(output_image,
                         filter_complex="showspectrumpic=s=1024x512:mode=combined",
                         frames=1)
                 .overwrite_output()
-                .run(quiet=True)
             )
             return True
         except ffmpeg.Error as e:
-            print(f"Error creating spectrogram: {e}")
+            logger.error(f"Error creating spectrogram: {e}")
             return False
@@ -0,0 +1,125 @@
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime
+from typing import Dict, Iterable, Optional
+
+
+JOURNAL_NAME = "journal.json"
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def write_json_atomic(path: str, data: Dict):
+    """Запись JSON через временный файл и rename: файл либо старый, либо новый"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def partial_path(path: str) -> str:
+    """Временное имя выхода рядом с ним; расширение сохраняется для выбора формата"""
+    directory, filename = os.path.split(path)
+    name, ext = os.path.splitext(filename)
+    return os.path.join(directory, f".{name}.partial{ext}")
+
+
+class JobJournal:
+    """Журнал этапов задачи в ее рабочей директории
+
+    Для каждого завершенного этапа хранятся размер и SHA-256 его файлов и
+    данные этапа (анализ, замеры громкости). Этап считается готовым, только
+    если все его файлы на месте и не изменились.
+    """
+
+    def __init__(self, work_dir: str):
+        self.work_dir = work_dir
+        self.path = os.path.join(work_dir, JOURNAL_NAME)
+        self._lock = threading.Lock()
+        self._stages = self._load()
+
+    def _load(self) -> Dict:
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                return json.load(f).get('stages', {})
+        except (OSError, ValueError):
+            return {}
+
+    def completed(self, stage: str) -> Optional[Dict]:
+        """Данные готового этапа или None, если этап нужно выполнить заново"""
+        with self._lock:
+            entry = self._stages.get(stage)
+        if entry is None:
+            return None
+
+        for artifact in entry['artifacts']:
+            path = os.path.join(self.work_dir, artifact['name'])
+            try:
+                if os.path.getsize(path) != artifact['size'] or \
+                        file_sha256(path) != artifact['sha256']:
+                    return None
+            except OSError:
+                return None
+        return entry['data']
+
+    def record(self, stage: str, artifacts: Iterable[str] = (), data: Optional[Dict] = None):
+        """Отметка завершенного этапа; файлы этапа лежат в рабочей директории"""
+        entry = {
+            'artifacts': [{'name': os.path.basename(path),
+                           'size': os.path.getsize(path),
+                           'sha256': file_sha256(path)} for path in artifacts],
+            'data': data or {},
+            'completed_at': datetime.now().isoformat(),
+        }
+        with self._lock:
+            self._stages[stage] = entry
+            write_json_atomic(self.path, {'stages': self._stages})
+
+
+class BatchJournal:
+    """Журнал пакетной обработки: файлы, успешно обработанные в этом пакете"""
+
+    def __init__(self, path: str, resume: bool = False):
+        self.path = path
+        self._lock = threading.Lock()
+        self._files = {}
+        if resume:
+            try:
+                with open(path, encoding='utf-8') as f:
+                    self._files = json.load(f).get('files', {})
+            except (OSError, ValueError):
+                pass
+
+    def done(self, input_path: str, output_path: str) -> bool:
+        """Файл обработан в этот же выход и с тех пор не менялся"""
+        entry = self._files.get(os.path.abspath(input_path))
+        if not entry or entry['output'] != output_path or not os.path.exists(output_path):
+            return False
+        try:
+            stat = os.stat(input_path)
+        except OSError:
+            return False
+        return entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns
+
+    def record(self, input_path: str, output_path: str):
+        stat = os.stat(input_path)
+        with self._lock:
+            self._files[os.path.abspath(input_path)] = {
+                'size': stat.st_size,
+                'mtime_ns': stat.st_mtime_ns,
+                'output': output_path,
+            }
+            write_json_atomic(self.path, {'files': self._files})
@@ -0,0 +1,39 @@
+import json
+import logging
+import sys
+from datetime import datetime, timezone
+
+from .paths import *
+
+logger = logging.getLogger("voice_cleaner")
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись лога - одна строка JSON"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'thread': record.threadName,
+            'message': record.getMessage().strip(),
+        }
+        # Структурированные поля передаются через extra={'fields': {...}}
+        entry.update(getattr(record, 'fields', {}))
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def setup_logging(log_format: str = LOG_FORMAT, level: str = LOG_LEVEL):
+    """Настройка вывода: обычный текст или JSON lines в stdout"""
+    # stdout берется в момент вызова: при выводе видео в stdout он уже подменен на stderr
+    handler = logging.StreamHandler(sys.stdout)
+    if log_format == 'json':
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter('%(message)s'))
+
+    logger.handlers[:] = [handler]
+    logger.setLevel(level.upper())
+    logger.propagate = False
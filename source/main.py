@@ -6,22 +6,83 @@ Voice Cleaner - Утилита для очистки речи в видео
 import os
 import sys
 import argparse
+import hashlib
+import json
+import asyncio
+import contextvars
 import tempfile
 import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import List, Dict
+from pathlib import Path
+from typing import List, Dict, Optional, Tuple
 
 from .paths import *
+from .log import logger, setup_logging
 from .ffmpeg_client import FFmpegClient
+from .cache import ResultCache
+from .catalog import MediaCatalog
+from .denoise import denoise_wav, numpy_available
+from .vad import detect_speech, resolve_vad
+from .analysis import AudioAnalysis, invert_intervals, sample_windows
+from .journal import JobJournal, BatchJournal, partial_path
+from .chunking import wav_frames, plan_chunks, extend_chunks
+from .benchmark import (run_benchmark, compare_with_baseline, print_benchmark,
+                        save_benchmark, load_benchmark)
+from .report import save_report, load_latest_report
+from .metrics import timed_stage, first_output, PrometheusExporter
+from .daemon import WatchWorker
+from .workqueue import WorkQueue, queue_status
+from .presets import PRESETS, preset_filters, select_preset
+from .sweep import run_sweep, sweep_grid, parse_levels, parse_bands, print_sweep
 
 
 class VoiceCleaner:
     """Основной класс для очистки речи в видео"""
 
-    def __init__(self):
+    def __init__(self, mode: str = 'staged', jobs: int = 1,
+                 cache: ResultCache = None, chunk_seconds: float = CHUNK_SECONDS,
+                 speech_gated: bool = False, metrics: PrometheusExporter = None,
+                 catalog: MediaCatalog = None, denoiser: str = 'afftdn',
+                 vad: str = 'auto', resume: bool = False, work_root: str = WORK_DIR,
+                 progressive: Optional[str] = None, preset: Optional[str] = None,
+                 reports_dir: Optional[str] = REPORTS_DIR):
         self.ffmpeg_client = FFmpegClient()
+        # staged - этапы через WAV файлы, fused - один процесс ffmpeg,
+        # streaming - этапы соединены каналами без временных файлов,
+        # chunked - параллельная очистка частей длинного файла
+        # live - живая очистка потока с ограниченной задержкой (process_live)
+        self.mode = mode
+        self.chunk_seconds = chunk_seconds
+        # Тяжелые фильтры только на найденных участках речи
+        self.speech_gated = speech_gated
+        self.cache = cache
+        # Экспорт счетчиков для Prometheus (опционально)
+        self.metrics = metrics
+        # Каталог результатов ffprobe, анализа и статусов (опционально)
+        self.catalog = catalog
+        # afftdn - фильтр ffmpeg, spectral - спектральное шумоподавление на NumPy
+        # (только режимы с извлеченным WAV: staged и chunked)
+        self.denoiser = denoiser
+        # Источник участков речи: numpy - детектор по извлеченному WAV,
+        # silencedetect - паузы из прохода анализа ffmpeg, auto - numpy при наличии
+        self.vad = resolve_vad(vad)
+        # Продолжение прерванных задач с последнего завершенного этапа
+        self.resume = resume
+        self.work_root = work_root
+        # Прогрессивный вывод (fmp4, hls, dash): результат читается до конца задачи
+        self.progressive = progressive
+        # Пресет цепочки очистки: soft, normal, aggressive или auto - выбор по замерам
+        self.preset = preset
+        # Отчеты по файлам; None - без записи отчетов и без повторного
+        # использования замеров громкости из них
+        self.reports_dir = reports_dir
+        self.jobs = max(1, jobs)
+        # Делим ядра между параллельными задачами, 0 - выбор ffmpeg
+        self.threads = max(1, (os.cpu_count() or 1) // self.jobs) if self.jobs > 1 else 0
         self.temp_dir = tempfile.mkdtemp(prefix="voice_cleaner_")
-        print(f"Created temp directory: {self.temp_dir}")
+        logger.info(f"Created temp directory: {self.temp_dir}")
 
     def cleanup(self):
         """Очистка временных файлов"""
@@ -30,83 +91,764 @@ class VoiceCleaner:
 
     def process_video(self, input_path: str, output_path: str) -> bool:
         """Обработка одного видео файла"""
+        report = self._new_report(input_path, output_path)
+        # Отдельная рабочая директория на задачу, чтобы задачи не делили файлы;
+        # для файлов она постоянная и при сбое остается для --resume
+        work_dir, keep = self._job_work_dir(input_path, output_path)
+        journal = JobJournal(work_dir)
+        # Выход пишется под временным именем и появляется только готовым;
+        # прогрессивный выход, наоборот, читают по мере записи
+        target = output_path if output_path == '-' or self.progressive \
+            else partial_path(output_path)
+        success = False
         try:
-            print(f"\n{'=' * 60}")
-            print(f"Processing: {os.path.basename(input_path)}")
-            print(f"{'=' * 60}")
+            success = self._process_video(input_path, target, work_dir, report, journal)
+            if success and target != output_path:
+                os.replace(target, output_path)
+            if success and output_path != '-':
+                logger.info(f"   Output saved to: {output_path}")
+        except Exception as e:
+            logger.exception(f"Error processing video: {e}")
+            success = False
+        finally:
+            if target != output_path and os.path.exists(target):
+                os.remove(target)
+            if success or not keep:
+                shutil.rmtree(work_dir, ignore_errors=True)
+            else:
+                logger.info(f"   Work directory kept for --resume: {work_dir}")
 
-            # Проверка существования файла
-            if not os.path.exists(input_path):
-                print(f"Error: Input file not found: {input_path}")
-                return False
+        self._finish_report(report, input_path, output_path, success)
+        return success
 
-            # Шаг 1: Получение информации о видео
-            print("1. Analyzing video...")
-            video_info = self.ffmpeg_client.probe_video(input_path)
-            if not video_info:
-                print("Error: Could not probe video")
-                return False
+    def job_work_dir(self, input_path: str, output_path: str) -> str:
+        """Рабочая директория задачи для файла; для stdin - общая временная директория
 
-            # Шаг 2: Извлечение аудио
-            print("2. Extracting audio...")
-            temp_audio = os.path.join(self.temp_dir, "original_audio.wav")
-            if not self.ffmpeg_client.extract_audio(input_path, temp_audio):
-                return False
+        Для файла директория определяется входом и параметрами обработки, так
+        что повторный запуск той же задачи находит файлы прошлого запуска.
+        """
+        if input_path == '-' or not os.path.exists(input_path):
+            return self.temp_dir
+        settings = dict(self._cache_settings(output_path), output=os.path.abspath(output_path))
+        return os.path.join(self.work_root, ResultCache.make_key(input_path, settings)[:32])
+
+    def _job_work_dir(self, input_path: str, output_path: str) -> Tuple[str, bool]:
+        """Рабочая директория задачи и признак, что ее стоит сохранить при сбое"""
+        if input_path == '-' or not os.path.exists(input_path):
+            return tempfile.mkdtemp(prefix="job_", dir=self.temp_dir), False
+
+        work_dir = self.job_work_dir(input_path, output_path)
+        if not self.resume:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        os.makedirs(work_dir, exist_ok=True)
+        return work_dir, True
+
+    async def process_video_async(self, input_path: str, output_path: str) -> bool:
+        """Обработка файла в цикле событий: ffmpeg запускается как asyncio подпроцесс
+
+        Асинхронно выполняется только однопроходный режим, остальные режимы
+        идут обычным путем в отдельном потоке.
+        """
+        if self.mode != 'fused' or input_path == '-' or output_path == '-':
+            return await asyncio.to_thread(self.process_video, input_path, output_path)
+
+        report = self._new_report(input_path, output_path)
+        target = partial_path(output_path)
+        success = False
+        try:
+            success = await self._process_video_async(input_path, target, report)
+            if success:
+                os.replace(target, output_path)
+                logger.info(f"   Output saved to: {output_path}")
+        except Exception as e:
+            logger.exception(f"Error processing video: {e}")
+            success = False
+        finally:
+            if os.path.exists(target):
+                os.remove(target)
+
+        self._finish_report(report, input_path, output_path, success)
+        return success
+
+    async def _process_video_async(self, input_path: str, output_path: str,
+                                   report: Dict) -> bool:
+        """Шаги однопроходной обработки без блокирующих вызовов ffmpeg"""
+        logger.info(f"Processing: {report['input']}")
+
+        if not os.path.exists(input_path):
+            logger.error(f"Error: Input file not found: {input_path}")
+            return False
+
+        with timed_stage(report, 'probe', inputs=[input_path]) as stage:
+            video_info = await self._probe_async(input_path)
+            if video_info:
+                stage['input_duration'] = float(video_info['format'].get('duration', 0.0))
+        if not video_info:
+            logger.error("Error: Could not probe video")
+            return False
+        report['input_duration'] = stage['input_duration']
+
+        if self.cache:
+            report['cache_key'] = self.cache.make_key(input_path, self._cache_settings(output_path))
+            if self.cache.fetch(report['cache_key'], output_path):
+                logger.info("   Cache hit, skipping processing")
+                report['cache'] = 'hit'
+                return await self._verify_output_async(output_path, report)
+            report['cache'] = 'miss'
 
-            # Шаг 3: Анализ спектра
-            print("3. Analyzing audio spectrum...")
-            audio_analysis = self.ffmpeg_client.analyze_audio_spectrum(temp_audio)
-            print(f"   Audio analysis: {audio_analysis}")
+        loudness = self._reusable_loudness(input_path, report)
+        analysis = None
+        if not loudness or self.speech_gated:
+            if self.preset == 'auto' and not loudness:
+                await asyncio.to_thread(self._select_preset, input_path, report)
+            with timed_stage(report, 'analyze', inputs=[input_path]):
+                analysis = await self.ffmpeg_client.analyze_audio_async(
+                    input_path, measure_loudness=not loudness and not self.speech_gated,
+                    threads=self.threads,
+                    preset=report['preset'])
+            if analysis:
+                if loudness:
+                    analysis.loudness = loudness
+                loudness = analysis.loudness
+                self._report_analysis(analysis, report)
+            else:
+                logger.warning("   Warning: audio analysis failed")
 
-            # Шаг 4: Обнаружение участков речи
-            print("4. Detecting speech regions...")
-            speech_regions = self.ffmpeg_client.detect_speech_regions(temp_audio)
-            print(f"   Found {len(speech_regions)} speech regions")
+        cleaning_filter = self._cleaning_filter(loudness, analysis, preset=report['preset'])
+        with timed_stage(report, 'fused', inputs=[input_path], outputs=[output_path]):
+            analysis = await self.ffmpeg_client.process_fused_async(input_path, output_path,
+                                                                    threads=self.threads,
+                                                                    cleaning_filter=cleaning_filter)
+        if not analysis:
+            return False
+
+        analysis.loudness = loudness
+        self._report_analysis(analysis, report)
+        return await self._verify_output_async(output_path, report)
+
+    def process_live(self, input_path: str, output_path: str,
+                     latency_budget: float = LIVE_LATENCY_BUDGET) -> bool:
+        """Живая очистка потока до его конца или прерывания, с замером задержки"""
+        logger.info(f"Live cleaning: {input_path} -> {output_path} "
+                    f"(latency budget {latency_budget * 1000:.0f} ms)")
+        report = self._new_report(input_path, output_path)
+        report['latency_budget'] = latency_budget
+
+        with timed_stage(report, 'live'):
+            live = self.ffmpeg_client.process_live(input_path, output_path,
+                                                   latency_budget, self.threads)
+        success = live is not None
+        if live:
+            report['live'] = live
+            report['input_duration'] = live['media_seconds']
+            latency = live['latency']
+            if live['startup_seconds'] is not None:
+                logger.info(f"   Startup: {live['startup_seconds'] * 1000:.0f} ms "
+                            f"(not counted in latency)")
+            if latency['samples']:
+                logger.info(f"   Latency: mean {latency['mean_ms']:.0f} ms, "
+                            f"p95 {latency['p95_ms']:.0f} ms, max {latency['max_ms']:.0f} ms "
+                            f"(budget {latency['budget_ms']:.0f} ms, "
+                            f"{latency['over_budget']} of {latency['samples']} over)")
+                if not latency['within_budget']:
+                    logger.error(f"Error: latency budget exceeded: p95 "
+                                 f"{latency['p95_ms']:.0f} ms > {latency['budget_ms']:.0f} ms")
+                    success = False
+            else:
+                logger.warning("   Warning: no output progress, latency not measured")
+
+        report['success'] = success
+        report['finished_at'] = datetime.now().isoformat()
+        self._save_report(report)
+        if self.metrics:
+            self.metrics.observe(report)
+        return success
+
+    def _new_report(self, input_path: str, output_path: str) -> Dict:
+        """Начальный отчет по файлу"""
+        return {
+            'input': 'stdin' if input_path == '-' else os.path.basename(input_path),
+            'input_path': None if input_path == '-' else os.path.abspath(input_path),
+            'output': output_path,
+            'mode': self.mode,
+            'speech_gated': self.speech_gated,
+            'denoiser': self.denoiser,
+            # Для auto - пресет по умолчанию, пока выбор по замерам не сделан
+            'preset': PRESET_DEFAULT if self.preset == 'auto' else self.preset,
+            'started_at': datetime.now().isoformat(),
+        }
+
+    def _finish_report(self, report: Dict, input_path: str, output_path: str, success: bool):
+        """Сохранение результата в кэш и каталог, запись отчета и метрик"""
+        if success and report.get('cache') == 'miss':
+            self.cache.store(report['cache_key'], output_path)
+
+        if self.catalog and input_path != '-':
+            fields = {'status': 'done' if success else 'failed', 'output': output_path,
+                      'settings': self._settings_key(output_path)}
+            if report.get('analysis'):
+                fields['analysis'] = report['analysis']
+            try:
+                self.catalog.update(input_path, **fields)
+            except OSError as e:
+                logger.warning(f"Warning: could not update catalog: {e}")
+
+        report['success'] = success
+        report['finished_at'] = datetime.now().isoformat()
+        self._save_report(report)
+        if self.metrics:
+            self.metrics.observe(report)
+
+    def _process_video(self, input_path: str, output_path: str, work_dir: str,
+                       report: Dict, journal: JobJournal) -> bool:
+        """Шаги обработки одного файла"""
+        logger.info(f"\n{'=' * 60}")
+        logger.info(f"Processing: {report['input']}")
+        logger.info(f"{'=' * 60}")
+
+        # Поток со stdin читается один раз: только однопроходный режим
+        if input_path == '-':
+            logger.info("1. Cleaning audio from stdin (single pass)...")
+            return self._process_video_fused(input_path, output_path, report)
+
+        # Проверка существования файла
+        if not os.path.exists(input_path):
+            logger.error(f"Error: Input file not found: {input_path}")
+            return False
+
+        # Шаг 1: Получение информации о видео
+        logger.info("1. Analyzing video...")
+        with timed_stage(report, 'probe', inputs=[input_path]) as stage:
+            video_info = self._probe(input_path)
+            if video_info:
+                stage['input_duration'] = float(video_info['format'].get('duration', 0.0))
+        if not video_info:
+            logger.error("Error: Could not probe video")
+            return False
+        report['input_duration'] = stage['input_duration']
+
+        if self.cache and output_path != '-':
+            report['cache_key'] = self.cache.make_key(input_path, self._cache_settings(output_path))
+            if self.cache.fetch(report['cache_key'], output_path):
+                logger.info("   Cache hit, skipping processing")
+                report['cache'] = 'hit'
+                return self._verify_output(output_path, report)
+            report['cache'] = 'miss'
+
+        if self.mode == 'fused':
+            return self._process_video_fused(input_path, output_path, report)
+        if self.mode == 'streaming':
+            return self._process_video_streaming(input_path, output_path, report)
+        if self.mode == 'chunked':
+            return self._process_video_chunked(input_path, output_path, work_dir, report, journal)
+
+        # Шаги 2-5: очищенная дорожка могла остаться с прерванного запуска
+        cleaned_audio = os.path.join(work_dir, "cleaned_audio.wav")
+        if self._resumed(journal, 'clean', report) is not None:
+            self._restore_analysis(journal.completed('analyze'), report)
+        else:
+            prepared = self._prepare_audio(input_path, work_dir, report, journal)
+            if not prepared:
+                return False
+            source_audio, analysis, loudness = prepared
 
-            # Шаг 5: Создание спектрограммы (опционально)
+            # Шаг 4: Создание спектрограммы (опционально)
             if False:  # Можно включить для отладки
-                spectrogram = os.path.join(self.temp_dir, "spectrogram.png")
-                self.ffmpeg_client.create_spectrogram(temp_audio, spectrogram)
-                print(f"   Spectrogram saved to: {spectrogram}")
-
-            # Шаг 6: Очистка аудио
-            print("5. Cleaning audio (noise reduction)...")
-            cleaned_audio = os.path.join(self.temp_dir, "cleaned_audio.wav")
-            if not self.ffmpeg_client.apply_noise_reduction(temp_audio, cleaned_audio):
+                spectrogram = os.path.join(work_dir, "spectrogram.png")
+                self.ffmpeg_client.create_spectrogram(source_audio, spectrogram)
+                logger.info(f"   Spectrogram saved to: {spectrogram}")
+
+            # Шаг 5: Очистка и нормализация аудио (второй, линейный проход loudnorm)
+            logger.info("4. Cleaning audio (noise reduction, normalization)...")
+            cleaning_filter = self._cleaning_filter(loudness, analysis, preset=report['preset'])
+            with timed_stage(report, 'clean', inputs=[source_audio], outputs=[cleaned_audio]):
+                cleaned = self.ffmpeg_client.apply_noise_reduction(source_audio, cleaned_audio,
+                                                                   threads=self.threads,
+                                                                   cleaning_filter=cleaning_filter)
+            if not cleaned:
                 return False
+            journal.record('clean', [cleaned_audio])
+
+        # Шаг 6: Объединение с видео
+        logger.info("5. Merging cleaned audio with video...")
+        with timed_stage(report, 'merge', inputs=[input_path, cleaned_audio],
+                         outputs=[output_path]):
+            merged = self.ffmpeg_client.merge_audio_video(input_path, cleaned_audio, output_path,
+                                                          self.threads)
+        if not merged:
+            return False
+
+        # Шаг 7: Проверка результата
+        logger.info("6. Verifying output...")
+        return self._verify_output(output_path, report)
+
+    def _process_video_fused(self, input_path: str, output_path: str, report: Dict) -> bool:
+        """Однопроходная обработка: один запуск ffmpeg без промежуточных WAV"""
+        # Второй проход по stdin невозможен - динамический loudnorm
+        loudness = {} if input_path == '-' else self._reusable_loudness(input_path, report)
+        analysis = None
+        # Прогрессивный выход не ждет прохода анализа: без сохраненных замеров
+        # громкости loudnorm работает динамически, с упреждением в 3 с
+        if input_path != '-' and not self.progressive and (not loudness or self.speech_gated):
+            # Замер громкости и участки речи нужны до очистки: отдельный проход анализа
+            logger.info("2. Analyzing audio (stats, loudness, speech regions)...")
+            with timed_stage(report, 'analyze', inputs=[input_path]):
+                analysis = self._analyze(input_path, loudness, report)
+            if analysis:
+                loudness = analysis.loudness
+
+        logger.info("3. Cleaning audio and merging with video (single pass)...")
+        cleaning_filter = self._cleaning_filter(loudness, analysis, preset=report['preset'])
+        if self.progressive and output_path != '-':
+            # Сегменты HLS/DASH пишутся рядом с манифестом
+            os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+            # Старый выход не должен засчитываться как первые данные
+            if os.path.exists(output_path):
+                os.remove(output_path)
+        with timed_stage(report, 'fused', inputs=[input_path], outputs=[output_path]), \
+                first_output(output_path, self.progressive) as first:
+            analysis = self.ffmpeg_client.process_fused(input_path, output_path,
+                                                        threads=self.threads,
+                                                        cleaning_filter=cleaning_filter,
+                                                        progressive=self.progressive)
+        if self.progressive and first['seconds'] is not None:
+            # От начала задачи: предыдущие этапы плюс ожидание в этом
+            elapsed = sum(stage['wall_seconds'] for stage in report['stages'][:-1])
+            report['ttfb_seconds'] = round(elapsed + first['seconds'], 3)
+            logger.info(f"   Time to first byte: {report['ttfb_seconds']:.2f}s")
+        if not analysis:
+            return False
+
+        # Статистика ветки анализа в том же процессе
+        analysis.loudness = loudness
+        self._report_analysis(analysis, report)
+
+        logger.info("4. Verifying output...")
+        return self._verify_output(output_path, report)
+
+    def _process_video_streaming(self, input_path: str, output_path: str,
+                                 report: Dict) -> bool:
+        """Потоковая обработка: этапы соединены каналами, без временных WAV"""
+        logger.info("2. Analyzing audio (stats, loudness, speech regions)...")
+        loudness = self._reusable_loudness(input_path, report)
+        with timed_stage(report, 'analyze', inputs=[input_path]):
+            analysis = self._analyze(input_path, loudness, report)
+        if analysis:
+            loudness = analysis.loudness
+
+        logger.info("3. Extracting, cleaning and merging audio through pipes...")
+        cleaning_filter = self._cleaning_filter(loudness, analysis, preset=report['preset'])
+        with timed_stage(report, 'streaming', inputs=[input_path], outputs=[output_path]):
+            streamed = self.ffmpeg_client.process_streaming(input_path, output_path,
+                                                            threads=self.threads,
+                                                            cleaning_filter=cleaning_filter)
+        if not streamed:
+            return False
 
-            # Шаг 7: Нормализация аудио
-            print("6. Normalizing audio levels...")
-            normalized_audio = os.path.join(self.temp_dir, "normalized_audio.wav")
-            if not self.ffmpeg_client.normalize_audio_levels(cleaned_audio, normalized_audio):
-                # Если не удалось нормализовать, используем очищенное аудио
-                normalized_audio = cleaned_audio
+        logger.info("4. Verifying output...")
+        return self._verify_output(output_path, report)
 
-            # Шаг 8: Объединение с видео
-            print("7. Merging cleaned audio with video...")
-            if not self.ffmpeg_client.merge_audio_video(input_path, normalized_audio, output_path):
+    def _process_video_chunked(self, input_path: str, output_path: str, work_dir: str,
+                               report: Dict, journal: JobJournal) -> bool:
+        """Очистка длинного файла частями, разрезанными по паузам, параллельно"""
+        stitched_audio = os.path.join(work_dir, "cleaned_audio.wav")
+        resumed = self._resumed(journal, 'stitch', report)
+        if resumed is not None:
+            self._restore_analysis(journal.completed('analyze'), report)
+            loudness = resumed['loudness']
+            report['loudness'] = loudness
+        else:
+            # Громкость здесь не замеряется: она считается по склеенной дорожке
+            prepared = self._prepare_audio(input_path, work_dir, report, journal,
+                                           measure_loudness=False)
+            if not prepared:
                 return False
+            source_audio, analysis, loudness = prepared
+            silences = analysis.silence_regions if analysis else []
 
-            # Шаг 9: Проверка результата
-            print("8. Verifying output...")
-            output_info = self.ffmpeg_client.probe_video(output_path)
-            if output_info:
-                duration = float(output_info['format']['duration'])
-                print(f"   Success! Output duration: {duration:.2f} seconds")
-                print(f"   Output saved to: {output_path}")
+            total_samples = wav_frames(source_audio)
+            overlap = 2 * (int(CHUNK_OVERLAP_SECONDS * SAMPLE_RATE) // 2)
+            chunks = plan_chunks(total_samples, silences, self.chunk_seconds)
+            ranges = extend_chunks(chunks, overlap)
+            report['chunks'] = len(chunks)
+
+            resumed_chunks = []
+
+            def clean(index: int, path: str, start: int, end: int) -> bool:
+                """Очистка части; части, готовые с прошлого запуска, пропускаются"""
+                stage = f"chunk_{index:04d}"
+                if journal.completed(stage) is not None:
+                    resumed_chunks.append(index)
+                    return True
+                if not self.ffmpeg_client.clean_chunk(
+                        source_audio, path, start, end - start,
+                        cleaning_filter=self._cleaning_filter(
+                            {}, analysis, normalize=False,
+                            window=(start / SAMPLE_RATE, end / SAMPLE_RATE),
+                            preset=report['preset'])):
+                    return False
+                journal.record(stage, [path])
                 return True
-            else:
-                print("Error: Could not verify output video")
+
+            workers = max(1, (os.cpu_count() or 1) // self.jobs)
+            logger.info(f"4. Cleaning {len(chunks)} chunk(s) with {workers} worker(s)...")
+            chunk_paths = [os.path.join(work_dir, f"chunk_{i:04d}.wav") for i in range(len(ranges))]
+            with timed_stage(report, 'clean', inputs=[source_audio], outputs=chunk_paths), \
+                    ThreadPoolExecutor(max_workers=workers) as executor:
+                # Контекст этапа передается в потоки: ресурсы ffmpeg частей идут в этап clean
+                futures = [executor.submit(contextvars.copy_context().run, clean, i, path, start, end)
+                           for i, (path, (start, end)) in enumerate(zip(chunk_paths, ranges))]
+                cleaned = all(future.result() for future in futures)
+            if resumed_chunks:
+                logger.info(f"   {len(resumed_chunks)} chunk(s) resumed from journal")
+                report['resumed_chunks'] = len(resumed_chunks)
+            if not cleaned:
                 return False
 
-        except Exception as e:
-            print(f"Error processing video: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.info("5. Stitching chunks...")
+            with timed_stage(report, 'stitch', inputs=chunk_paths, outputs=[stitched_audio]):
+                measured = self.ffmpeg_client.stitch_chunks(chunk_paths, stitched_audio, overlap,
+                                                            measure_loudness=not loudness)
+            if measured is None:
+                return False
+
+            if not loudness:
+                loudness = measured
+                report['loudness'] = loudness
+                if not loudness:
+                    logger.warning("   Warning: loudness measurement failed, using single-pass loudnorm")
+            journal.record('stitch', [stitched_audio], {'loudness': loudness})
+            for path in chunk_paths:
+                os.remove(path)
+
+        logger.info("6. Normalizing and merging cleaned audio with video...")
+        with timed_stage(report, 'merge', inputs=[input_path, stitched_audio],
+                         outputs=[output_path]):
+            merged = self.ffmpeg_client.merge_audio_video(
+                input_path, stitched_audio, output_path, self.threads,
+                audio_filter=self.ffmpeg_client.build_loudnorm_filter(loudness))
+        if not merged:
             return False
 
+        logger.info("7. Verifying output...")
+        return self._verify_output(output_path, report)
+
+    def _prepare_audio(self, input_path: str, work_dir: str, report: Dict,
+                       journal: JobJournal, measure_loudness: bool = True):
+        """Извлечение, анализ и (опционально) спектральное шумоподавление аудио
+
+        Возвращает WAV для очистки, результат анализа и замеры громкости
+        или None при ошибке. Этапы, готовые с прошлого запуска, пропускаются.
+        """
+        # Шаг 2: Извлечение аудио
+        logger.info("2. Extracting audio...")
+        temp_audio = os.path.join(work_dir, "original_audio.wav")
+        if self._resumed(journal, 'extract', report) is None:
+            with timed_stage(report, 'extract', inputs=[input_path], outputs=[temp_audio]):
+                extracted = self.ffmpeg_client.extract_audio(input_path, temp_audio, self.threads)
+            if not extracted:
+                return None
+            journal.record('extract', [temp_audio])
+
+        # Шаг 3: Анализ аудио: статистика, громкость и участки речи за одно декодирование
+        logger.info("3. Analyzing audio (stats, loudness, speech regions)...")
+        loudness = self._reusable_loudness(input_path, report)
+        resumed = self._resumed(journal, 'analyze', report)
+        if resumed is not None:
+            analysis = self._restore_analysis(resumed, report)
+            loudness = resumed['loudness']
+        else:
+            with timed_stage(report, 'analyze', inputs=[temp_audio]):
+                # Для спектрального шумоподавления громкость замеряется после него
+                analysis = self._analyze(temp_audio, loudness, report,
+                                         measure_loudness=measure_loudness
+                                         and self.denoiser == 'afftdn')
+            if analysis:
+                loudness = analysis.loudness
+                self._detect_speech(temp_audio, analysis, report)
+            journal.record('analyze', data={
+                'analysis': analysis.to_dict() if analysis else None,
+                'loudness': loudness,
+                'preset': report['preset'],
+            })
+
+        if self.denoiser == 'spectral':
+            denoised = os.path.join(work_dir, "denoised_audio.wav")
+            resumed = self._resumed(journal, 'denoise', report)
+            if resumed is not None:
+                loudness = resumed['loudness']
+                report['loudness'] = loudness
+            else:
+                logger.info("   Spectral denoising with a noise profile from pauses...")
+                if not self._spectral_denoise(temp_audio, denoised, analysis, report):
+                    return None
+                if measure_loudness and not loudness and not self.speech_gated:
+                    loudness = self._measure_loudness(denoised, report)
+                journal.record('denoise', [denoised], {'loudness': loudness})
+            temp_audio = denoised
+
+        return temp_audio, analysis, loudness
+
+    def _resumed(self, journal: JobJournal, stage: str, report: Dict) -> Optional[Dict]:
+        """Данные этапа, завершенного в прошлом запуске этой задачи"""
+        data = journal.completed(stage)
+        if data is not None:
+            logger.info(f"   Stage {stage}: resumed from journal")
+            report.setdefault('resumed_stages', []).append(stage)
+        return data
+
+    def _restore_analysis(self, data: Optional[Dict], report: Dict):
+        """Результат анализа из журнала, с записью в отчет"""
+        if data and data.get('preset'):
+            report['preset'] = data['preset']
+        if not data or not data.get('analysis'):
+            if data:
+                report['loudness'] = data['loudness']
+            return None
+        analysis = AudioAnalysis.from_dict(data['analysis'])
+        self._report_analysis(analysis, report)
+        return analysis
+
+    def _detect_speech(self, audio_path: str, analysis, report: Dict):
+        """Замена участков речи из silencedetect результатом детектора на NumPy"""
+        if self.vad != 'numpy':
+            return
+
+        with timed_stage(report, 'vad', inputs=[audio_path]):
+            try:
+                regions = detect_speech(audio_path)
+            except Exception as e:
+                logger.warning(f"   Warning: VAD failed, keeping silencedetect regions: {e}")
+                return
+
+        if not regions and analysis.speech_regions:
+            logger.warning("   Warning: VAD found no speech in non-silent audio, "
+                           "keeping silencedetect regions")
+            return
+
+        analysis.speech_regions = [(start, end) for start, end, _ in regions]
+        analysis.silence_regions = invert_intervals(analysis.speech_regions, analysis.duration)
+        report['analysis'] = analysis.summary()
+        if regions:
+            report['speech_confidence'] = round(
+                sum(confidence for _, _, confidence in regions) / len(regions), 3)
+        logger.info(f"   VAD: {len(regions)} speech regions")
+
+    def _spectral_denoise(self, audio_path: str, denoised: str, analysis,
+                          report: Dict) -> bool:
+        """Спектральное шумоподавление WAV; профиль шума берется из найденных пауз"""
+        silences = analysis.silence_regions if analysis else []
+        workers = max(1, (os.cpu_count() or 1) // self.jobs)
+        with timed_stage(report, 'denoise', inputs=[audio_path], outputs=[denoised]):
+            return denoise_wav(audio_path, denoised, silences, workers)
+
+    def _measure_loudness(self, audio_path: str, report: Dict) -> Dict:
+        """Замер loudnorm после спектрального шумоподавления"""
+        with timed_stage(report, 'loudness', inputs=[audio_path]):
+            analysis = self.ffmpeg_client.analyze_audio(audio_path, threads=self.threads,
+                                                        denoiser=self.denoiser,
+                                                        preset=report['preset'])
+        loudness = analysis.loudness if analysis else {}
+        if not loudness:
+            logger.warning("   Warning: loudness measurement failed, using single-pass loudnorm")
+        report['loudness'] = loudness
+        return loudness
+
+    def _cleaning_filter(self, loudness: Dict, analysis=None, normalize: bool = True,
+                         window: Optional[Tuple[float, float]] = None,
+                         preset: Optional[str] = None) -> str:
+        """Цепочка очистки с учетом режима обработки только участков речи"""
+        speech_regions = None
+        duration = 0.0
+        if self.speech_gated and analysis:
+            speech_regions = analysis.speech_regions
+            duration = analysis.duration
+            if window:
+                # Участки речи в координатах части файла
+                start, end = window
+                speech_regions = [(max(s, start) - start, min(e, end) - start)
+                                  for s, e in speech_regions if e > start and s < end]
+                duration = end - start
+            # Замер громкости сделан на цепочке без гейта, а паузы с гейтом тише
+            # на SPEECH_GATE_ATTENUATION_DB: линейный loudnorm по нему ошибется
+            # на величину ослабления, поэтому для гейта loudnorm динамический
+            loudness = None
+
+        return self.ffmpeg_client.build_cleaning_filter(loudness=loudness,
+                                                        normalize=normalize,
+                                                        speech_regions=speech_regions,
+                                                        duration=duration,
+                                                        denoiser=self.denoiser,
+                                                        preset=preset,
+                                                        noise_floor=analysis.noise_floor
+                                                        if analysis else None)
+
+    def _cache_settings(self, output_path: str) -> Dict:
+        """Параметры, от которых зависит результат обработки"""
+        settings = {
+            'mode': self.mode,
+            'speech_gated': self.speech_gated,
+            'denoiser': self.denoiser,
+            'vad': self.vad,
+            'filter': self.ffmpeg_client.build_cleaning_filter(normalize=False,
+                                                               denoiser=self.denoiser),
+            'loudnorm': self.ffmpeg_client.build_loudnorm_filter(),
+            'audio_codec': OUTPUT_AUDIO_CODEC,
+            'audio_bitrate': OUTPUT_AUDIO_BITRATE,
+            'container': os.path.splitext(output_path)[1].lower(),
+        }
+        if self.progressive:
+            settings['progressive'] = self.progressive
+        if self.preset:
+            settings['preset'] = self.preset
+            settings['preset_chains'] = self._preset_chains()
+        return settings
+
+    def _preset_chains(self) -> Dict:
+        """Цепочки пресетов, которые может взять задача: правка параметров меняет ключ"""
+        names = sorted(PRESETS) if self.preset == 'auto' else [self.preset]
+        # Порог гейта зависит от файла: в ключ идут цепочка с порогом по умолчанию и запас
+        return {'margin_db': PRESET_GATE_MARGIN_DB,
+                **{name: preset_filters(name) for name in names}}
+
+    def _settings_key(self, output_path: str) -> str:
+        """Отпечаток параметров обработки для статуса в каталоге"""
+        encoded = json.dumps(self._cache_settings(output_path), sort_keys=True).encode('utf-8')
+        return hashlib.sha256(encoded).hexdigest()
+
+    def _reusable_loudness(self, input_path: str, report: Dict) -> Dict:
+        """Замеры loudnorm из прошлого отчета, если вход и цепочка не менялись"""
+        stat = os.stat(input_path)
+        loudness_key = {
+            'filter': self.ffmpeg_client.build_cleaning_filter(normalize=False,
+                                                               denoiser=self.denoiser),
+            'preset': self.preset,
+            'preset_chains': self._preset_chains() if self.preset else None,
+            'size': stat.st_size,
+            'mtime': stat.st_mtime,
+        }
+        report['loudness_key'] = loudness_key
+        if self.reports_dir is None:
+            return {}
+
+        previous = load_latest_report(report['input'], Path(self.reports_dir))
+        if previous and previous.get('loudness') and previous.get('loudness_key') == loudness_key:
+            logger.info("   Reusing loudness measurements from previous report")
+            report['loudness'] = previous['loudness']
+            # Замеры сделаны через цепочку выбранного тогда пресета
+            if self.preset == 'auto' and previous.get('preset'):
+                report['preset'] = previous['preset']
+            return previous['loudness']
+
+        return {}
+
+    def _analyze(self, analysis_path: str, loudness: Dict, report: Dict,
+                 measure_loudness: bool = True):
+        """Проход анализа; громкость замеряется, только если ее нет в прошлом отчете"""
+        # Замер без гейта не подходит для цепочки с гейтом (см. _cleaning_filter)
+        measure_loudness = measure_loudness and not loudness and not self.speech_gated
+        # Громкость меряется через цепочку пресета, поэтому пресет выбирается до прохода
+        if self.preset == 'auto' and not loudness:
+            self._select_preset(analysis_path, report)
+        analysis = self.ffmpeg_client.analyze_audio(analysis_path,
+                                                    measure_loudness=measure_loudness,
+                                                    threads=self.threads,
+                                                    preset=report['preset'])
+        if not analysis:
+            logger.warning("   Warning: audio analysis failed")
+            report['loudness'] = loudness
+            return None
+
+        if loudness:
+            analysis.loudness = loudness
+        elif measure_loudness and not analysis.loudness:
+            logger.warning("   Warning: loudness measurement failed, using single-pass loudnorm")
+
+        self._report_analysis(analysis, report)
+        return analysis
+
+    def _select_preset(self, analysis_path: str, report: Dict):
+        """Автовыбор пресета по быстрому анализу выборки окон файла"""
+        summary = None
+        duration = report.get('input_duration')
+        # Поток со stdin нельзя прочитать дважды: без замеров - пресет по умолчанию
+        if duration and analysis_path != '-':
+            with timed_stage(report, 'preset', inputs=[analysis_path]):
+                summary = self.ffmpeg_client.analyze_sampled(analysis_path, duration,
+                                                             threads=self.threads)
+
+        def mean(name: str) -> Optional[float]:
+            return summary[name]['mean'] if summary and summary.get(name) else None
+
+        selection = select_preset(mean('rms_level'), mean('noise_floor'),
+                                  mean('loudness_range'), self.denoiser)
+        report['preset'] = selection['preset']
+        report['preset_selection'] = selection
+        if 'input_snr' in selection:
+            logger.info(f"   Preset auto: {selection['preset']} (input SNR "
+                        f"{selection['input_snr']} dB, expected {selection['expected']['snr']} dB, "
+                        f"target {selection['target_snr']} dB, cost {selection['cost']})")
+        else:
+            logger.info(f"   Preset auto: {selection['preset']} ({selection['reason']})")
+
+    def _report_analysis(self, analysis, report: Dict):
+        """Вывод результата анализа и запись в отчет"""
+        logger.info(f"   Duration: {analysis.duration:.2f}s, RMS: {analysis.rms_level} dB, "
+                    f"peak: {analysis.peak_level} dB, noise floor: {analysis.noise_floor} dB")
+        logger.info(f"   Loudness: {analysis.integrated_loudness} LUFS, "
+                    f"LRA: {analysis.loudness_range} LU")
+        logger.info(f"   Found {len(analysis.speech_regions)} speech regions")
+        report['analysis'] = analysis.summary()
+        report['loudness'] = analysis.loudness
+
+    def _verify_output(self, output_path: str, report: Dict) -> bool:
+        """Проверка выходного файла"""
+        if output_path == '-':
+            logger.info("   Success! Output written to stdout")
+            return True
+
+        if self.progressive == 'dash':
+            # Демультиплексор DASH есть не во всех сборках ffprobe: проверяется манифест
+            if os.path.getsize(output_path) > 0:
+                logger.info("   Success! Manifest written")
+                return True
+            logger.error("Error: Could not verify output manifest")
+            return False
+
+        with timed_stage(report, 'verify', outputs=[output_path]):
+            output_info = self.ffmpeg_client.probe_video(output_path)
+        if output_info:
+            duration = float(output_info['format']['duration'])
+            report['output_duration'] = duration
+            logger.info(f"   Success! Output duration: {duration:.2f} seconds")
+            return True
+        else:
+            logger.error("Error: Could not verify output video")
+            return False
+
+    async def _verify_output_async(self, output_path: str, report: Dict) -> bool:
+        """Проверка выходного файла через asyncio подпроцесс ffprobe"""
+        with timed_stage(report, 'verify', outputs=[output_path]):
+            output_info = await self.ffmpeg_client.probe_video_async(output_path)
+        if not output_info:
+            logger.error("Error: Could not verify output video")
+            return False
+
+        report['output_duration'] = float(output_info['format']['duration'])
+        logger.info(f"   Success! Output duration: {report['output_duration']:.2f} seconds")
+        return True
+
+    def _save_report(self, report: Dict):
+        """Сохранение отчета по файлу"""
+        if self.reports_dir is None:
+            return
+        try:
+            save_report(report, Path(self.reports_dir))
+        except OSError as e:
+            logger.warning(f"Warning: could not save report: {e}")
+
     def process_directory(self, input_dir: str, output_dir: str,
-                          extensions: List[str] = None) -> int:
+                          extensions: List[str] = None) -> List[Dict]:
         """Обработка всех видео в директории"""
         if extensions is None:
             extensions = VIDEO_EXTENSIONS
@@ -114,91 +856,274 @@ class VoiceCleaner:
         # Создание выходной директории
         os.makedirs(output_dir, exist_ok=True)
 
-        # Поиск видео файлов
-        video_files = []
-        for root, _, files in os.walk(input_dir):
-            for file in files:
-                if any(file.lower().endswith(ext) for ext in extensions):
-                    video_files.append(os.path.join(root, file))
+        # Поиск видео файлов: с каталогом перечитываются только измененные директории
+        if self.catalog:
+            video_files = self.catalog.scan(input_dir, extensions)
+        else:
+            video_files = []
+            for root, _, files in os.walk(input_dir):
+                for file in files:
+                    if any(file.lower().endswith(ext) for ext in extensions):
+                        video_files.append(os.path.join(root, file))
+
+        # Создание имени выходного файла
+        def output_for(video_file: str) -> str:
+            name, ext = os.path.splitext(os.path.basename(video_file))
+            return os.path.join(output_dir, f"{name}_cleaned{ext}")
+
+        if self.catalog:
+            # Файлы, не менявшиеся с прошлой успешной обработки, пропускаются
+            pending = [video_file for video_file in video_files
+                       if not self._already_processed(video_file, output_for(video_file))]
+            skipped = len(video_files) - len(pending)
+            if skipped:
+                logger.info(f"Skipping {skipped} unchanged file(s) processed earlier")
+            video_files = pending
+
+        # Журнал пакета: с --resume файлы, готовые в прерванном запуске, пропускаются
+        batch_key = hashlib.sha256(
+            f"{os.path.abspath(input_dir)}\0{os.path.abspath(output_dir)}".encode()).hexdigest()
+        batch = BatchJournal(os.path.join(self.work_root, f"batch_{batch_key[:16]}.json"),
+                             resume=self.resume)
+        pending = [video_file for video_file in video_files
+                   if not batch.done(video_file, output_for(video_file))]
+        if len(pending) < len(video_files):
+            logger.info(f"Resuming batch: {len(video_files) - len(pending)} file(s) already done")
+        video_files = pending
+
+        logger.info(f"Found {len(video_files)} video file(s) to process")
+
+        # Самые длинные файлы идут первыми, чтобы сократить общее время пакета;
+        # длительность оценивается по размеру, без ffprobe до начала работы
+        video_files.sort(key=lambda video_file: os.path.getsize(video_file)
+                         if os.path.exists(video_file) else 0, reverse=True)
 
-        print(f"Found {len(video_files)} video file(s) to process")
+        jobs = [(video_file, output_for(video_file)) for video_file in video_files]
 
-        # Обработка каждого файла
-        success_count = 0
-        for i, video_file in enumerate(video_files, 1):
-            print(f"\nProcessing file {i}/{len(video_files)}")
+        if self.jobs > 1:
+            logger.info(f"Running {self.jobs} jobs in parallel, {self.threads} ffmpeg thread(s) each")
 
-            # Создание имени выходного файла
-            filename = os.path.basename(video_file)
-            name, ext = os.path.splitext(filename)
-            output_filename = f"{name}_cleaned{ext}"
-            output_path = os.path.join(output_dir, output_filename)
+        def run_job(index: int, video_file: str, output_path: str) -> Dict:
+            logger.info(f"\nProcessing file {index}/{len(jobs)}")
+            started = time.monotonic()
+            success = self.process_video(video_file, output_path)
+            if success:
+                batch.record(video_file, output_path)
+            return {
+                'input': video_file,
+                'output': output_path,
+                'success': success,
+                'duration': self._probe_duration(video_file),
+                'elapsed': round(time.monotonic() - started, 3),
+            }
+
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            futures = [executor.submit(run_job, i, video_file, output_path)
+                       for i, (video_file, output_path) in enumerate(jobs, 1)]
+            return [future.result() for future in futures]
+
+    def _already_processed(self, input_path: str, output_path: str) -> bool:
+        """Вход не менялся после успешной обработки в тот же выход с теми же параметрами"""
+        record = self.catalog.lookup(input_path)
+        return bool(record and record['status'] == 'done'
+                    and record['output'] == output_path
+                    and record.get('settings') == self._settings_key(output_path)
+                    and os.path.exists(output_path))
 
-            # Обработка видео
-            if self.process_video(video_file, output_path):
-                success_count += 1
+    def _probe(self, input_path: str) -> Dict:
+        """ffprobe входного файла через каталог, если он включен"""
+        if self.catalog:
+            return self.catalog.probe(input_path, self.ffmpeg_client.probe_video)
+        return self.ffmpeg_client.probe_video(input_path)
 
-        return success_count
+    async def _probe_async(self, input_path: str) -> Dict:
+        """Асинхронный ffprobe входного файла через каталог, если он включен"""
+        record = self.catalog.lookup(input_path) if self.catalog else None
+        if record and record['probe']:
+            return record['probe']
+
+        probe = await self.ffmpeg_client.probe_video_async(input_path)
+        if probe and self.catalog:
+            self.catalog.update(input_path, probe=probe)
+        return probe
+
+    def _probe_duration(self, input_path: str) -> float:
+        """Длительность файла по данным ffprobe (0 если неизвестна)"""
+        probe = self._probe(input_path)
+        try:
+            return float(probe['format']['duration'])
+        except (KeyError, TypeError, ValueError):
+            return 0.0
 
-    def run_from_fixtures(self, output_dir: str) -> int:
+    def run_from_fixtures(self, output_dir: str) -> List[Dict]:
         """Запуск обработки тестовых файлов из fixtures"""
-        print("Running from fixtures...")
+        logger.info("Running from fixtures...")
 
         if not os.path.exists(FIXTURES_DIR):
-            print(f"Fixtures directory not found: {FIXTURES_DIR}")
-            return 0
+            logger.info(f"Fixtures directory not found: {FIXTURES_DIR}")
+            return []
 
         return self.process_directory(FIXTURES_DIR, output_dir)
 
-    def auto_analyze(self, input_path: str) -> Dict:
-        """Автоматический анализ видео файла"""
-        print(f"\nAuto-analyzing: {input_path}")
+    def auto_analyze(self, input_path: str, quick: bool = False,
+                     spectrogram_sizes: Optional[List[str]] = None) -> Dict:
+        """Автоматический анализ видео файла
 
-        if not os.path.exists(input_path):
-            print(f"Error: File not found: {input_path}")
-            return {}
+        quick - оценка по равномерной выборке окон без полного декодирования.
+        Спектрограммы строятся только по запросу, всех размеров за один запуск.
+        """
+        logger.info(f"\nAuto-analyzing: {input_path}")
 
-        # Извлекаем аудио для анализа
-        temp_audio = os.path.join(self.temp_dir, "analysis_audio.wav")
-        if not self.ffmpeg_client.extract_audio(input_path, temp_audio):
+        if not os.path.exists(input_path):
+            logger.error(f"Error: File not found: {input_path}")
             return {}
 
         # Получаем информацию о видео
-        video_info = self.ffmpeg_client.probe_video(input_path)
-
-        # Анализируем аудио
-        audio_analysis = self.ffmpeg_client.analyze_audio_spectrum(temp_audio)
+        video_info = self._probe(input_path)
+        try:
+            duration = float(video_info['format']['duration'])
+        except (KeyError, TypeError, ValueError):
+            duration = 0.0
 
-        # Обнаруживаем участки речи
-        speech_regions = self.ffmpeg_client.detect_speech_regions(temp_audio)
+        # Выборка имеет смысл, только если окна покрывают малую часть файла
+        if quick and duration > 2 * QUICK_WINDOWS * QUICK_WINDOW_SECONDS:
+            return self._quick_analyze(input_path, video_info, duration, spectrogram_sizes)
 
-        # Создаем спектрограмму
-        spectrogram = os.path.join(self.temp_dir, "analysis_spectrogram.png")
-        self.ffmpeg_client.create_spectrogram(temp_audio, spectrogram)
+        # Анализируем аудио прямо из видео: статистика, громкость и речь за одно декодирование
+        analysis = self.ffmpeg_client.analyze_audio(input_path, measure_loudness=False)
+        if not analysis:
+            return {}
 
         # Формируем отчет
         analysis_report = {
             'filename': os.path.basename(input_path),
             'video_info': video_info,
-            'audio_analysis': audio_analysis,
-            'speech_regions_count': len(speech_regions),
-            'speech_regions': speech_regions[:5],  # Первые 5 регионов
-            'spectrogram': spectrogram if os.path.exists(spectrogram) else None,
+            'audio_analysis': analysis.summary(),
+            'speech_regions_count': len(analysis.speech_regions),
+            'speech_regions': analysis.speech_regions[:5],  # Первые 5 регионов
+            'spectrograms': self._spectrograms(input_path, spectrogram_sizes),
             'analysis_time': datetime.now().isoformat()
         }
 
         # Вывод отчета
-        print("\n" + "=" * 60)
-        print("ANALYSIS REPORT")
-        print("=" * 60)
-        print(f"File: {analysis_report['filename']}")
-        print(f"Duration: {analysis_report['audio_analysis'].get('duration', 0):.2f}s")
-        print(f"Speech regions detected: {analysis_report['speech_regions_count']}")
-        print(f"Sample rate: {analysis_report['audio_analysis'].get('sample_rate', 0)} Hz")
-        print("=" * 60)
+        logger.info("\n" + "=" * 60)
+        logger.info("ANALYSIS REPORT")
+        logger.info("=" * 60)
+        logger.info(f"File: {analysis_report['filename']}")
+        logger.info(f"Duration: {analysis_report['audio_analysis'].get('duration', 0):.2f}s")
+        logger.info(f"Speech regions detected: {analysis_report['speech_regions_count']}")
+        logger.info(f"Sample rate: {analysis_report['audio_analysis'].get('sample_rate', 0)} Hz")
+        logger.info(f"RMS level: {analysis.rms_level} dB, peak: {analysis.peak_level} dB")
+        logger.info(f"Noise floor: {analysis.noise_floor} dB, crest factor: {analysis.crest_factor}")
+        logger.info(f"Integrated loudness: {analysis.integrated_loudness} LUFS, "
+                    f"LRA: {analysis.loudness_range} LU")
+        for size, path in analysis_report['spectrograms'].items():
+            logger.info(f"Spectrogram {size}: {path}")
+        logger.info("=" * 60)
 
         return analysis_report
 
+    def _quick_analyze(self, input_path: str, video_info: Dict, duration: float,
+                       spectrogram_sizes: Optional[List[str]]) -> Dict:
+        """Анализ по выборке окон: средние значения с 95% доверительным интервалом"""
+        summary = self.ffmpeg_client.analyze_sampled(input_path, duration,
+                                                     threads=self.threads)
+        if not summary:
+            return {}
+
+        windows = (sample_windows(duration, QUICK_WINDOWS, QUICK_WINDOW_SECONDS),
+                   QUICK_WINDOW_SECONDS)
+        analysis_report = {
+            'filename': os.path.basename(input_path),
+            'video_info': video_info,
+            'sampled_analysis': {key: value for key, value in summary.items()
+                                 if key != 'speech_regions'},
+            'speech_regions': summary['speech_regions'][:5],  # Первые 5 регионов в окнах
+            'spectrograms': self._spectrograms(input_path, spectrogram_sizes, windows),
+            'analysis_time': datetime.now().isoformat()
+        }
+
+        def describe(name: str, unit: str) -> str:
+            value = summary[name]
+            if not value:
+                return "n/a"
+            margin = f" ± {value['ci95']}" if value['ci95'] is not None else ""
+            return f"{value['mean']}{margin} {unit}"
+
+        logger.info("\n" + "=" * 60)
+        logger.info("QUICK ANALYSIS REPORT (sampled)")
+        logger.info("=" * 60)
+        logger.info(f"File: {analysis_report['filename']}")
+        logger.info(f"Duration: {duration:.2f}s, sampled {summary['windows']} x "
+                    f"{summary['window_seconds']}s ({summary['coverage']:.1%})")
+        logger.info(f"Speech: {describe('speech_seconds', 's')}")
+        logger.info(f"RMS level: {describe('rms_level', 'dB')}, "
+                    f"peak >= {summary['peak_level_lower_bound']} dB")
+        logger.info(f"Noise floor: {describe('noise_floor', 'dB')}")
+        logger.info(f"Integrated loudness: {describe('integrated_loudness', 'LUFS')}, "
+                    f"LRA: {describe('loudness_range', 'LU')}")
+        for size, path in analysis_report['spectrograms'].items():
+            logger.info(f"Spectrogram {size}: {path}")
+        logger.info("=" * 60)
+
+        return analysis_report
+
+    def _spectrograms(self, input_path: str, sizes: Optional[List[str]],
+                      windows: Optional[Tuple[List[float], float]] = None) -> Dict[str, str]:
+        """Спектрограммы запрошенных размеров в REPORTS_DIR (пусто, если не запрошены)"""
+        if not sizes:
+            return {}
+
+        os.makedirs(REPORTS_DIR, exist_ok=True)
+        name = os.path.splitext(os.path.basename(input_path))[0]
+        images = {size: os.path.join(REPORTS_DIR, f"{name}_spectrogram_{size}.png")
+                  for size in sizes}
+        if not self.ffmpeg_client.create_spectrograms(input_path, images, windows):
+            return {}
+        return images
+
+
+def count_successful(results: List[Dict]) -> int:
+    """Количество успешно обработанных файлов"""
+    return sum(1 for result in results if result['success'])
+
+
+def print_batch_results(results: List[Dict]):
+    """Вывод результата по каждому файлу пакета"""
+    if not results:
+        return
+
+    logger.info(f"\n{'=' * 60}")
+    logger.info("BATCH RESULTS")
+    logger.info(f"{'=' * 60}")
+    for result in results:
+        mark = "✓" if result['success'] else "✗"
+        logger.info(f"{mark} {result['input']} ({result['duration']:.1f}s media, "
+                    f"{result['elapsed']:.1f}s elapsed)")
+
+
+def print_queue_status(status: Dict):
+    """Вывод состояния общей очереди по узлам"""
+    logger.info(f"\n{'=' * 60}")
+    logger.info("QUEUE STATUS")
+    logger.info(f"{'=' * 60}")
+    logger.info(f"Done: {status['done']}, failed: {status['failed']}, "
+                f"in progress: {status['leased']}")
+
+    for host, node in sorted(status['nodes'].items()):
+        logger.info(f"{host}: {node['done']} done, {node['failed']} failed, "
+                    f"{node['files_per_hour']} files/h, {node['mb_per_second']} MB/s "
+                    f"({node['workers']} worker run(s), {node['busy_seconds']:.0f}s busy)")
+
+    for worker in status['workers']:
+        state = "alive" if worker['alive'] else "no heartbeat"
+        logger.info(f"  worker {worker['worker']} ({worker['jobs']} job(s)): {state}, "
+                    f"last heartbeat {worker['heartbeat_age']:.0f}s ago")
+    for lease in status['leases']:
+        mark = " (expired)" if lease['expired'] else ""
+        logger.info(f"  {lease['input']} -> {lease['worker']}, "
+                    f"heartbeat {lease['heartbeat_age']:.0f}s ago{mark}")
+
 
 def main():
     """Основная функция CLI"""
@@ -208,86 +1133,339 @@ def main():
         epilog="""
 Examples:
   %(prog)s --input input.mp4 --output output.mp4
+  %(prog)s --input input.mp4 --output output.mp4 --fused
+  %(prog)s --input input.mp4 --output output.mp4 --streaming
+  %(prog)s --input lecture.mp4 --output lecture_clean.mp4 --chunked
+  %(prog)s --input input.mp4 --output output.mp4 --denoiser spectral
+  %(prog)s --process-dir ./videos --output-dir ./cleaned --preset auto
+  cat input.mkv | %(prog)s --input - --output - > output.mkv
+  %(prog)s --input lecture.mp4 --output hls/lecture.m3u8 --progressive hls
+  %(prog)s --live --input udp://0.0.0.0:5000 --output udp://127.0.0.1:5001 --latency-budget 0.3
+  %(prog)s --live --input rehearsal.mp4 --output - | ffplay -
   %(prog)s --auto-analyze input.mp4
+  %(prog)s --auto-analyze --input long.mp4 --quick --spectrogram 512x256,2048x1024
   %(prog)s --process-dir ./videos --output-dir ./cleaned
+  %(prog)s --process-dir ./videos --output-dir ./cleaned --jobs 8
+  %(prog)s --process-dir ./videos --output-dir ./cleaned --chunked --resume
+  %(prog)s --process-dir /mnt/share/videos --output-dir /mnt/share/cleaned --queue-dir /mnt/share/queue
+  %(prog)s --queue-dir /mnt/share/queue --queue-status
+  %(prog)s --watch ./incoming --output-dir ./cleaned --jobs 4
+  %(prog)s --serve
   %(prog)s --fixtures
+  %(prog)s --benchmark --benchmark-baseline reports/benchmark_baseline.json
+  %(prog)s --sweep ./fixtures --sweep-levels=-20,-30 --sweep-bands 300-3400,150-6000
+  %(prog)s --process-dir ./videos --log-format json --metrics-file /var/lib/node_exporter/voice_cleaner.prom
         """
     )
 
     # Основные аргументы
     parser.add_argument('--input', '-i', type=str,
-                        help='Input video file')
+                        help='Input video file ("-" for stdin)')
     parser.add_argument('--output', '-o', type=str,
-                        help='Output video file')
+                        help='Output video file ("-" for stdout, Matroska)')
 
     # Дополнительные аргументы
     parser.add_argument('--auto-analyze', '-a', action='store_true',
                         help='Auto-analyze video without processing')
+    parser.add_argument('--quick', action='store_true',
+                        help=f'With --auto-analyze: estimate from {QUICK_WINDOWS} sampled '
+                             f'{QUICK_WINDOW_SECONDS}s windows instead of decoding the whole file')
+    parser.add_argument('--spectrogram', type=str, nargs='?', const=SPECTROGRAM_SIZE,
+                        help=f'With --auto-analyze: render spectrograms, comma-separated sizes '
+                             f'(default: {SPECTROGRAM_SIZE})')
     parser.add_argument('--process-dir', '-d', type=str,
                         help='Process all videos in directory')
     parser.add_argument('--output-dir', type=str, default=OUTPUT_DIR,
                         help=f'Output directory (default: {OUTPUT_DIR})')
+    parser.add_argument('--watch', type=str,
+                        help='Watch a directory and process new files as they arrive')
+    parser.add_argument('--serve', action='store_true',
+                        help=f'Same as --watch {INPUT_DIR}')
+    parser.add_argument('--queue-dir', type=str,
+                        help='Shared queue directory: workers on several hosts split '
+                             '--process-dir between them using lease files')
+    parser.add_argument('--queue-status', action='store_true',
+                        help='Show results, per-node throughput and active leases of --queue-dir')
     parser.add_argument('--fixtures', '-f', action='store_true',
                         help='Process fixture files')
     parser.add_argument('--verbose', '-v', action='store_true',
                         help='Verbose output')
+    mode_group = parser.add_mutually_exclusive_group()
+    mode_group.add_argument('--fused', action='store_true',
+                            help='Single-pass processing: one ffmpeg run, no intermediate WAV files')
+    mode_group.add_argument('--streaming', action='store_true',
+                            help='Connect processing stages with pipes instead of temp WAV files')
+    mode_group.add_argument('--chunked', action='store_true',
+                            help='Split long files at pauses and clean the chunks in parallel')
+    mode_group.add_argument('--live', action='store_true',
+                            help='Clean a live stream (stdin, named pipe or network URL) '
+                                 'continuously with bounded latency; a regular file is read '
+                                 'in real time')
+    parser.add_argument('--progressive', choices=['fmp4', 'hls', 'dash'],
+                        help='Write output that is playable while the job runs: fragmented '
+                             'MP4, or HLS/DASH segments with an incrementally updated manifest '
+                             '(single-pass processing)')
+    parser.add_argument('--latency-budget', type=float, default=LIVE_LATENCY_BUDGET,
+                        help=f'Latency budget in seconds for --live '
+                             f'(default: {LIVE_LATENCY_BUDGET})')
+    parser.add_argument('--preset', choices=[*PRESETS, 'auto'],
+                        help='Cleaning preset; auto picks the cheapest preset that reaches '
+                             f'the target SNR ({PRESET_TARGET_SNR_DB:g} dB) for each file '
+                             '(default: built-in chain)')
+    parser.add_argument('--speech-gated', action='store_true',
+                        help='Run denoising and compression only on detected speech, '
+                             'attenuate pauses')
+    parser.add_argument('--denoiser', choices=['afftdn', 'spectral'], default='afftdn',
+                        help='Noise reduction backend: ffmpeg afftdn or NumPy spectral gating '
+                             'with a noise profile from pauses (staged and chunked modes)')
+    parser.add_argument('--vad', choices=['auto', 'numpy', 'silencedetect'], default='auto',
+                        help='Speech detection: NumPy VAD on the extracted WAV (staged and '
+                             'chunked modes) or ffmpeg silencedetect; auto uses NumPy when '
+                             'installed (default: auto)')
+    parser.add_argument('--chunk-length', type=float, default=CHUNK_SECONDS,
+                        help=f'Target chunk length in seconds for --chunked (default: {CHUNK_SECONDS})')
+    parser.add_argument('--jobs', '-j', type=int, default=1,
+                        help='Number of files processed in parallel (default: 1)')
+    parser.add_argument('--resume', action='store_true',
+                        help='Continue interrupted jobs from the last completed stage '
+                             'and skip files already finished in the batch')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Do not reuse or store cached results')
+    parser.add_argument('--benchmark', action='store_true',
+                        help='Run the benchmark on generated synthetic media')
+    parser.add_argument('--benchmark-durations', type=str,
+                        help='Comma-separated fixture durations in seconds (default: 10,60)')
+    parser.add_argument('--benchmark-output', type=str,
+                        help='Benchmark results JSON (default: REPORTS_DIR/benchmark_<time>.json)')
+    parser.add_argument('--benchmark-baseline', type=str,
+                        help='Previous benchmark JSON to compare against')
+    parser.add_argument('--sweep', type=str, nargs='?', const=FIXTURES_DIR,
+                        help='Sweep cleaning parameters over the videos in a directory '
+                             f'(default: {FIXTURES_DIR}); uses all CPUs unless --jobs is set')
+    parser.add_argument('--sweep-levels', type=str,
+                        help='Comma-separated afftdn noise floors in dB, -80 to -20; pass as '
+                             '--sweep-levels=-20,-30 (default: -20,-25,-35)')
+    parser.add_argument('--sweep-ratios', type=str,
+                        help='Comma-separated compression ratios (default: 1.5,2.5,4)')
+    parser.add_argument('--sweep-bands', type=str,
+                        help='Comma-separated speech bands low-high in Hz '
+                             '(default: 300-3400,200-4000,80-8000)')
+    parser.add_argument('--sweep-output', type=str,
+                        help='Sweep results JSON (default: REPORTS_DIR/sweep_<time>.json)')
+    parser.add_argument('--cache-dir', type=str, default=CACHE_DIR,
+                        help=f'Result cache directory (default: {CACHE_DIR})')
+    parser.add_argument('--no-catalog', action='store_true',
+                        help='Do not use the media catalog (always walk, probe and reprocess)')
+    parser.add_argument('--catalog', type=str, default=CATALOG_PATH,
+                        help=f'Media catalog database (default: {CATALOG_PATH})')
+    parser.add_argument('--log-format', choices=['text', 'json'], default=LOG_FORMAT,
+                        help=f'Log output format, json - one JSON object per line '
+                             f'(default: {LOG_FORMAT})')
+    parser.add_argument('--metrics-file', type=str,
+                        help='Write Prometheus textfile metrics to this path after each file')
 
     args = parser.parse_args()
 
+    if args.vad == 'numpy' and not numpy_available():
+        parser.error('--vad numpy requires numpy')
+
+    if args.denoiser == 'spectral':
+        if not numpy_available():
+            parser.error('--denoiser spectral requires numpy')
+        if args.fused or args.streaming or args.live or args.watch or args.serve or \
+                (args.input == '-'):
+            parser.error('--denoiser spectral needs an extracted WAV: use staged or chunked mode')
+
+    if args.sweep and not os.path.isdir(args.sweep):
+        parser.error(f'--sweep: no such directory: {args.sweep}')
+    if args.sweep_levels:
+        try:
+            args.sweep_levels = parse_levels(args.sweep_levels)
+        except ValueError as e:
+            parser.error(f'--sweep-levels: {e}')
+
+    if args.queue_status and not args.queue_dir:
+        parser.error('--queue-status requires --queue-dir')
+
+    if args.live:
+        if not (args.input and args.output):
+            parser.error('--live requires --input and --output')
+        if args.speech_gated:
+            parser.error('--speech-gated needs a speech analysis pass, not available with --live')
+        if args.latency_budget <= 0:
+            parser.error('--latency-budget must be positive')
+
+    if args.progressive:
+        if not (args.input and args.output):
+            parser.error('--progressive requires --input and --output')
+        if args.streaming or args.chunked or args.live:
+            parser.error('--progressive needs single-pass processing (--fused)')
+        if args.speech_gated:
+            parser.error('--speech-gated needs a full analysis pass before output starts')
+        extensions = {'hls': '.m3u8', 'dash': '.mpd'}
+        if args.progressive in extensions and \
+                not args.output.lower().endswith(extensions[args.progressive]):
+            parser.error(f'--progressive {args.progressive} writes a manifest: '
+                         f'--output must end with {extensions[args.progressive]}')
+
+    # При выводе в stdout сообщения утилиты уходят в stderr
+    if args.output == '-':
+        sys.stdout = sys.stderr
+
+    setup_logging(args.log_format, 'DEBUG' if args.verbose else LOG_LEVEL)
+
+    if args.fused:
+        mode = 'fused'
+    elif args.streaming:
+        mode = 'streaming'
+    elif args.chunked:
+        mode = 'chunked'
+    elif args.live:
+        mode = 'live'
+    elif args.watch or args.serve or args.progressive:
+        # Рабочий процесс и прогрессивный вывод по умолчанию работают в один проход
+        mode = 'fused'
+    else:
+        mode = 'staged'
+
+    # Бенчмарк всегда меряет реальную обработку, без кэша и без замеров
+    # громкости из отчетов прошлых прогонов
+    # Кэш хранит один файл, а выход HLS/DASH - манифест и сегменты
+    cache = None if args.no_cache or args.benchmark or args.progressive in ('hls', 'dash') \
+        else ResultCache(args.cache_dir)
+    catalog = None if args.no_catalog or args.benchmark else MediaCatalog(args.catalog)
+
     # Создание экземпляра VoiceCleaner
-    cleaner = VoiceCleaner()
+    cleaner = VoiceCleaner(mode=mode, jobs=args.jobs, cache=cache,
+                           chunk_seconds=args.chunk_length,
+                           speech_gated=args.speech_gated,
+                           metrics=PrometheusExporter(args.metrics_file) if args.metrics_file else None,
+                           catalog=catalog,
+                           denoiser=args.denoiser,
+                           vad=args.vad,
+                           resume=args.resume,
+                           progressive=args.progressive,
+                           preset=args.preset,
+                           reports_dir=None if args.benchmark else REPORTS_DIR)
 
     try:
         # Выбор режима работы
-        if args.auto_analyze and args.input:
+        if args.benchmark:
+            # Бенчмарк на синтетических файлах
+            durations = None
+            if args.benchmark_durations:
+                durations = [float(value) for value in args.benchmark_durations.split(',')]
+            results = run_benchmark(cleaner, durations=durations)
+            print_benchmark(results)
+
+            output = args.benchmark_output or os.path.join(
+                REPORTS_DIR, f"benchmark_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+            save_benchmark(results, output)
+            logger.info(f"\nBenchmark results saved to: {output}")
+
+            if args.benchmark_baseline:
+                regressions = compare_with_baseline(results, load_benchmark(args.benchmark_baseline))
+                for regression in regressions:
+                    logger.info(f"✗ Regression: {regression}")
+                if regressions:
+                    sys.exit(1)
+                logger.info("✓ No regressions against baseline")
+            sys.exit(0)
+
+        elif args.sweep:
+            # Перебор параметров очистки на фикстурах
+            grid = sweep_grid(
+                levels=args.sweep_levels,
+                ratios=[float(value) for value in args.sweep_ratios.split(',')]
+                if args.sweep_ratios else None,
+                bands=parse_bands(args.sweep_bands) if args.sweep_bands else None)
+            results = run_sweep(args.sweep, grid, workers=args.jobs if args.jobs > 1 else None)
+            print_sweep(results)
+
+            output = args.sweep_output or os.path.join(
+                REPORTS_DIR, f"sweep_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+            save_benchmark(results, output)
+            logger.info(f"\nSweep results saved to: {output}")
+            logger.info(f"Pareto front: {', '.join(results['pareto_front']) or 'empty'}")
+            sys.exit(0)
+
+        elif args.auto_analyze and args.input:
             # Режим анализа
-            cleaner.auto_analyze(args.input)
+            sizes = args.spectrogram.split(',') if args.spectrogram else None
+            cleaner.auto_analyze(args.input, quick=args.quick, spectrogram_sizes=sizes)
+
+        elif args.live:
+            # Живая очистка потока
+            success = cleaner.process_live(args.input, args.output, args.latency_budget)
+            sys.exit(0 if success else 1)
 
         elif args.input and args.output:
             # Обработка одного файла
             success = cleaner.process_video(args.input, args.output)
             if success:
-                print(f"\n✓ Successfully processed: {args.input}")
-                print(f"  Output: {args.output}")
+                logger.info(f"\n✓ Successfully processed: {args.input}")
+                logger.info(f"  Output: {args.output}")
                 sys.exit(0)
             else:
-                print(f"\n✗ Failed to process: {args.input}")
+                logger.info(f"\n✗ Failed to process: {args.input}")
                 sys.exit(1)
 
+        elif args.queue_status:
+            # Состояние общей очереди
+            print_queue_status(queue_status(args.queue_dir))
+            sys.exit(0)
+
+        elif args.process_dir and args.queue_dir:
+            # Обработка директории вместе с обработчиками на других узлах
+            result = WorkQueue(args.queue_dir).run(cleaner, args.process_dir, args.output_dir)
+            logger.info(f"\n✓ Processed {result['processed']} file(s), "
+                        f"{result['failed']} failed on this worker")
+            sys.exit(0)
+
         elif args.process_dir:
             # Обработка директории
-            success_count = cleaner.process_directory(
+            results = cleaner.process_directory(
                 args.process_dir,
                 args.output_dir
             )
-            print(f"\n✓ Processed {success_count} file(s)")
+            print_batch_results(results)
+            logger.info(f"\n✓ Processed {count_successful(results)} file(s)")
+            sys.exit(0)
+
+        elif args.watch or args.serve:
+            # Долгоживущий обработчик папки до SIGTERM
+            worker = WatchWorker(cleaner, args.watch or INPUT_DIR, args.output_dir)
+            asyncio.run(worker.run())
             sys.exit(0)
 
         elif args.fixtures:
             # Обработка тестовых файлов
-            success_count = cleaner.run_from_fixtures(args.output_dir)
-            print(f"\n✓ Processed {success_count} fixture file(s)")
+            results = cleaner.run_from_fixtures(args.output_dir)
+            print_batch_results(results)
+            logger.info(f"\n✓ Processed {count_successful(results)} fixture file(s)")
             sys.exit(0)
 
         else:
             # Вывод справки
             parser.print_help()
-            print("\n\nAvailable fixtures:")
+            logger.info("\n\nAvailable fixtures:")
             if os.path.exists(FIXTURES_DIR):
                 for file in os.listdir(FIXTURES_DIR):
                     if any(file.lower().endswith(ext) for ext in VIDEO_EXTENSIONS):
-                        print(f"  - {file}")
+                        logger.info(f"  - {file}")
             sys.exit(0)
 
     except KeyboardInterrupt:
-        print("\n\nProcess interrupted by user")
+        logger.info("\n\nProcess interrupted by user")
         sys.exit(130)
     except Exception as e:
-        print(f"\nError: {e}")
+        logger.error(f"\nError: {e}")
         sys.exit(1)
     finally:
         # Очистка временных файлов
         cleaner.cleanup()
+        if catalog:
+            catalog.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,281 @@
+import contextvars
+import glob
+import os
+import struct
+import resource
+import threading
+import time
+import wave
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional
+
+from .log import logger
+
+
+def _file_size(path: str) -> Optional[int]:
+    try:
+        return os.path.getsize(path)
+    except (OSError, TypeError):
+        return None
+
+
+def _wav_duration(path: str) -> Optional[float]:
+    """Длительность WAV по заголовку, без запуска ffprobe"""
+    if not path.lower().endswith('.wav'):
+        return None
+    try:
+        with wave.open(path, 'rb') as wav:
+            return wav.getnframes() / wav.getframerate()
+    except (OSError, EOFError, wave.Error):
+        return None
+
+
+def _total(values: Iterable[Optional[float]]) -> Optional[float]:
+    values = [value for value in values if value is not None]
+    return sum(values) if values else None
+
+
+# Ресурсы процессов ffmpeg текущего этапа (по wait4 для каждого процесса)
+_stage_children = contextvars.ContextVar('stage_children', default=None)
+
+
+def record_child_usage(usage: Dict):
+    """Учет ресурсов завершившегося процесса в текущем этапе timed_stage"""
+    children = _stage_children.get()
+    if children is not None:
+        children.append(usage)
+
+
+@contextmanager
+def timed_stage(report: Dict, name: str, inputs: Iterable[str] = (),
+                outputs: Iterable[str] = ()):
+    """Замер этапа: время, CPU и пиковая память дочерних процессов, объем ввода-вывода
+
+    Запись этапа добавляется в report['stages']. Поля можно дополнить через
+    возвращаемый словарь (например, input_duration для видео).
+    CPU и память берутся из wait4 процессов ffmpeg, запущенных в этапе. Если
+    их нет (например, пул процессов NumPy), CPU считается по RUSAGE_CHILDREN:
+    при параллельных задачах в него попадают и соседние процессы.
+    """
+    inputs, outputs = list(inputs), list(outputs)
+    record = {'stage': name}
+    children = []
+    token = _stage_children.set(children)
+    usage_before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    started = time.monotonic()
+
+    logger.debug(f"Stage {name} started", extra={'fields': {'event': 'stage_start',
+                                                            'stage': name}})
+    try:
+        yield record
+    finally:
+        _stage_children.reset(token)
+        usage_after = resource.getrusage(resource.RUSAGE_CHILDREN)
+        record.setdefault('wall_seconds', round(time.monotonic() - started, 3))
+        if children:
+            record.setdefault('cpu_user_seconds',
+                              round(sum(child['cpu_user_seconds'] for child in children), 3))
+            record.setdefault('cpu_system_seconds',
+                              round(sum(child['cpu_system_seconds'] for child in children), 3))
+            record.setdefault('child_peak_rss_kb',
+                              max(child['peak_rss_kb'] for child in children))
+            record.setdefault('processes', len(children))
+        else:
+            record.setdefault('cpu_user_seconds',
+                              round(usage_after.ru_utime - usage_before.ru_utime, 3))
+            record.setdefault('cpu_system_seconds',
+                              round(usage_after.ru_stime - usage_before.ru_stime, 3))
+            # ru_maxrss у дочерних процессов - максимум по всем ожидавшимся, в КиБ (Linux)
+            record.setdefault('child_peak_rss_kb', usage_after.ru_maxrss)
+        record.setdefault('bytes_read', _total(_file_size(path) for path in inputs))
+        record.setdefault('bytes_written', _total(_file_size(path) for path in outputs))
+        record.setdefault('input_duration', _total(_wav_duration(path) for path in inputs))
+        record.setdefault('output_duration', _total(_wav_duration(path) for path in outputs))
+
+        report.setdefault('stages', []).append(record)
+        logger.info(f"   Stage {name}: {record['wall_seconds']:.2f}s",
+                     extra={'fields': {'event': 'stage', 'input': report.get('input'),
+                                       **record}})
+
+
+def _has_fragment(path: str) -> bool:
+    """Есть ли в MP4 файле бокс moof - первый фрагмент с медиа"""
+    try:
+        with open(path, 'rb') as f:
+            while True:
+                header = f.read(8)
+                if len(header) < 8:
+                    return False
+                size, kind = struct.unpack('>I4s', header)
+                if kind == b'moof':
+                    return True
+                if size == 1:
+                    large = f.read(8)
+                    if len(large) < 8:
+                        return False
+                    size = struct.unpack('>Q', large)[0] - 8
+                if size < 8:
+                    # size 0 - бокс до конца файла, дальше боксов нет
+                    return False
+                f.seek(size - 8, os.SEEK_CUR)
+    except OSError:
+        return False
+
+
+def _has_segment(path: str) -> bool:
+    """Есть ли рядом с манифестом HLS/DASH готовый сегмент с медиа
+
+    Сегменты пишутся во временный файл и переименовываются готовыми;
+    инициализирующие сегменты (name_init*) не считаются.
+    """
+    name = os.path.splitext(os.path.basename(path))[0]
+    pattern = os.path.join(glob.escape(os.path.dirname(path)), f"{glob.escape(name)}_[0-9]*.m4s")
+    return any(_file_size(segment) for segment in glob.glob(pattern))
+
+
+def _output_ready(path: str, progressive: Optional[str]) -> bool:
+    """Появились ли в выходе первые данные, которые может прочитать клиент"""
+    if progressive == 'fmp4':
+        return _has_fragment(path)
+    if progressive in ('hls', 'dash'):
+        return _has_segment(path)
+    return bool(_file_size(path))
+
+
+@contextmanager
+def first_output(path: str, progressive: Optional[str] = None, interval: float = 0.05):
+    """Замер времени до первых данных в выходном файле (time to first byte)
+
+    Файл опрашивается в фоновом потоке; в возвращаемый словарь записывается
+    время от входа в контекст до первых читаемых данных или None. Для fmp4
+    это первый фрагмент moof (заголовок empty_moov медиа не содержит), для
+    hls и dash - первый готовый сегмент, иначе - непустой файл.
+    """
+    record = {'seconds': None}
+    stop = threading.Event()
+    started = time.monotonic()
+
+    def poll():
+        while not stop.is_set():
+            if _output_ready(path, progressive):
+                record['seconds'] = round(time.monotonic() - started, 3)
+                return
+            stop.wait(interval)
+
+    watcher = threading.Thread(target=poll, daemon=True)
+    watcher.start()
+    try:
+        yield record
+    finally:
+        stop.set()
+        watcher.join()
+        # Короткая задача могла завершиться раньше первого опроса
+        if record['seconds'] is None and _output_ready(path, progressive):
+            record['seconds'] = round(time.monotonic() - started, 3)
+
+
+class PrometheusExporter:
+    """Метрики в формате textfile collector node_exporter"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._files = {'success': 0, 'failure': 0}
+        self._media_seconds = 0.0
+        self._stage_seconds = {}
+        self._stage_cpu_seconds = {}
+        self._last_job = 0.0
+        self._live_latency = None
+        self._ttfb = None
+
+    def observe(self, report: Dict):
+        """Учет отчета по завершенному файлу и перезапись файла метрик"""
+        with self._lock:
+            self._files['success' if report.get('success') else 'failure'] += 1
+            self._media_seconds += report.get('input_duration') or 0.0
+            for stage in report.get('stages', []):
+                name = stage['stage']
+                cpu = stage['cpu_user_seconds'] + stage['cpu_system_seconds']
+                self._stage_seconds[name] = self._stage_seconds.get(name, 0.0) + stage['wall_seconds']
+                self._stage_cpu_seconds[name] = self._stage_cpu_seconds.get(name, 0.0) + cpu
+            if report.get('ttfb_seconds') is not None:
+                self._ttfb = report['ttfb_seconds']
+            if report.get('live'):
+                self._live_latency = report['live']['latency']
+            self._last_job = time.time()
+            self._write()
+
+    def _write(self):
+        lines = [
+            "# HELP voice_cleaner_files_total Processed files by result.",
+            "# TYPE voice_cleaner_files_total counter",
+        ]
+        for status, count in self._files.items():
+            lines.append(f'voice_cleaner_files_total{{status="{status}"}} {count}')
+
+        lines += [
+            "# HELP voice_cleaner_media_seconds_total Duration of processed input media.",
+            "# TYPE voice_cleaner_media_seconds_total counter",
+            f"voice_cleaner_media_seconds_total {self._media_seconds:.3f}",
+            "# HELP voice_cleaner_stage_seconds_total Wall time spent per stage.",
+            "# TYPE voice_cleaner_stage_seconds_total counter",
+        ]
+        for stage, seconds in sorted(self._stage_seconds.items()):
+            lines.append(f'voice_cleaner_stage_seconds_total{{stage="{stage}"}} {seconds:.3f}')
+
+        lines += [
+            "# HELP voice_cleaner_stage_cpu_seconds_total Child process CPU time per stage.",
+            "# TYPE voice_cleaner_stage_cpu_seconds_total counter",
+        ]
+        for stage, seconds in sorted(self._stage_cpu_seconds.items()):
+            lines.append(f'voice_cleaner_stage_cpu_seconds_total{{stage="{stage}"}} {seconds:.3f}')
+
+        lines += [
+            "# HELP voice_cleaner_last_job_timestamp_seconds Completion time of the last job.",
+            "# TYPE voice_cleaner_last_job_timestamp_seconds gauge",
+            f"voice_cleaner_last_job_timestamp_seconds {self._last_job:.3f}",
+        ]
+
+        if self._ttfb is not None:
+            lines += [
+                "# HELP voice_cleaner_ttfb_seconds Time to first output byte of the last progressive job.",
+                "# TYPE voice_cleaner_ttfb_seconds gauge",
+                f"voice_cleaner_ttfb_seconds {self._ttfb:.3f}",
+            ]
+
+        if self._live_latency and self._live_latency['samples']:
+            lines += [
+                "# HELP voice_cleaner_live_latency_seconds End-to-end latency of the last live run.",
+                "# TYPE voice_cleaner_live_latency_seconds gauge",
+            ]
+            for stat in ('mean', 'p95', 'max'):
+                lines.append(f'voice_cleaner_live_latency_seconds{{stat="{stat}"}} '
+                             f'{self._live_latency[stat + "_ms"] / 1000:.3f}')
+
+        # Атомарная замена: коллектор не должен увидеть недописанный файл
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, self.path)
+
+
+def latency_summary(samples: List[float], budget: float) -> Dict:
+    """Сводка замеров задержки в миллисекундах: последняя, средняя, p95, максимум"""
+    if not samples:
+        return {'samples': 0, 'budget_ms': round(budget * 1000, 1)}
+    ordered = sorted(samples)
+    p95 = ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))]
+    return {
+        'samples': len(samples),
+        'last_ms': round(samples[-1] * 1000, 1),
+        'mean_ms': round(sum(samples) / len(samples) * 1000, 1),
+        'p95_ms': round(p95 * 1000, 1),
+        'max_ms': round(ordered[-1] * 1000, 1),
+        'budget_ms': round(budget * 1000, 1),
+        'over_budget': sum(1 for sample in samples if sample > budget),
+        # Бюджет нарушен, если за него выходит p95, а не отдельные выбросы
+        'within_budget': p95 <= budget,
+    }
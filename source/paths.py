@@ -5,6 +5,7 @@ BASE_DIR = "/app"
 INPUT_DIR = os.getenv("INPUT_DIR", os.path.join(BASE_DIR, "input_video"))
 OUTPUT_DIR = os.getenv("OUTPUT_DIR", os.path.join(BASE_DIR, "output_video"))
 FIXTURES_DIR = os.getenv("FIXTURES_DIR", os.path.join(BASE_DIR, "fixtures"))
+REPORTS_DIR = os.getenv("REPORTS_DIR", os.path.join(BASE_DIR, "reports"))
 
 # Расширения видео файлов
 VIDEO_EXTENSIONS = ['.mp4', '.avi', '.mov', '.mkv', '.flv', '.wmv', '.webm']
@@ -12,5 +13,141 @@ VIDEO_EXTENSIONS = ['.mp4', '.avi', '.mov', '.mkv', '.flv', '.wmv', '.webm']
 # Параметры обработки
 SAMPLE_RATE = 16000
 SPEECH_BAND = (300, 3400)  # Полоса речи
-NOISE_REDUCTION_LEVEL = 0.3
+# Уровень шума для afftdn (nf), дБ; ffmpeg принимает значения от -80 до -20
+NOISE_REDUCTION_LEVEL = -25
+NOISE_REDUCTION_RANGE = (-80, -20)
 COMPRESSION_RATIO = 1.5
+
+# Целевые параметры нормализации громкости (loudnorm)
+LOUDNORM_I = -16
+LOUDNORM_LRA = 11
+LOUDNORM_TP = -1.5
+
+# Параметры детектора тишины
+SILENCE_NOISE = "-30dB"
+SILENCE_DURATION = 0.5
+
+# Параметры аудио в выходном видео
+OUTPUT_AUDIO_CODEC = "aac"
+OUTPUT_AUDIO_BITRATE = "128k"
+
+# Контейнер для вывода в stdout (должен поддерживать запись без перемотки)
+PIPE_OUTPUT_FORMAT = "matroska"
+
+# Кэш результатов обработки
+CACHE_DIR = os.getenv("CACHE_DIR", os.path.join(BASE_DIR, "cache"))
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", str(50 * 1024 ** 3)))
+
+# Каталог медиафайлов: результаты ffprobe, анализа и статус обработки
+CATALOG_PATH = os.getenv("CATALOG_PATH", os.path.join(BASE_DIR, "catalog.sqlite3"))
+
+# Параметры параллельной обработки длинных файлов по частям
+CHUNK_SECONDS = 300
+CHUNK_OVERLAP_SECONDS = 0.5
+
+# Обработка только участков речи: запас вокруг речи, минимальная пауза
+# между участками, ослабление пауз и предел числа участков в графе фильтров
+SPEECH_GATE_MARGIN = 0.25
+SPEECH_GATE_MIN_GAP = 1.0
+SPEECH_GATE_ATTENUATION_DB = -20
+SPEECH_GATE_MAX_REGIONS = 200
+
+# Логирование
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+
+# Режим наблюдения за папкой: период опроса, число одинаковых замеров
+# размера и времени изменения до постановки в очередь, размер очереди
+WATCH_POLL_INTERVAL = float(os.getenv("WATCH_POLL_INTERVAL", "2.0"))
+WATCH_STABLE_POLLS = 2
+WATCH_QUEUE_SIZE = 100
+
+# Спектральное шумоподавление (NumPy): размер окна и шаг STFT, длина блока,
+# порог шума (среднее + N стандартных отклонений профиля), ослабление шума,
+# сглаживание маски по кадрам и по частотам, предел длины профиля шума
+DENOISE_FFT_SIZE = 1024
+DENOISE_HOP = 256
+DENOISE_BLOCK_SECONDS = 30
+DENOISE_THRESHOLD_STD = 1.5
+DENOISE_ATTENUATION_DB = -24
+DENOISE_SMOOTH_FRAMES = 5
+DENOISE_SMOOTH_BINS = 3
+DENOISE_PROFILE_SECONDS = 30
+
+# Детектор речи (NumPy): окно и шаг кадра, запас энергии над уровнем шума,
+# пороги включения и выключения (гистерезис), минимальные длины речи и паузы
+VAD_FRAME_SECONDS = 0.03
+VAD_HOP_SECONDS = 0.01
+VAD_BLOCK_SECONDS = 60
+VAD_ENERGY_MARGIN_DB = 6
+VAD_ENERGY_RANGE_DB = 12
+VAD_ON_THRESHOLD = 0.6
+VAD_OFF_THRESHOLD = 0.4
+VAD_MIN_SPEECH = 0.25
+VAD_MIN_SILENCE = 0.3
+# Уровень шума - минимум по блокам нижнего перцентиля энергии кадров, но не
+# ниже пика минус VAD_DYNAMIC_RANGE_DB (цифровая тишина не тянет его вниз)
+VAD_FLOOR_BLOCK_SECONDS = 2.0
+VAD_FLOOR_PERCENTILE = 10
+VAD_DYNAMIC_RANGE_DB = 50
+
+# Быстрый анализ по выборке: число окон и длина окна в секундах
+QUICK_WINDOWS = 12
+QUICK_WINDOW_SECONDS = 10
+# Размер спектрограммы по умолчанию
+SPECTROGRAM_SIZE = "1024x512"
+
+# Постоянная рабочая директория задач: промежуточные файлы и журнал этапов
+# сохраняются при сбое, чтобы --resume продолжил с последнего готового этапа
+WORK_DIR = os.getenv("WORK_DIR", os.path.join(BASE_DIR, "work"))
+
+# Живой режим: бюджет задержки в секундах и цепочка без упреждающих фильтров
+LIVE_LATENCY_BUDGET = float(os.getenv("LIVE_LATENCY_BUDGET", "0.5"))
+# Длина аудиокадра в цепочке (не больше десятой части бюджета)
+LIVE_FRAME_SECONDS = 0.02
+# Быстрая компрессия вместо двухпроходного loudnorm и предел лимитера
+LIVE_COMPRESSOR_ATTACK_MS = 5
+LIVE_COMPRESSOR_RELEASE_MS = 100
+LIVE_MAKEUP_DB = 6
+LIVE_LIMIT_DB = -1.0
+# Период отчетов -progress, по которым меряется задержка
+LIVE_STATS_PERIOD = 0.5
+# Контейнер живого вывода в stdout и по протоколам
+LIVE_OUTPUT_FORMAT = "mpegts"
+LIVE_PROTOCOL_FORMATS = {
+    'rtmp': 'flv',
+    'rtmps': 'flv',
+    'rtp': 'rtp_mpegts',
+    'srt': 'mpegts',
+    'tcp': 'mpegts',
+    'udp': 'mpegts',
+}
+
+# Прогрессивный вывод: длина фрагмента fMP4 и сегмента HLS/DASH в секундах
+PROGRESSIVE_SEGMENT_SECONDS = 4
+
+# Общая очередь задач для нескольких узлов: аренда без обновления дольше
+# QUEUE_LEASE_TTL секунд считается брошенной и забирается другим обработчиком
+QUEUE_LEASE_TTL = float(os.getenv("QUEUE_LEASE_TTL", "120"))
+QUEUE_HEARTBEAT_INTERVAL = float(os.getenv("QUEUE_HEARTBEAT_INTERVAL", "20"))
+# Ожидание файлов, арендованных другими обработчиками
+QUEUE_POLL_INTERVAL = 10.0
+
+# Пресеты: целевое отношение сигнал/шум для автовыбора, запас порога гейта над
+# уровнем шума, порог гейта без замера шума, полоса ключа sidechain-компрессора
+PRESET_TARGET_SNR_DB = float(os.getenv("PRESET_TARGET_SNR_DB", "20"))
+PRESET_GATE_MARGIN_DB = 6
+PRESET_GATE_FALLBACK_DB = -50
+PRESET_SIDECHAIN_BAND = (1000, 3000)
+PRESET_DEFAULT = "normal"
+
+# Запуск ffmpeg: предел времени = база + множитель * длительность медиа,
+# предел простоя без отчетов -progress, время на завершение после SIGTERM
+FFMPEG_TIMEOUT_BASE = float(os.getenv("FFMPEG_TIMEOUT_BASE", "60"))
+FFMPEG_TIMEOUT_FACTOR = float(os.getenv("FFMPEG_TIMEOUT_FACTOR", "4"))
+FFMPEG_STALL_TIMEOUT = float(os.getenv("FFMPEG_STALL_TIMEOUT", "120"))
+FFMPEG_KILL_GRACE = 5.0
+# Сколько stderr хранится в памяти (начало и конец вывода)
+FFMPEG_STDERR_LIMIT = 4 * 1024 ** 2
+# Период вывода процента, скорости и оставшегося времени
+FFMPEG_PROGRESS_LOG_INTERVAL = 10.0
@@ -1,3 +1,12 @@
+import math
+import re
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from .paths import *
+
+# lowpass - верхняя граница полосы, gate_offset - ослабление пауз гейтом (дБ),
+# compressor_ratio - степень компрессии, sidechain - компрессор с ключом по полосе речи
 PRESETS = {
     "soft": {
         "lowpass": 4000,
@@ -17,4 +26,122 @@ PRESETS = {
         "compressor_ratio": 5.0,
         "sidechain": True,
     },
-}
\ No newline at end of file
+}
+# Относительная стоимость фильтров на кадр (afftdn - БПФ, остальные - IIR и огибающие)
+FILTER_COSTS = {
+    'highpass': 1.0,
+    'lowpass': 1.0,
+    'afftdn': 8.0,
+    'agate': 1.0,
+    'acompressor': 1.0,
+    'asplit': 0.5,
+    'sidechaincompress': 1.5,
+}
+
+
+@lru_cache(maxsize=256)
+def compile_preset(lowpass: int, gate_offset: float, compressor_ratio: float,
+                   sidechain: bool, gate_threshold_db: int) -> Tuple[Tuple[str, ...], Tuple[str, ...]]:
+    """Фильтры пресета: (полоса, динамика); кэшируются по набору параметров
+
+    В sidechain-ветке метки содержат {label}: при нескольких копиях цепочки
+    в одном графе метка подставляется для каждой копии.
+    """
+    band = (f"highpass=f={SPEECH_BAND[0]}", f"lowpass=f={lowpass}")
+    dynamics = [
+        # Гейт ослабляет паузы на gate_offset дБ, открываясь выше уровня шума
+        f"agate=threshold={10 ** (gate_threshold_db / 20):.6f}"
+        f":range={10 ** (gate_offset / 20):.4f}:attack=10:release=150",
+    ]
+    if sidechain:
+        # Ключ - полоса разборчивости речи: музыка и гул не двигают усиление
+        dynamics.append(
+            "asplit=2[{label}m][{label}k];"
+            f"[{{label}}k]highpass=f={PRESET_SIDECHAIN_BAND[0]},"
+            f"lowpass=f={PRESET_SIDECHAIN_BAND[1]}[{{label}}b];"
+            "[{label}m][{label}b]"
+            f"sidechaincompress=threshold=-30dB:ratio={compressor_ratio}:attack=20:release=300")
+    else:
+        dynamics.append(f"acompressor=threshold=-30dB:ratio={compressor_ratio}"
+                        f":attack=50:release=500")
+    return band, tuple(dynamics)
+
+
+def _measured(value: Optional[float]) -> bool:
+    return value is not None and math.isfinite(value)
+
+
+def preset_filters(name: str, noise_floor: Optional[float] = None) -> Tuple[List[str], List[str]]:
+    """Фильтры пресета для файла; порог гейта - уровень шума плюс запас"""
+    preset = PRESETS[name]
+    # Неизвестный или бесконечный уровень шума (цифровая тишина) - порог по умолчанию
+    threshold = noise_floor + PRESET_GATE_MARGIN_DB if _measured(noise_floor) \
+        else PRESET_GATE_FALLBACK_DB
+    # Порог округляется до дБ: файлы с близким шумом делят скомпилированную цепочку
+    band, dynamics = compile_preset(preset['lowpass'], preset['gate_offset'],
+                                    preset['compressor_ratio'], preset['sidechain'],
+                                    int(round(min(threshold, 0))))
+    return list(band), list(dynamics)
+
+
+def chain_cost(filters: List[str]) -> float:
+    """Оценка стоимости цепочки по фильтрам в ней"""
+    names = [re.sub(r'^(\[[^\]]*\])+', '', part).split('=', 1)[0]
+             for chain in filters for part in re.split(r'[,;]', chain)]
+    return sum(FILTER_COSTS.get(name, 1.0) for name in names if name)
+
+
+def preset_cost(name: str, denoiser: str = 'afftdn') -> float:
+    band, dynamics = preset_filters(name)
+    return chain_cost(band + dynamics) + (FILTER_COSTS['afftdn'] if denoiser == 'afftdn' else 0.0)
+
+
+def predict(name: str, snr: float, loudness_range: Optional[float]) -> Dict:
+    """Ожидаемый результат пресета по замерам файла
+
+    Гейт ослабляет шум в паузах на gate_offset дБ; компрессор сжимает
+    диапазон громкости примерно в compressor_ratio раз.
+    """
+    preset = PRESETS[name]
+    return {
+        'snr': round(snr - preset['gate_offset'], 1),
+        'loudness_range': round(loudness_range / preset['compressor_ratio'], 1)
+        if loudness_range is not None else None,
+    }
+
+
+def select_preset(rms_level: Optional[float], noise_floor: Optional[float],
+                  loudness_range: Optional[float], denoiser: str = 'afftdn',
+                  target_snr: float = PRESET_TARGET_SNR_DB) -> Dict:
+    """Самый дешевый пресет, который дает целевые SNR и диапазон громкости
+
+    Если цели не достигает ни один пресет, берется дающий наибольший SNR.
+    Без замеров уровня и шума - пресет по умолчанию.
+    """
+    if not _measured(rms_level) or not _measured(noise_floor):
+        return {'preset': PRESET_DEFAULT, 'reason': 'no measurements'}
+
+    snr = rms_level - noise_floor
+    # При равной стоимости раньше идет более мягкий пресет
+    candidates = sorted(PRESETS, key=lambda name: (preset_cost(name, denoiser),
+                                                   -PRESETS[name]['gate_offset']))
+    predictions = {name: predict(name, snr, loudness_range) for name in candidates}
+
+    for name in candidates:
+        expected = predictions[name]
+        if expected['snr'] >= target_snr and \
+                (expected['loudness_range'] is None or expected['loudness_range'] <= LOUDNORM_LRA):
+            chosen, reason = name, 'cheapest meeting target'
+            break
+    else:
+        chosen = max(candidates, key=lambda name: predictions[name]['snr'])
+        reason = 'target not reachable, strongest preset'
+
+    return {
+        'preset': chosen,
+        'reason': reason,
+        'input_snr': round(snr, 1),
+        'target_snr': target_snr,
+        'expected': predictions[chosen],
+        'cost': preset_cost(chosen, denoiser),
+    }
@@ -1,11 +1,34 @@
+import hashlib
 import json
 from pathlib import Path
 from datetime import datetime
+from typing import Optional
 
 
 def save_report(report: dict, report_dir: Path):
-    report_dir.mkdir(exist_ok=True)
+    report_dir.mkdir(parents=True, exist_ok=True)
     ts = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
-    path = report_dir / f"{report['input']}_{ts}.json"
+    # Одноименные файлы из разных директорий обрабатываются параллельно:
+    # в имени отчета еще хэш путей входа и выхода
+    digest = hashlib.sha256(
+        f"{report.get('input_path')}\0{report['output']}".encode()).hexdigest()[:8]
+    path = report_dir / f"{report['input']}_{ts}_{digest}.json"
     with open(path, "w", encoding="utf-8") as f:
-        json.dump(report, f, indent=2)
\ No newline at end of file
+        json.dump(report, f, indent=2)
+
+
+def load_latest_report(input_name: str, report_dir: Path) -> Optional[dict]:
+    if not report_dir.is_dir():
+        return None
+
+    # Имена отчетов содержат метку времени, поэтому последний - максимальный
+    for path in sorted(report_dir.glob(f"{input_name}_*.json"), reverse=True):
+        try:
+            with open(path, encoding="utf-8") as f:
+                report = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if report.get("input") == input_name:
+            return report
+
+    return None
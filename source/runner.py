@@ -0,0 +1,530 @@
+import asyncio
+import atexit
+import os
+import signal
+import subprocess
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional
+import ffmpeg
+
+from .paths import *
+from .log import logger
+from .metrics import record_child_usage
+from .denoise import wav_layout
+
+
+class FFmpegRunError(ffmpeg.Error):
+    """Ошибка запуска ffmpeg: код возврата, предел времени или отмена"""
+
+    def __init__(self, cmd: List[str], reason: str, stderr: str = '', stdout=None):
+        super().__init__(cmd[0], stdout, stderr)
+        self.stdout = stdout
+        self.stderr = stderr
+        self.cmd = cmd
+        self.reason = reason
+
+    def __str__(self) -> str:
+        tail = "\n".join(self.stderr.strip().split("\n")[-5:]) if self.stderr else ''
+        return f"{os.path.basename(self.cmd[0])} {self.reason}" + (f": {tail}" if tail else '')
+
+
+class FFmpegTimeout(FFmpegRunError):
+    """Процесс превысил предел времени или перестал сообщать о прогрессе"""
+
+
+class FFmpegCancelled(FFmpegRunError):
+    """Процесс остановлен по запросу отмены"""
+
+
+class StderrBuffer:
+    """stderr с ограничением объема: хранятся начало и конец вывода
+
+    limit=None - без ограничения: для запусков, вывод которых разбирается
+    (astats, silencedetect, loudnorm), пропуск середины терял бы замеры.
+    """
+
+    def __init__(self, limit: Optional[int] = FFMPEG_STDERR_LIMIT):
+        self.limit = limit
+        self.half = limit // 2 if limit is not None else None
+        self.head = []
+        self.head_bytes = 0
+        self.tail = deque()
+        self.tail_bytes = 0
+        self.dropped = 0
+
+    def append(self, line: str):
+        if self.half is None or not self.tail and self.head_bytes + len(line) <= self.half:
+            self.head.append(line)
+            self.head_bytes += len(line)
+            return
+        self.tail.append(line)
+        self.tail_bytes += len(line)
+        while self.tail_bytes > self.half and len(self.tail) > 1:
+            self.tail_bytes -= len(self.tail.popleft())
+            if not self.dropped:
+                logger.warning(f"   Warning: ffmpeg stderr exceeds {self.limit} bytes, "
+                               f"dropping lines from the middle")
+            self.dropped += 1
+
+    def text(self) -> str:
+        middle = [f"[... {self.dropped} line(s) of stderr dropped ...]\n"] if self.dropped else []
+        return "".join(self.head + middle + list(self.tail))
+
+
+@dataclass
+class RunResult:
+    """Итог процесса: код возврата, вывод, прогресс и ресурсы по wait4"""
+    cmd: List[str]
+    returncode: int
+    stderr: str = ''
+    stdout: Optional[bytes] = None
+    progress: Dict = field(default_factory=dict)
+    usage: Dict = field(default_factory=dict)
+    interrupted: bool = False
+
+    def check(self) -> 'RunResult':
+        if self.returncode != 0:
+            raise FFmpegRunError(self.cmd, f"exited with code {self.returncode}",
+                                 self.stderr, self.stdout)
+        return self
+
+
+@lru_cache(maxsize=256)
+def _probe_duration(path: str, size: int, mtime_ns: int) -> Optional[float]:
+    result = run_ffmpeg(['ffprobe', '-v', 'error', '-show_entries', 'format=duration',
+                         '-of', 'default=noprint_wrappers=1:nokey=1', path],
+                        capture_stdout=True, timeout=FFMPEG_TIMEOUT_BASE)
+    try:
+        return float(result.stdout.decode().strip()) if result.returncode == 0 else None
+    except ValueError:
+        return None
+
+
+def input_duration(path: str) -> Optional[float]:
+    """Длительность входного файла: WAV по заголовку, остальное через ffprobe (с кэшем)"""
+    if path == '-' or path.startswith('pipe:') or not os.path.isfile(path):
+        return None
+    if path.lower().endswith('.wav'):
+        try:
+            _, frames, sample_rate = wav_layout(path)
+            return frames / sample_rate
+        except (OSError, ValueError):
+            pass
+    stat = os.stat(path)
+    return _probe_duration(path, stat.st_size, stat.st_mtime_ns)
+
+
+def media_duration(cmd: List[str]) -> Optional[float]:
+    """Суммарная длительность входов команды; -t перед входом ограничивает его длину"""
+    total = None
+    limit = None
+    for i, arg in enumerate(cmd[:-1]):
+        if arg == '-t':
+            try:
+                limit = float(cmd[i + 1])
+            except ValueError:
+                limit = None
+        elif arg == '-i':
+            duration = input_duration(cmd[i + 1])
+            if limit is not None:
+                duration = min(duration, limit) if duration is not None else limit
+            if duration is not None:
+                total = (total or 0.0) + duration
+            limit = None
+    return total
+
+
+# Запущенные группы процессов: при выходе интерпретатора они завершаются
+_running = set()
+_running_lock = threading.Lock()
+
+
+def _signal_group(pgid: int, sig: int):
+    try:
+        os.killpg(pgid, sig)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+@atexit.register
+def terminate_all():
+    """Завершение всех еще работающих групп процессов ffmpeg"""
+    with _running_lock:
+        groups = list(_running)
+    for pgid in groups:
+        _signal_group(pgid, signal.SIGKILL)
+
+
+class FFmpegProcess:
+    """Процесс ffmpeg в своей группе: отчеты -progress, ограниченный stderr, rusage
+
+    Процесс запускается в новой сессии, поэтому отмена и пределы времени
+    завершают всю группу. Процесс ожидается через wait4, ресурсы попадают
+    в замер текущего этапа (timed_stage).
+    """
+
+    def __init__(self, cmd: List[str], stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                 capture_stdout: bool = False, duration: Optional[float] = None,
+                 on_progress: Optional[Callable[[Dict], None]] = None,
+                 stderr_limit: Optional[int] = FFMPEG_STDERR_LIMIT):
+        read_fd, write_fd = self._setup(cmd, duration, on_progress, stderr_limit)
+        self._done = threading.Event()
+        self._rusage = None
+        cmd = self.cmd
+
+        try:
+            self.process = subprocess.Popen(
+                cmd, stdin=stdin,
+                stdout=subprocess.PIPE if capture_stdout else stdout,
+                stderr=subprocess.PIPE,
+                pass_fds=(write_fd,) if write_fd is not None else (),
+                start_new_session=True)
+        except OSError:
+            if read_fd is not None:
+                os.close(read_fd)
+                os.close(write_fd)
+            raise
+        self.pid = self.process.pid
+        with _running_lock:
+            _running.add(self.pid)
+
+        self._threads = [threading.Thread(target=self._read_stderr, daemon=True),
+                         threading.Thread(target=self._reap, daemon=True)]
+        if read_fd is not None:
+            os.close(write_fd)
+            self._threads.append(threading.Thread(target=self._read_progress, args=(read_fd,),
+                                                  daemon=True))
+        if capture_stdout:
+            self._threads.append(threading.Thread(target=self._read_stdout, daemon=True))
+        for thread in self._threads:
+            thread.start()
+
+    def _setup(self, cmd: List[str], duration: Optional[float],
+               on_progress: Optional[Callable[[Dict], None]],
+               stderr_limit: Optional[int]):
+        """Общее состояние процесса и канал -progress: (read_fd, write_fd) или (None, None)"""
+        self.progress_enabled = os.path.basename(cmd[0]) == 'ffmpeg'
+        self.duration = duration
+        self.on_progress = on_progress
+        self.progress = {}
+        self.stdout = None
+        self._stderr = StderrBuffer(stderr_limit)
+        self._started = time.monotonic()
+        self._activity = self._started
+        self._last_log = self._started
+
+        read_fd = write_fd = None
+        if self.progress_enabled:
+            read_fd, write_fd = os.pipe()
+            extra = ['-progress', f"pipe:{write_fd}"]
+            if '-nostats' not in cmd:
+                extra.append('-nostats')
+            cmd = [cmd[0], *extra, *cmd[1:]]
+        self.cmd = cmd
+        return read_fd, write_fd
+
+    def _stop_reason(self, deadline: Optional[float], timeout: Optional[float],
+                     stall_timeout: Optional[float], cancel: Optional[threading.Event]):
+        """Причина остановки процесса: отмена, предел времени или простой"""
+        now = time.monotonic()
+        if cancel is not None and cancel.is_set():
+            return FFmpegCancelled, "cancelled"
+        if deadline and now > deadline:
+            return FFmpegTimeout, f"timed out after {timeout:.0f}s"
+        if stall_timeout and self.progress_enabled and now - self._activity > stall_timeout:
+            return FFmpegTimeout, f"stalled: no progress for {stall_timeout:.0f}s"
+        return None
+
+    def _read_stderr(self):
+        for line in iter(lambda: self.process.stderr.readline(65536), b''):
+            self._stderr.append(line.decode('utf-8', 'replace'))
+
+    def _read_stdout(self):
+        self.stdout = self.process.stdout.read()
+
+    def _read_progress(self, read_fd: int):
+        # Отчет - блок строк key=value, который завершает строка progress=...
+        block = {}
+        with os.fdopen(read_fd, 'r') as progress:
+            for line in progress:
+                key, _, value = line.strip().partition('=')
+                block[key] = value
+                if key == 'progress':
+                    self._update(block)
+                    block = {}
+
+    def _update(self, block: Dict):
+        self._activity = now = time.monotonic()
+        out_us = block.get('out_time_us', '')
+        out_seconds = max(0.0, int(out_us) / 1e6) if out_us.lstrip('-').isdigit() else \
+            self.progress.get('out_seconds', 0.0)
+        speed = block.get('speed', '').rstrip('x')
+        progress = {
+            'out_seconds': out_seconds,
+            'elapsed_seconds': now - self._started,
+            'speed': float(speed) if speed.replace('.', '', 1).isdigit() else
+            self.progress.get('speed'),
+            'state': block.get('progress'),
+            'percent': None,
+            'eta_seconds': None,
+        }
+        if self.duration:
+            progress['percent'] = round(min(100.0, 100 * out_seconds / self.duration), 1)
+            rate = out_seconds / (now - self._started) if now > self._started else 0
+            if rate > 0:
+                progress['eta_seconds'] = round(max(0.0, self.duration - out_seconds) / rate, 1)
+        self.progress = progress
+
+        if self.on_progress:
+            self.on_progress(progress)
+        elif progress['percent'] is not None and \
+                now - self._last_log >= FFMPEG_PROGRESS_LOG_INTERVAL:
+            self._last_log = now
+            speed = f"{progress['speed']:.1f}x" if progress['speed'] is not None else '?'
+            eta = f"{progress['eta_seconds']:.0f}s" if progress['eta_seconds'] is not None else '?'
+            logger.info(f"   {os.path.basename(self.cmd[-1])}: {progress['percent']:.0f}% "
+                        f"at {speed}, ETA {eta}")
+
+    def _reap(self):
+        _, status, rusage = os.wait4(self.pid, 0)
+        # Код возврата задается сразу, чтобы Popen не ожидал процесс повторно
+        self.process.returncode = os.waitstatus_to_exitcode(status)
+        self._rusage = rusage
+        with _running_lock:
+            _running.discard(self.pid)
+        self._done.set()
+
+    def signal(self, sig: int):
+        """Сигнал всей группе, пока процесс не завершен"""
+        if not self._done.is_set():
+            _signal_group(self.pid, sig)
+
+    def terminate(self):
+        """SIGTERM группе, SIGKILL, если процесс не вышел за FFMPEG_KILL_GRACE"""
+        self.signal(signal.SIGTERM)
+        if not self._done.wait(FFMPEG_KILL_GRACE):
+            self.signal(signal.SIGKILL)
+            self._done.wait()
+
+    def wait(self, timeout: Optional[float] = None,
+             stall_timeout: Optional[float] = FFMPEG_STALL_TIMEOUT,
+             cancel: Optional[threading.Event] = None,
+             interruptible: bool = False) -> RunResult:
+        """Ожидание завершения с пределами времени и отменой
+
+        interruptible - Ctrl+C передается ffmpeg как SIGINT, и ожидание
+        продолжается, пока он дописывает выход; иначе группа завершается.
+        """
+        deadline = self._started + timeout if timeout else None
+        interrupted = False
+        reason = None
+        while not self._done.is_set():
+            try:
+                self._done.wait(0.25)
+            except KeyboardInterrupt:
+                if not interruptible:
+                    self.terminate()
+                    raise
+                interrupted = True
+                self.signal(signal.SIGINT)
+                continue
+            if self._done.is_set():
+                break
+            reason = self._stop_reason(deadline, timeout, stall_timeout, cancel)
+            if reason:
+                self.terminate()
+                break
+
+        for thread in self._threads:
+            thread.join()
+        usage = {
+            'wall_seconds': round(time.monotonic() - self._started, 3),
+            'cpu_user_seconds': round(self._rusage.ru_utime, 3),
+            'cpu_system_seconds': round(self._rusage.ru_stime, 3),
+            # ru_maxrss в КиБ (Linux)
+            'peak_rss_kb': self._rusage.ru_maxrss,
+        }
+        record_child_usage(usage)
+
+        stderr = self._stderr.text()
+        if reason:
+            error, message = reason
+            raise error(self.cmd, message, stderr, self.stdout)
+        return RunResult(self.cmd, self.process.returncode, stderr, self.stdout,
+                         self.progress, usage, interrupted)
+
+
+class AsyncFFmpegProcess(FFmpegProcess):
+    """Процесс ffmpeg для asyncio: create_subprocess_exec и чтение каналов в цикле событий
+
+    Группа процессов, -progress, ограниченный stderr, пределы времени и отмена -
+    как у FFmpegProcess, но без потоков. Процесс ожидает asyncio, поэтому wait4
+    недоступен: CPU и память этапа timed_stage берет по RUSAGE_CHILDREN.
+    """
+
+    def __init__(self, cmd: List[str], duration: Optional[float] = None,
+                 on_progress: Optional[Callable[[Dict], None]] = None,
+                 stderr_limit: Optional[int] = FFMPEG_STDERR_LIMIT):
+        self._read_fd, self._write_fd = self._setup(cmd, duration, on_progress, stderr_limit)
+        self.process = None
+        self.pid = None
+        self._tasks = []
+
+    async def start(self, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                    capture_stdout: bool = False):
+        """Запуск процесса и задач чтения stderr, stdout и -progress"""
+        try:
+            self.process = await asyncio.create_subprocess_exec(
+                *self.cmd, stdin=stdin,
+                stdout=subprocess.PIPE if capture_stdout else stdout,
+                stderr=subprocess.PIPE,
+                pass_fds=(self._write_fd,) if self._write_fd is not None else (),
+                start_new_session=True)
+        except OSError:
+            if self._read_fd is not None:
+                os.close(self._read_fd)
+                os.close(self._write_fd)
+            raise
+        self.pid = self.process.pid
+        with _running_lock:
+            _running.add(self.pid)
+
+        self._exit = asyncio.ensure_future(self.process.wait())
+        self._tasks = [asyncio.ensure_future(self._read_stderr())]
+        if self._read_fd is not None:
+            os.close(self._write_fd)
+            self._tasks.append(asyncio.ensure_future(self._read_progress(self._read_fd)))
+        if capture_stdout:
+            self._tasks.append(asyncio.ensure_future(self._read_stdout()))
+        return self
+
+    async def _read_stderr(self):
+        while True:
+            try:
+                line = await self.process.stderr.readline()
+            except ValueError:
+                # Строка длиннее буфера StreamReader отбрасывается
+                continue
+            if not line:
+                break
+            self._stderr.append(line.decode('utf-8', 'replace'))
+
+    async def _read_stdout(self):
+        self.stdout = await self.process.stdout.read()
+
+    async def _read_progress(self, read_fd: int):
+        reader = asyncio.StreamReader()
+        transport, _ = await asyncio.get_running_loop().connect_read_pipe(
+            lambda: asyncio.StreamReaderProtocol(reader), os.fdopen(read_fd, 'rb', 0))
+        block = {}
+        try:
+            async for line in reader:
+                key, _, value = line.decode('utf-8', 'replace').strip().partition('=')
+                block[key] = value
+                if key == 'progress':
+                    self._update(block)
+                    block = {}
+        finally:
+            transport.close()
+
+    def signal(self, sig: int):
+        """Сигнал всей группе, пока процесс не завершен"""
+        if self.process.returncode is None:
+            _signal_group(self.pid, sig)
+
+    async def terminate(self):
+        """SIGTERM группе, SIGKILL, если процесс не вышел за FFMPEG_KILL_GRACE"""
+        self.signal(signal.SIGTERM)
+        try:
+            await asyncio.wait_for(asyncio.shield(self._exit), FFMPEG_KILL_GRACE)
+        except asyncio.TimeoutError:
+            self.signal(signal.SIGKILL)
+            await self._exit
+
+    async def wait(self, timeout: Optional[float] = None,
+                   stall_timeout: Optional[float] = FFMPEG_STALL_TIMEOUT,
+                   cancel: Optional[threading.Event] = None) -> RunResult:
+        """Ожидание завершения с пределами времени; отмена задачи завершает группу"""
+        deadline = self._started + timeout if timeout else None
+        reason = None
+        try:
+            while not self._exit.done():
+                await asyncio.wait([self._exit], timeout=0.25)
+                if self._exit.done():
+                    break
+                reason = self._stop_reason(deadline, timeout, stall_timeout, cancel)
+                if reason:
+                    await self.terminate()
+                    break
+        except asyncio.CancelledError:
+            await self.terminate()
+            raise
+        finally:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+            with _running_lock:
+                _running.discard(self.pid)
+
+        usage = {'wall_seconds': round(time.monotonic() - self._started, 3)}
+        stderr = self._stderr.text()
+        if reason:
+            error, message = reason
+            raise error(self.cmd, message, stderr, self.stdout)
+        return RunResult(self.cmd, self.process.returncode, stderr, self.stdout,
+                         self.progress, usage)
+
+
+def run_timeout(duration: Optional[float]) -> Optional[float]:
+    """Предел времени по длительности медиа; без нее - только предел простоя"""
+    return FFMPEG_TIMEOUT_BASE + FFMPEG_TIMEOUT_FACTOR * duration if duration else None
+
+
+def run_ffmpeg(cmd: List[str], stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+               capture_stdout: bool = False, duration: Optional[float] = None,
+               timeout='auto', stall_timeout: Optional[float] = FFMPEG_STALL_TIMEOUT,
+               cancel: Optional[threading.Event] = None,
+               on_progress: Optional[Callable[[Dict], None]] = None,
+               interruptible: bool = False,
+               stderr_limit: Optional[int] = FFMPEG_STDERR_LIMIT) -> RunResult:
+    """Запуск ffmpeg/ffprobe до завершения
+
+    timeout='auto' - предел по длительности входов (без нее - только предел
+    простоя), None - без предела. Ненулевой код возврата не считается
+    исключением (см. RunResult.check), превышение пределов и отмена -
+    FFmpegTimeout и FFmpegCancelled. stderr_limit=None - stderr целиком,
+    для запусков, вывод которых разбирается.
+    """
+    # Длительность нужна для предела времени и для вывода процента
+    if duration is None and (timeout == 'auto' or on_progress is None):
+        duration = media_duration(cmd)
+    if timeout == 'auto':
+        timeout = run_timeout(duration)
+    process = FFmpegProcess(cmd, stdin, stdout, capture_stdout, duration, on_progress,
+                            stderr_limit)
+    return process.wait(timeout, stall_timeout, cancel, interruptible)
+
+
+def run_stream(stream, **kwargs) -> RunResult:
+    """Запуск графа ffmpeg-python; ошибка - ffmpeg.Error, как у stream.run()"""
+    return run_ffmpeg(stream.compile(), **kwargs).check()
+
+
+async def run_ffmpeg_async(cmd: List[str], stdin=subprocess.DEVNULL,
+                           stdout=subprocess.DEVNULL, capture_stdout: bool = False,
+                           duration: Optional[float] = None, timeout='auto',
+                           stall_timeout: Optional[float] = FFMPEG_STALL_TIMEOUT,
+                           cancel: Optional[threading.Event] = None,
+                           on_progress: Optional[Callable[[Dict], None]] = None,
+                           stderr_limit: Optional[int] = FFMPEG_STDERR_LIMIT) -> RunResult:
+    """run_ffmpeg для asyncio; отмена задачи завершает группу процессов"""
+    if duration is None and (timeout == 'auto' or on_progress is None):
+        # ffprobe для длительности входов короткий, но блокирующий
+        duration = await asyncio.to_thread(media_duration, cmd)
+    if timeout == 'auto':
+        timeout = run_timeout(duration)
+    process = AsyncFFmpegProcess(cmd, duration, on_progress, stderr_limit)
+    await process.start(stdin, stdout, capture_stdout)
+    return await process.wait(timeout, stall_timeout, cancel)
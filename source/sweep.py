@@ -0,0 +1,274 @@
+import hashlib
+import itertools
+import os
+import platform
+import tempfile
+import time
+import wave
+from array import array
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from .paths import *
+from .log import logger
+from .ffmpeg_client import FFmpegClient
+
+# Сетка параметров по умолчанию: уровень шума afftdn (дБ), степень сжатия, полоса речи
+SWEEP_LEVELS = [-20, -25, -35]
+SWEEP_RATIOS = [1.5, 2.5, 4.0]
+SWEEP_BANDS = [(300, 3400), (200, 4000), (80, 8000)]
+
+# Общий кэш декодированного аудио фикстур
+SWEEP_CACHE_DIR = os.path.join(CACHE_DIR, "sweep")
+
+# Критерии фронта Парето: имя метрики и направление (1 - больше лучше, -1 - меньше лучше)
+SWEEP_OBJECTIVES = [('snr_gain', 1), ('loudness_deviation', -1), ('clipped', -1), ('rtf', -1)]
+
+# Предельные значения 16-битного сэмпла: на них запись в pcm_s16le обрезает сигнал
+CLIP_VALUES = (32767, -32768)
+
+
+def parse_levels(value: str) -> List[float]:
+    """Уровни шума из строки вида -20,-30; вне диапазона afftdn - ValueError"""
+    low, high = NOISE_REDUCTION_RANGE
+    levels = [float(item) for item in value.split(',')]
+    for level in levels:
+        if not low <= level <= high:
+            raise ValueError(f"noise floor {level:g} dB is outside {low}..{high} dB")
+    return levels
+
+
+def parse_bands(value: str) -> List[Tuple[float, float]]:
+    """Полосы из строки вида 300-3400,200-4000"""
+    bands = []
+    for item in value.split(','):
+        low, high = item.split('-')
+        bands.append((float(low), float(high)))
+    return bands
+
+
+def sweep_grid(levels: List[float] = None, ratios: List[float] = None,
+               bands: List[Tuple[float, float]] = None) -> List[Dict]:
+    """Все сочетания параметров сетки"""
+    return [{'reduction_level': level, 'compression_ratio': ratio, 'band': list(band)}
+            for level, ratio, band in itertools.product(levels or SWEEP_LEVELS,
+                                                        ratios or SWEEP_RATIOS,
+                                                        bands or SWEEP_BANDS)]
+
+
+def params_name(params: Dict) -> str:
+    low, high = params['band']
+    return f"nf{params['reduction_level']:g}_r{params['compression_ratio']:g}_b{low:g}-{high:g}"
+
+
+def decode_fixture(video_path: str, cache_dir: str = SWEEP_CACHE_DIR) -> Optional[str]:
+    """WAV фикстуры из общего кэша; декодируется только при изменении файла"""
+    stat = os.stat(video_path)
+    key = hashlib.sha256(
+        f"{os.path.abspath(video_path)}:{stat.st_size}:{stat.st_mtime_ns}:{SAMPLE_RATE}".encode()
+    ).hexdigest()[:16]
+    audio_path = os.path.join(cache_dir, f"{key}.wav")
+    if os.path.exists(audio_path):
+        return audio_path
+
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = os.path.join(cache_dir, f".{key}.{os.getpid()}.wav")
+    if not FFmpegClient.extract_audio(video_path, tmp_path):
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return None
+    os.replace(tmp_path, audio_path)
+    return audio_path
+
+
+def count_clipped(audio_path: str, block: int = 1024 * 1024) -> int:
+    """Число сэмплов 16-битного WAV на пределе диапазона"""
+    clipped = 0
+    with wave.open(audio_path, 'rb') as f:
+        while True:
+            frames = f.readframes(block)
+            if not frames:
+                break
+            samples = array('h', frames)
+            clipped += sum(samples.count(value) for value in CLIP_VALUES)
+    return clipped
+
+
+def snr(analysis) -> Optional[float]:
+    """Оценка SNR: уровень RMS над уровнем шума"""
+    if analysis is None or analysis.rms_level is None or analysis.noise_floor is None:
+        return None
+    return analysis.rms_level - analysis.noise_floor
+
+
+def run_case(audio_path: str, params: Dict, duration: float, snr_in: Optional[float],
+             work_dir: str) -> Dict:
+    """Очистка декодированного аудио с одним набором параметров и оценка результата"""
+    output = os.path.join(work_dir, f"{params_name(params)}_{os.getpid()}.wav")
+    cleaning_filter = FFmpegClient.build_cleaning_filter(params['reduction_level'],
+                                                         band=tuple(params['band']),
+                                                         compression_ratio=params['compression_ratio'])
+    try:
+        started = time.monotonic()
+        # Параллельность дает пул процессов, одному ffmpeg - один поток
+        success = FFmpegClient.apply_noise_reduction(audio_path, output, threads=1,
+                                                     cleaning_filter=cleaning_filter)
+        elapsed = time.monotonic() - started
+        if not success:
+            return {'error': 'cleaning failed'}
+
+        analysis = FFmpegClient.analyze_audio(output, measure_loudness=False, threads=1)
+        snr_out = snr(analysis)
+        loudness = analysis.integrated_loudness if analysis else None
+        return {
+            'seconds': round(elapsed, 3),
+            'rtf': round(elapsed / duration, 4) if duration else None,
+            'snr_out': round(snr_out, 2) if snr_out is not None else None,
+            'snr_gain': (round(snr_out - snr_in, 2)
+                         if snr_out is not None and snr_in is not None else None),
+            'loudness': loudness,
+            'loudness_deviation': (round(abs(loudness - LOUDNORM_I), 2)
+                                   if loudness is not None else None),
+            'clipped': count_clipped(output),
+        }
+    finally:
+        if os.path.exists(output):
+            os.remove(output)
+
+
+def _mean(values: List[Optional[float]]) -> Optional[float]:
+    values = [value for value in values if value is not None]
+    return round(sum(values) / len(values), 4) if values else None
+
+
+def aggregate(params: Dict, cases: List[Dict]) -> Dict:
+    """Итог набора параметров по всем фикстурам: средние метрики, сумма обрезаний"""
+    ok = [case for case in cases if 'error' not in case]
+    result = {'name': params_name(params), 'params': params, 'fixtures': len(ok),
+              'failed': len(cases) - len(ok)}
+    if ok:
+        result.update({
+            'rtf': _mean([case['rtf'] for case in ok]),
+            'snr_gain': _mean([case['snr_gain'] for case in ok]),
+            'loudness_deviation': _mean([case['loudness_deviation'] for case in ok]),
+            'clipped': sum(case['clipped'] for case in ok),
+        })
+    return result
+
+
+def _dominates(a: Dict, b: Dict) -> bool:
+    """a не хуже b по всем критериям и лучше хотя бы по одному"""
+    better = False
+    for key, sign in SWEEP_OBJECTIVES:
+        if a[key] * sign < b[key] * sign:
+            return False
+        if a[key] * sign > b[key] * sign:
+            better = True
+    return better
+
+
+def pareto_layers(rows: List[Dict]) -> List[List[Dict]]:
+    """Разбиение на слои Парето: первый слой - недоминируемые наборы"""
+    layers = []
+    remaining = list(rows)
+    while remaining:
+        layer = [row for row in remaining
+                 if not any(_dominates(other, row) for other in remaining if other is not row)]
+        layers.append(layer)
+        remaining = [row for row in remaining if not any(row is chosen for chosen in layer)]
+    return layers
+
+
+def rank_results(results: List[Dict]) -> List[Dict]:
+    """Рейтинг: по слою Парето, внутри слоя - по приросту SNR, затем по скорости"""
+    complete = [row for row in results
+                if all(row.get(key) is not None for key, _ in SWEEP_OBJECTIVES)]
+    ranking = []
+    for number, layer in enumerate(pareto_layers(complete), 1):
+        for row in sorted(layer, key=lambda row: (-row['snr_gain'], row['rtf'])):
+            ranking.append(dict(row, pareto_layer=number))
+    for position, row in enumerate(ranking, 1):
+        row['rank'] = position
+    return ranking
+
+
+def run_sweep(fixtures_dir: str, grid: List[Dict], workers: int = None,
+              cache_dir: str = SWEEP_CACHE_DIR) -> Dict:
+    """Прогон сетки параметров по фикстурам в пуле процессов"""
+    workers = workers or os.cpu_count() or 1
+    videos = sorted(os.path.join(fixtures_dir, name) for name in os.listdir(fixtures_dir)
+                    if os.path.splitext(name)[1].lower() in VIDEO_EXTENSIONS)
+
+    # Каждая фикстура декодируется и анализируется один раз на весь прогон
+    fixtures = []
+    for video in videos:
+        name = os.path.basename(video)
+        audio = decode_fixture(video, cache_dir)
+        analysis = FFmpegClient.analyze_audio(audio, measure_loudness=False) if audio else None
+        if analysis is None:
+            logger.warning(f"Skipping fixture {name}: decoding or analysis failed")
+            continue
+        fixtures.append({'name': name, 'audio': audio, 'duration': analysis.duration,
+                         'snr_in': snr(analysis),
+                         'loudness_in': analysis.integrated_loudness})
+    logger.info(f"Sweep: {len(grid)} parameter set(s) x {len(fixtures)} fixture(s), "
+                f"{workers} worker(s)")
+
+    cases = {params_name(params): [] for params in grid}
+    with tempfile.TemporaryDirectory(prefix="voice_cleaner_sweep_") as work_dir, \
+            ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(run_case, fixture['audio'], params, fixture['duration'],
+                            fixture['snr_in'], work_dir): (params, fixture)
+            for params in grid for fixture in fixtures
+        }
+        for done, future in enumerate(as_completed(futures), 1):
+            params, fixture = futures[future]
+            try:
+                case = future.result()
+            except Exception as e:
+                case = {'error': str(e)}
+            case['fixture'] = fixture['name']
+            cases[params_name(params)].append(case)
+            logger.debug(f"   [{done}/{len(futures)}] {params_name(params)} "
+                         f"on {fixture['name']}: {case}")
+
+    results = []
+    for params in grid:
+        result = aggregate(params, cases[params_name(params)])
+        result['cases'] = sorted(cases[params_name(params)], key=lambda case: case['fixture'])
+        results.append(result)
+
+    ranking = rank_results(results)
+    return {
+        'created_at': datetime.now().isoformat(),
+        'host': platform.node(),
+        'cpu_count': os.cpu_count(),
+        'workers': workers,
+        'fixtures': [{key: value for key, value in fixture.items() if key != 'audio'}
+                     for fixture in fixtures],
+        'objectives': [{'metric': key, 'better': 'higher' if sign > 0 else 'lower'}
+                       for key, sign in SWEEP_OBJECTIVES],
+        'results': results,
+        'ranking': [{key: value for key, value in row.items() if key != 'cases'}
+                    for row in ranking],
+        'pareto_front': [row['name'] for row in ranking if row['pareto_layer'] == 1],
+    }
+
+
+def print_sweep(results: Dict):
+    """Таблица рейтинга наборов параметров"""
+    logger.info(f"\n{'=' * 60}")
+    logger.info("SWEEP RESULTS")
+    logger.info(f"{'=' * 60}")
+    logger.info(f"{'#':>3} {'parameters':<28} {'RTF':>7} {'SNR+':>7} {'LUdev':>6} "
+                f"{'clip':>6}  pareto")
+    for row in results['ranking']:
+        logger.info(f"{row['rank']:>3} {row['name']:<28} {row['rtf']:>7.3f} "
+                    f"{row['snr_gain']:>7.2f} {row['loudness_deviation']:>6.2f} "
+                    f"{row['clipped']:>6}  {'*' if row['pareto_layer'] == 1 else row['pareto_layer']}")
+    unranked = [row['name'] for row in results['results']
+                if row['name'] not in {ranked['name'] for ranked in results['ranking']}]
+    if unranked:
+        logger.info(f"Not ranked (failed or incomplete metrics): {', '.join(unranked)}")
@@ -0,0 +1,132 @@
+from typing import List, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    # NumPy нужен только детектору речи; без него используется silencedetect
+    np = None
+
+from .paths import *
+from .denoise import open_samples, wav_layout
+
+
+def numpy_available() -> bool:
+    return np is not None
+
+
+def resolve_vad(vad: str) -> str:
+    """auto - детектор на NumPy, если numpy установлен, иначе silencedetect"""
+    if vad == 'auto':
+        return 'numpy' if numpy_available() else 'silencedetect'
+    return vad
+
+
+def frame_features(samples, sample_rate: int = SAMPLE_RATE):
+    """Признаки кадров: энергия (дБ), спектральная плоскостность в полосе речи, ZCR
+
+    Сэмплы читаются блоками, в памяти держатся только признаки кадров.
+    """
+    frame = int(VAD_FRAME_SECONDS * sample_rate)
+    hop = int(VAD_HOP_SECONDS * sample_rate)
+    count = 1 + (len(samples) - frame) // hop if len(samples) >= frame else 0
+    block_frames = max(1, int(VAD_BLOCK_SECONDS * sample_rate) // hop)
+
+    window = np.hanning(frame).astype(np.float32)
+    bins = np.fft.rfftfreq(frame, 1 / sample_rate)
+    band = (bins >= SPEECH_BAND[0]) & (bins <= SPEECH_BAND[1])
+
+    energy = np.empty(count, dtype=np.float32)
+    flatness = np.empty(count, dtype=np.float32)
+    zcr = np.empty(count, dtype=np.float32)
+
+    for first in range(0, count, block_frames):
+        last = min(first + block_frames, count)
+        # Блок покрывает кадры [first, last) целиком
+        block = samples[first * hop:(last - 1) * hop + frame].astype(np.float32) / 32768
+        frames = np.lib.stride_tricks.sliding_window_view(block, frame)[::hop]
+
+        energy[first:last] = 10 * np.log10(np.mean(frames ** 2, axis=1) + 1e-10)
+        signs = np.signbit(frames)
+        zcr[first:last] = np.mean(signs[:, 1:] != signs[:, :-1], axis=1)
+
+        power = np.abs(np.fft.rfft(frames * window, axis=1))[:, band] ** 2 + 1e-12
+        flatness[first:last] = np.exp(np.mean(np.log(power), axis=1)) / np.mean(power, axis=1)
+
+    return energy, flatness, zcr
+
+
+def noise_floor_db(energy, hop_seconds: float = VAD_HOP_SECONDS) -> float:
+    """Уровень шума по энергии кадров, устойчивый к записям почти без пауз
+
+    Нижний перцентиль считается по коротким блокам: в каждом блоке речи есть
+    промежутки между словами, поэтому минимум по блокам близок к шуму, даже
+    если пауз в записи меньше 10%.
+    """
+    if not len(energy):
+        return 0.0
+    block = max(1, int(VAD_FLOOR_BLOCK_SECONDS / hop_seconds))
+    lows = [np.percentile(energy[start:start + block], VAD_FLOOR_PERCENTILE)
+            for start in range(0, len(energy), block)]
+    peak = np.percentile(energy, 99)
+    return float(max(min(lows), peak - VAD_DYNAMIC_RANGE_DB))
+
+
+def speech_scores(energy, flatness, zcr):
+    """Оценка речи в кадре от 0 до 1"""
+    noise_floor = noise_floor_db(energy)
+    energy_score = np.clip((energy - noise_floor - VAD_ENERGY_MARGIN_DB) / VAD_ENERGY_RANGE_DB,
+                           0, 1)
+    # Речь тональная: плоскостность спектра низкая, у шума близка к 1
+    flatness_score = np.clip(1 - flatness / 0.5, 0, 1)
+    # Частые переходы через ноль - шипящие или шум, речь в основном звонкая
+    zcr_score = np.clip(1 - (zcr - 0.1) / 0.4, 0, 1)
+    return 0.6 * energy_score + 0.25 * flatness_score + 0.15 * zcr_score
+
+
+def hysteresis(scores):
+    """Состояние речи: включается выше VAD_ON_THRESHOLD, выключается ниже VAD_OFF_THRESHOLD"""
+    events = np.where(scores > VAD_ON_THRESHOLD, 1,
+                      np.where(scores < VAD_OFF_THRESHOLD, 0, -1))
+    # Между порогами сохраняется последнее состояние (протягивание вперед)
+    positions = np.where(events >= 0, np.arange(len(events)), -1)
+    last = np.maximum.accumulate(positions) if len(positions) else positions
+    return np.where(last >= 0, events[np.maximum(last, 0)], 0) == 1
+
+
+def smooth_intervals(intervals: List[Tuple[int, int]], min_speech: int,
+                     min_silence: int) -> List[Tuple[int, int]]:
+    """Слияние участков через короткие паузы и удаление коротких участков (в кадрах)"""
+    merged = []
+    for start, end in intervals:
+        if merged and start - merged[-1][1] < min_silence:
+            merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return [(start, end) for start, end in merged if end - start >= min_speech]
+
+
+def detect_speech(audio_path: str) -> List[Tuple[float, float, float]]:
+    """Участки речи в WAV: (начало, конец, уверенность) в секундах"""
+    _, total, sample_rate = wav_layout(audio_path)
+    energy, flatness, zcr = frame_features(open_samples(audio_path), sample_rate)
+    if not len(energy):
+        return []
+
+    scores = speech_scores(energy, flatness, zcr)
+    active = hysteresis(scores)
+
+    # Границы участков по переходам состояния
+    edges = np.diff(np.concatenate([[0], active.astype(np.int8), [0]]))
+    starts, ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+    hop_seconds = VAD_HOP_SECONDS
+    frame_seconds = VAD_FRAME_SECONDS
+    intervals = smooth_intervals(list(zip(starts.tolist(), ends.tolist())),
+                                 int(VAD_MIN_SPEECH / hop_seconds),
+                                 int(VAD_MIN_SILENCE / hop_seconds))
+
+    duration = total / sample_rate
+    return [(round(start * hop_seconds, 3),
+             round(min((end - 1) * hop_seconds + frame_seconds, duration), 3),
+             round(float(scores[start:end].mean()), 3))
+            for start, end in intervals]
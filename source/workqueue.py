@@ -0,0 +1,460 @@
+import hashlib
+import json
+import os
+import signal
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from .paths import *
+from .log import logger
+from .journal import write_json_atomic
+
+LEASES = "leases"
+DONE = "done"
+FAILED = "failed"
+MANIFESTS = "manifests"
+WORKERS = "workers"
+
+
+def _read_json(path: str) -> Optional[Dict]:
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def server_time(directory: str) -> float:
+    """Текущее время по часам файлового сервера: время изменения нового файла
+
+    Время изменения аренд ставит сервер, поэтому их возраст считается по его
+    часам; без доступа на запись - по часам узла.
+    """
+    path = os.path.join(directory, f".clock.{uuid.uuid4().hex}")
+    try:
+        with open(path, 'w'):
+            pass
+        return os.stat(path).st_mtime
+    except OSError:
+        return time.time()
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def task_key(relative_path: str, stat: os.stat_result) -> str:
+    """Ключ задачи: путь относительно входной директории и версия файла
+
+    Путь относительный, потому что узлы могут монтировать общий том
+    в разные места; измененный файл получает новый ключ и обрабатывается заново.
+    """
+    source = f"{relative_path}\0{stat.st_size}\0{stat.st_mtime_ns}"
+    return hashlib.sha256(source.encode()).hexdigest()[:32]
+
+
+class WorkQueue:
+    """Очередь задач в общей директории (NFS/SMB) для обработчиков на разных узлах
+
+    Файл берется в работу созданием файла аренды через os.link: ссылка
+    создается атомарно и на NFS, поэтому у файла ровно один обработчик.
+    Пока файл обрабатывается, время изменения аренды обновляется; аренда без
+    обновлений дольше lease_ttl считается брошенной (узел упал) и забирается
+    другим обработчиком. Результаты пишутся в журнал каждого обработчика
+    (manifests/<worker>.jsonl), общая картина собирается из всех журналов.
+    """
+
+    def __init__(self, queue_dir: str, lease_ttl: float = QUEUE_LEASE_TTL,
+                 heartbeat_interval: float = QUEUE_HEARTBEAT_INTERVAL,
+                 poll_interval: float = QUEUE_POLL_INTERVAL,
+                 extensions: List[str] = None):
+        self.queue_dir = queue_dir
+        self.lease_ttl = lease_ttl
+        self.heartbeat_interval = heartbeat_interval
+        self.poll_interval = poll_interval
+        self.extensions = extensions or VIDEO_EXTENSIONS
+        self.host = socket.gethostname()
+        self.worker_id = f"{self.host}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        # Арендованные задачи: ключ -> метка аренды
+        self._held: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self.processed = 0
+        self.failed = 0
+
+    def _path(self, *parts: str) -> str:
+        return os.path.join(self.queue_dir, *parts)
+
+    def _lease_path(self, key: str) -> str:
+        return self._path(LEASES, f"{key}.lease")
+
+    @property
+    def _worker_file(self) -> str:
+        return self._path(WORKERS, f"{self.worker_id}.json")
+
+    def stop(self, *_):
+        """Остановка: новые файлы не берутся, начатые задачи доводятся до конца"""
+        if not self._stopping.is_set():
+            logger.info("Stop requested, finishing jobs in progress...")
+            self._stopping.set()
+
+    def run(self, cleaner, input_dir: str, output_dir: str) -> Dict:
+        """Обработка файлов директории вместе с другими обработчиками очереди
+
+        Работа заканчивается, когда у каждого файла есть результат: файлы,
+        арендованные другими, ожидаются, чтобы забрать их при падении узла.
+        """
+        for name in (LEASES, DONE, FAILED, MANIFESTS, WORKERS):
+            os.makedirs(self._path(name), exist_ok=True)
+        os.makedirs(output_dir, exist_ok=True)
+        write_json_atomic(self._worker_file, {
+            'worker': self.worker_id,
+            'host': self.host,
+            'pid': os.getpid(),
+            'jobs': cleaner.jobs,
+            'started_at': datetime.now().isoformat(),
+        })
+
+        handlers = {}
+        if threading.current_thread() is threading.main_thread():
+            for sig in (signal.SIGTERM, signal.SIGINT):
+                handlers[sig] = signal.signal(sig, self.stop)
+
+        heartbeat_stop = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(heartbeat_stop,), daemon=True)
+        heartbeat.start()
+        logger.info(f"Queue worker {self.worker_id}: {input_dir} -> {output_dir} "
+                    f"with {cleaner.jobs} job(s), queue {self.queue_dir}")
+
+        try:
+            while not self._stopping.is_set():
+                tasks = self._pending(input_dir, output_dir)
+                if not tasks:
+                    break
+
+                taken = self._work(cleaner, tasks, input_dir, output_dir)
+                if not taken and not self._stopping.is_set():
+                    # Остальные файлы арендованы: ждем результата или истечения аренды
+                    logger.info(f"Waiting for {len(tasks)} file(s) leased by other workers...")
+                    self._stopping.wait(self.poll_interval)
+        finally:
+            heartbeat_stop.set()
+            heartbeat.join()
+            for sig, handler in handlers.items():
+                signal.signal(sig, handler)
+            try:
+                os.remove(self._worker_file)
+            except OSError:
+                pass
+
+        logger.info(f"Queue worker {self.worker_id} stopped: "
+                    f"{self.processed} processed, {self.failed} failed")
+        return {'worker': self.worker_id, 'processed': self.processed, 'failed': self.failed}
+
+    def _pending(self, input_dir: str, output_dir: str) -> List[Tuple[str, str, int]]:
+        """Файлы без результата: (ключ, относительный путь, размер), крупные первыми"""
+        tasks = []
+        output_dir = os.path.abspath(output_dir)
+        for root, _, files in os.walk(input_dir):
+            root_dir = os.path.abspath(root)
+            if root_dir == output_dir or root_dir.startswith(output_dir + os.sep):
+                continue
+            for file in files:
+                if file.startswith('.') or \
+                        not any(file.lower().endswith(ext) for ext in self.extensions):
+                    continue
+                input_path = os.path.join(root, file)
+                try:
+                    stat = os.stat(input_path)
+                except OSError:
+                    continue
+                relative_path = os.path.relpath(input_path, input_dir)
+                key = task_key(relative_path, stat)
+                if not self._has_result(key):
+                    tasks.append((key, relative_path, stat.st_size))
+
+        # Размер - оценка длительности: длинные файлы раньше сокращают общее время
+        tasks.sort(key=lambda task: task[2], reverse=True)
+        return tasks
+
+    def _has_result(self, key: str) -> bool:
+        return any(os.path.exists(self._path(status, f"{key}.json"))
+                   for status in (DONE, FAILED))
+
+    def _work(self, cleaner, tasks: List[Tuple[str, str, int]],
+              input_dir: str, output_dir: str) -> int:
+        """Один проход по списку: потоки по очереди арендуют и обрабатывают файлы"""
+        remaining = iter(tasks)
+        lock = threading.Lock()
+
+        def job() -> int:
+            taken = 0
+            while not self._stopping.is_set():
+                with lock:
+                    task = next(remaining, None)
+                if task is None:
+                    break
+                key, relative_path, _ = task
+                if self._claim(key, relative_path):
+                    taken += 1
+                    self._process(cleaner, key, relative_path, input_dir, output_dir)
+            return taken
+
+        with ThreadPoolExecutor(max_workers=cleaner.jobs) as executor:
+            futures = [executor.submit(job) for _ in range(cleaner.jobs)]
+            return sum(future.result() for future in futures)
+
+    def _server_now(self) -> float:
+        """Текущее время по часам файлового сервера
+
+        Время изменения аренды ставит сервер, поэтому возраст аренды
+        сравнивается с его часами, а не с часами узла.
+        """
+        try:
+            os.utime(self._worker_file)
+            return os.stat(self._worker_file).st_mtime
+        except OSError:
+            return time.time()
+
+    def _claim(self, key: str, relative_path: str) -> bool:
+        """Аренда задачи; истекшая аренда другого обработчика забирается"""
+        lease = self._lease_path(key)
+        if os.path.exists(lease) and not self._expire(key, relative_path):
+            return False
+
+        token = uuid.uuid4().hex
+        tmp_path = self._path(LEASES, f".{key}.{token}.tmp")
+        write_json_atomic(tmp_path, {
+            'worker': self.worker_id,
+            'host': self.host,
+            'input': relative_path,
+            'token': token,
+            'claimed_at': datetime.now().isoformat(),
+        })
+        try:
+            os.link(tmp_path, lease)
+            claimed = True
+        except FileExistsError:
+            claimed = False
+        except OSError:
+            # Ответ сервера на link мог потеряться (NFS): итог виден по числу ссылок;
+            # без поддержки жестких ссылок (SMB) - эксклюзивное создание файла
+            claimed = os.stat(tmp_path).st_nlink == 2 or \
+                self._create_exclusive(tmp_path, lease)
+        finally:
+            os.remove(tmp_path)
+        if not claimed:
+            return False
+
+        # Файл мог быть обработан между поиском задач и арендой
+        if self._has_result(key):
+            os.remove(lease)
+            return False
+        with self._lock:
+            self._held[key] = token
+        return True
+
+    @staticmethod
+    def _create_exclusive(source: str, path: str) -> bool:
+        try:
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, 'wb') as f, open(source, 'rb') as src:
+            f.write(src.read())
+            f.flush()
+            os.fsync(f.fileno())
+        return True
+
+    def _expire(self, key: str, relative_path: str) -> bool:
+        """Снятие истекшей аренды; True, если аренды больше нет"""
+        lease = self._lease_path(key)
+        try:
+            stat = os.stat(lease)
+        except FileNotFoundError:
+            return True
+        if self._server_now() - stat.st_mtime < self.lease_ttl:
+            return False
+
+        owner = _read_json(lease) or {}
+        expired = self._path(LEASES, f".{key}.{uuid.uuid4().hex}.expired")
+        try:
+            os.rename(lease, expired)
+        except FileNotFoundError:
+            return True
+        if os.stat(expired).st_ino != stat.st_ino:
+            # Аренду успели заменить на новую: возвращаем ее на место
+            try:
+                os.link(expired, lease)
+            except FileExistsError:
+                pass
+            os.remove(expired)
+            return False
+
+        os.remove(expired)
+        logger.warning(f"Reclaimed expired lease on {relative_path} "
+                       f"from {owner.get('worker', 'unknown worker')}")
+        return True
+
+    def _release(self, key: str):
+        """Снятие своей аренды; чужую (после истечения нашей) не трогаем"""
+        with self._lock:
+            token = self._held.pop(key, None)
+        lease = self._lease_path(key)
+        if token and (_read_json(lease) or {}).get('token') == token:
+            os.remove(lease)
+
+    def _heartbeat(self, stop: threading.Event):
+        """Обновление времени изменения арендованных задач и файла обработчика"""
+        while not stop.wait(self.heartbeat_interval):
+            try:
+                os.utime(self._worker_file)
+            except OSError:
+                pass
+            with self._lock:
+                held = dict(self._held)
+            for key, token in held.items():
+                lease = self._lease_path(key)
+                if (_read_json(lease) or {}).get('token') != token:
+                    logger.warning(f"Lease {key} was taken over by another worker")
+                    continue
+                try:
+                    os.utime(lease)
+                except OSError as e:
+                    logger.warning(f"Warning: could not renew lease {key}: {e}")
+
+    def _process(self, cleaner, key: str, relative_path: str,
+                 input_dir: str, output_dir: str):
+        input_path = os.path.join(input_dir, relative_path)
+        output_path = self._output_path(input_path, output_dir)
+        started = time.time()
+        try:
+            success = cleaner.process_video(input_path, output_path)
+        except Exception as e:
+            logger.error(f"Error processing {relative_path}: {e}")
+            success = False
+        finished = time.time()
+
+        try:
+            if not success and self._stopping.is_set():
+                # Задачу прервала остановка: файл останется для других обработчиков
+                logger.info(f"Returning {relative_path} to the queue")
+                return
+            self._record(key, {
+                'input': relative_path,
+                'output': os.path.relpath(output_path, output_dir),
+                'status': 'done' if success else 'failed',
+                'worker': self.worker_id,
+                'host': self.host,
+                'bytes': os.path.getsize(input_path),
+                'started_at': started,
+                'finished_at': finished,
+                'elapsed': round(finished - started, 3),
+            })
+        finally:
+            self._release(key)
+
+    @staticmethod
+    def _output_path(input_path: str, output_dir: str) -> str:
+        """Имя выходного файла, как при обработке директории"""
+        name, ext = os.path.splitext(os.path.basename(input_path))
+        return os.path.join(output_dir, f"{name}_cleaned{ext}")
+
+    def _record(self, key: str, entry: Dict):
+        """Результат задачи: отметка для других обработчиков и строка журнала"""
+        success = entry['status'] == 'done'
+        write_json_atomic(self._path(DONE if success else FAILED, f"{key}.json"), entry)
+        with self._lock:
+            if success:
+                self.processed += 1
+            else:
+                self.failed += 1
+            # Журнал у каждого обработчика свой: дописывание без гонок между узлами
+            with open(self._path(MANIFESTS, f"{self.worker_id}.jsonl"), 'a',
+                      encoding='utf-8') as f:
+                f.write(json.dumps(entry) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+
+def queue_status(queue_dir: str, lease_ttl: float = QUEUE_LEASE_TTL) -> Dict:
+    """Состояние очереди: результаты и пропускная способность по узлам, аренды"""
+    nodes: Dict[str, Dict] = {}
+    manifests = os.path.join(queue_dir, MANIFESTS)
+    for name in sorted(os.listdir(manifests)) if os.path.isdir(manifests) else []:
+        with open(os.path.join(manifests, name), encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Строка, недописанная при падении узла
+                    continue
+                node = nodes.setdefault(entry['host'], {
+                    'done': 0, 'failed': 0, 'bytes': 0, 'busy_seconds': 0.0,
+                    'first_started': entry['started_at'], 'last_finished': entry['finished_at'],
+                    'workers': set(),
+                })
+                node[entry['status']] += 1
+                node['bytes'] += entry['bytes'] if entry['status'] == 'done' else 0
+                node['busy_seconds'] += entry['elapsed']
+                node['first_started'] = min(node['first_started'], entry['started_at'])
+                node['last_finished'] = max(node['last_finished'], entry['finished_at'])
+                node['workers'].add(entry['worker'])
+
+    for node in nodes.values():
+        wall = max(node['last_finished'] - node['first_started'], 1e-6)
+        node['workers'] = len(node['workers'])
+        node['files_per_hour'] = round(node['done'] / wall * 3600, 2)
+        node['mb_per_second'] = round(node['bytes'] / wall / 1024 ** 2, 3)
+        node['busy_seconds'] = round(node['busy_seconds'], 3)
+
+    # Аренды и обработчики отмечаются часами сервера, как в WorkQueue._claim
+    now = server_time(queue_dir)
+    leases = []
+    lease_dir = os.path.join(queue_dir, LEASES)
+    for name in sorted(os.listdir(lease_dir)) if os.path.isdir(lease_dir) else []:
+        if not name.endswith('.lease'):
+            continue
+        path = os.path.join(lease_dir, name)
+        owner = _read_json(path)
+        try:
+            age = now - os.stat(path).st_mtime
+        except OSError:
+            continue
+        if owner:
+            leases.append({'input': owner['input'], 'worker': owner['worker'],
+                           'host': owner['host'], 'heartbeat_age': round(age, 1),
+                           'expired': age >= lease_ttl})
+
+    workers = []
+    worker_dir = os.path.join(queue_dir, WORKERS)
+    for name in sorted(os.listdir(worker_dir)) if os.path.isdir(worker_dir) else []:
+        path = os.path.join(worker_dir, name)
+        info = _read_json(path)
+        try:
+            age = now - os.stat(path).st_mtime
+        except OSError:
+            continue
+        if info:
+            workers.append({'worker': info['worker'], 'host': info['host'],
+                            'jobs': info['jobs'], 'heartbeat_age': round(age, 1),
+                            'alive': age < lease_ttl})
+
+    def count(status: str) -> int:
+        directory = os.path.join(queue_dir, status)
+        return len(os.listdir(directory)) if os.path.isdir(directory) else 0
+
+    return {
+        'done': count(DONE),
+        'failed': count(FAILED),
+        'leased': len(leases),
+        'nodes': nodes,
+        'workers': workers,
+        'leases': leases,
+    }
@@ -0,0 +1,110 @@
+import math
+
+import pytest
+
+from source.analysis import (invert_intervals, merge_intervals, parse_analysis, parse_astats,
+                             parse_loudnorm, parse_silencedetect, split_window_logs)
+
+ASTATS_MONO = """\
+[Parsed_astats_1 @ 0x5581] Channel: 1
+[Parsed_astats_1 @ 0x5581] DC offset: 0.000012
+[Parsed_astats_1 @ 0x5581] Peak level dB: -3.200000
+[Parsed_astats_1 @ 0x5581] RMS level dB: -20.100000
+[Parsed_astats_1 @ 0x5581] Crest factor: 8.200000
+[Parsed_astats_1 @ 0x5581] Noise floor dB: -inf
+[Parsed_astats_1 @ 0x5581] Overall
+[Parsed_astats_1 @ 0x5581] Peak level dB: -3.200000
+[Parsed_astats_1 @ 0x5581] RMS level dB: -20.100000
+[Parsed_astats_1 @ 0x5581] Noise floor dB: -inf
+[Parsed_astats_1 @ 0x5581] Number of samples: 160000
+"""
+
+SILENCEDETECT = """\
+[silencedetect @ 0x5582] silence_start: 1.5
+[silencedetect @ 0x5582] silence_end: 2.5 | silence_duration: 1
+[silencedetect @ 0x5582] silence_start: 8.25
+"""
+
+LOUDNORM = """\
+[Parsed_loudnorm_2 @ 0x5583]
+{
+	"input_i" : "-23.51",
+	"input_tp" : "-4.02",
+	"input_lra" : "6.30",
+	"input_thresh" : "-34.12",
+	"output_i" : "-16.02",
+	"target_offset" : "0.02"
+}
+"""
+
+
+def test_parse_astats_reads_channel_section_and_drops_infinite():
+    stats = parse_astats(ASTATS_MONO)
+    assert stats['rms_level'] == -20.1
+    assert stats['peak_level'] == -3.2
+    # Crest factor есть только в разделе канала
+    assert stats['crest_factor'] == 8.2
+    assert stats['noise_floor'] is None
+    assert stats['samples'] == 160000
+
+
+def test_parse_astats_empty():
+    assert parse_astats('') == {'rms_level': None, 'peak_level': None, 'noise_floor': None,
+                                'crest_factor': None, 'samples': None}
+
+
+def test_parse_silencedetect_open_ended():
+    assert parse_silencedetect(SILENCEDETECT) == [(1.5, 2.5), (8.25, math.inf)]
+
+
+def test_parse_loudnorm():
+    assert parse_loudnorm(LOUDNORM) == {'input_i': -23.51, 'input_tp': -4.02,
+                                        'input_lra': 6.3, 'input_thresh': -34.12,
+                                        'target_offset': 0.02}
+
+
+def test_parse_loudnorm_rejects_infinite():
+    assert parse_loudnorm(LOUDNORM.replace('"-23.51"', '"-inf"')) == {}
+
+
+def test_parse_analysis_closes_trailing_silence():
+    analysis = parse_analysis(ASTATS_MONO + SILENCEDETECT + LOUDNORM, sample_rate=16000)
+    assert analysis.duration == 10.0
+    assert analysis.silence_regions == [(1.5, 2.5), (8.25, 10.0)]
+    assert analysis.speech_regions == [(0.0, 1.5), (2.5, 8.25)]
+    assert analysis.loudness['input_i'] == -23.51
+    assert analysis.noise_floor is None
+
+
+def test_invert_intervals():
+    assert invert_intervals([(1.0, 2.0), (4.0, 5.0)], 6.0) == \
+        [(0.0, 1.0), (2.0, 4.0), (5.0, 6.0)]
+    assert invert_intervals([(0.0, 6.0)], 6.0) == []
+    assert invert_intervals([], 3.0) == [(0.0, 3.0)]
+    # Пересекающиеся и неотсортированные интервалы
+    assert invert_intervals([(3.0, 4.0), (0.5, 2.0), (1.5, 2.5)], 5.0) == \
+        [(0.0, 0.5), (2.5, 3.0), (4.0, 5.0)]
+
+
+def test_merge_intervals_margin_and_gap():
+    merged = merge_intervals([(1.0, 2.0), (2.3, 3.0)], margin=0.1)
+    assert [pytest.approx(interval) for interval in merged] == [(0.9, 2.1), (2.2, 3.1)]
+    assert merge_intervals([(1.0, 2.0), (2.3, 3.0)], min_gap=0.5) == [(1.0, 3.0)]
+    assert merge_intervals([(0.05, 1.0)], margin=0.1) == [(0.0, 1.1)]
+
+
+def test_merge_intervals_max_count_keeps_longest_gaps():
+    intervals = [(0.0, 1.0), (1.1, 2.0), (5.0, 6.0), (6.5, 7.0)]
+    assert merge_intervals(intervals, max_count=2) == [(0.0, 2.0), (5.0, 7.0)]
+
+
+def test_split_window_logs():
+    stderr = "\n".join([
+        "[Parsed_astats_3 @ 0x1] RMS level dB: -20",
+        "[Parsed_astats_7 @ 0x2] RMS level dB: -30",
+        "[Parsed_silencedetect_4 @ 0x3] silence_start: 1",
+    ])
+    windows = split_window_logs(stderr)
+    assert len(windows) == 2
+    assert '-20' in windows[0] and 'silence_start' in windows[0]
+    assert '-30' in windows[1]
@@ -0,0 +1,60 @@
+import pytest
+
+from source.chunking import extend_chunks, plan_chunks
+
+RATE = 100
+
+
+def test_plan_chunks_covers_file_without_gaps():
+    chunks = plan_chunks(1000 * RATE, [], chunk_seconds=300, sample_rate=RATE)
+    assert chunks[0][0] == 0 and chunks[-1][1] == 1000 * RATE
+    assert all(end == start for (_, end), (start, _) in zip(chunks, chunks[1:]))
+    # Без пауз режется ровно по целевой длине, остаток не длиннее полутора частей
+    assert chunks[:2] == [(0, 300 * RATE), (300 * RATE, 600 * RATE)]
+    assert chunks[-1][1] - chunks[-1][0] <= 450 * RATE
+
+
+def test_plan_chunks_cuts_in_nearest_silence():
+    silences = [(200.0, 202.0), (310.0, 312.0), (500.0, 501.0)]
+    chunks = plan_chunks(700 * RATE, silences, chunk_seconds=300, sample_rate=RATE)
+    assert chunks[0] == (0, 311 * RATE)
+
+
+def test_plan_chunks_short_file_is_one_chunk():
+    assert plan_chunks(400 * RATE, [(100.0, 101.0)], chunk_seconds=300,
+                       sample_rate=RATE) == [(0, 400 * RATE)]
+
+
+def test_extend_chunks_overlap_restores_length():
+    chunks = [(0, 1000), (1000, 2500), (2500, 4000)]
+    overlap = 100
+    extended = extend_chunks(chunks, overlap)
+    assert extended == [(0, 1050), (950, 2550), (2450, 4000)]
+    # acrossfade на каждом стыке съедает overlap сэмплов
+    stitched = sum(end - start for start, end in extended) - overlap * (len(chunks) - 1)
+    assert stitched == 4000
+
+
+def test_stitch_chunks_command(monkeypatch):
+    pytest.importorskip('ffmpeg')
+    from source import ffmpeg_client
+    from source.runner import RunResult
+
+    calls = []
+
+    def fake_run(cmd, **kwargs):
+        calls.append((cmd, kwargs))
+        return RunResult(cmd, 0, '')
+
+    monkeypatch.setattr(ffmpeg_client, 'run_ffmpeg', fake_run)
+    result = ffmpeg_client.FFmpegClient.stitch_chunks(['a.wav', 'b.wav', 'c.wav'], 'out.wav',
+                                                      overlap_samples=800,
+                                                      measure_loudness=False)
+    assert result == {}
+    cmd, kwargs = calls[0]
+    graph = cmd[cmd.index('-filter_complex') + 1]
+    assert "[0:a][1:a]acrossfade=ns=800:c1=tri:c2=tri[x1]" in graph
+    assert "[x1][2:a]acrossfade=ns=800:c1=tri:c2=tri[x2]" in graph
+    assert graph.endswith("[x2]anull[out]")
+    assert cmd[-1] == 'out.wav'
+    assert kwargs['stderr_limit'] is None
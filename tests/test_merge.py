@@ -0,0 +1,36 @@
+import subprocess
+
+import pytest
+
+pytest.importorskip('ffmpeg')
+
+from source import ffmpeg_client
+from source.ffmpeg_client import FFmpegClient
+from source.paths import PIPE_OUTPUT_FORMAT
+from source.runner import RunResult
+
+
+def test_merge_command_to_stdout():
+    cmd = FFmpegClient.build_merge_command('in.mp4', 'clean.wav', '-')
+    assert cmd[-3:] == ['-f', PIPE_OUTPUT_FORMAT, 'pipe:1']
+    assert cmd[cmd.index('-map') + 1] == '0:v'
+
+
+def test_merge_command_to_file_with_filter():
+    cmd = FFmpegClient.build_merge_command('in.mp4', 'clean.wav', 'out.mp4',
+                                           audio_filter='loudnorm')
+    assert cmd[-1] == 'out.mp4' and '-f' not in cmd
+    assert cmd[cmd.index('-af') + 1] == 'loudnorm'
+
+
+@pytest.mark.parametrize('output, stdout', [('-', None), ('out.mp4', subprocess.DEVNULL)])
+def test_merge_writes_stdout_only_for_pipe_output(monkeypatch, output, stdout):
+    calls = []
+
+    def fake_run(cmd, **kwargs):
+        calls.append(kwargs)
+        return RunResult(cmd, 0, '')
+
+    monkeypatch.setattr(ffmpeg_client, 'run_ffmpeg', fake_run)
+    assert FFmpegClient.merge_audio_video('in.mp4', 'clean.wav', output)
+    assert calls[0]['stdout'] is stdout
@@ -0,0 +1,48 @@
+from source.paths import PRESET_DEFAULT, PRESET_GATE_FALLBACK_DB, PRESET_GATE_MARGIN_DB
+from source.presets import PRESETS, compile_preset, preset_filters, select_preset
+
+
+def _gate_threshold(name: str, threshold_db: int):
+    preset = PRESETS[name]
+    band, dynamics = compile_preset(preset['lowpass'], preset['gate_offset'],
+                                    preset['compressor_ratio'], preset['sidechain'],
+                                    threshold_db)
+    return list(band), list(dynamics)
+
+
+def test_preset_filters_gate_follows_noise_floor():
+    assert preset_filters('normal', -60.4) == \
+        _gate_threshold('normal', round(-60.4 + PRESET_GATE_MARGIN_DB))
+
+
+def test_preset_filters_without_noise_floor_uses_fallback():
+    assert preset_filters('normal') == _gate_threshold('normal', PRESET_GATE_FALLBACK_DB)
+
+
+def test_preset_filters_infinite_noise_floor_uses_fallback():
+    assert preset_filters('soft', float('-inf')) == \
+        _gate_threshold('soft', PRESET_GATE_FALLBACK_DB)
+    assert preset_filters('soft', float('nan')) == \
+        _gate_threshold('soft', PRESET_GATE_FALLBACK_DB)
+
+
+def test_preset_filters_threshold_capped_at_zero():
+    assert preset_filters('normal', 3.0) == _gate_threshold('normal', 0)
+
+
+def test_select_preset_without_measurements():
+    assert select_preset(None, -60, None)['preset'] == PRESET_DEFAULT
+    assert select_preset(-20, float('-inf'), None) == \
+        {'preset': PRESET_DEFAULT, 'reason': 'no measurements'}
+
+
+def test_select_preset_clean_input_takes_cheapest():
+    selection = select_preset(-20, -80, 5)
+    assert selection['reason'] == 'cheapest meeting target'
+    assert selection['preset'] == 'soft'
+
+
+def test_select_preset_noisy_input_takes_strongest():
+    selection = select_preset(-20, -25, 5)
+    assert selection['reason'] == 'target not reachable, strongest preset'
+    assert selection['preset'] == 'aggressive'
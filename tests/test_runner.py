@@ -0,0 +1,32 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip('ffmpeg')
+
+from source import runner
+from source.runner import FFmpegTimeout, run_ffmpeg_async
+
+
+def test_async_run_captures_output():
+    result = asyncio.run(run_ffmpeg_async(['sh', '-c', 'echo err >&2; echo out; exit 3'],
+                                          capture_stdout=True))
+    assert (result.returncode, result.stdout, result.stderr) == (3, b'out\n', 'err\n')
+
+
+def test_async_run_timeout_stops_process():
+    with pytest.raises(FFmpegTimeout):
+        asyncio.run(run_ffmpeg_async(['sleep', '30'], timeout=0.3))
+    assert not runner._running
+
+
+def test_async_run_cancel_stops_process():
+    async def cancel_soon():
+        task = asyncio.ensure_future(run_ffmpeg_async(['sleep', '30'], timeout=None))
+        await asyncio.sleep(0.3)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(cancel_soon())
+    assert not runner._running
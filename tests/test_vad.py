@@ -0,0 +1,73 @@
+import wave
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from source.paths import VAD_DYNAMIC_RANGE_DB, VAD_HOP_SECONDS
+from source.vad import detect_speech, noise_floor_db
+
+RATE = 16000
+
+
+def _voice(seconds: float, dip: float = 0.1) -> 'np.ndarray':
+    """Гармонический сигнал со слоговой огибающей 4 Гц; dip - ее минимум"""
+    t = np.arange(int(seconds * RATE)) / RATE
+    voice = sum(np.sin(2 * np.pi * f * t) / k for k, f in enumerate([150, 300, 450, 600], 1))
+    return 0.3 * voice * (dip + (1 - dip) * (0.5 + 0.5 * np.sin(2 * np.pi * 4 * t)))
+
+
+def _write_wav(path, signal, noise: float = 0.005):
+    rng = np.random.default_rng(0)
+    signal = signal + noise * rng.standard_normal(len(signal))
+    pcm = (np.clip(signal, -1, 1) * 32767).astype('<i2')
+    with wave.open(str(path), 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(RATE)
+        f.writeframes(pcm.tobytes())
+    return str(path)
+
+
+def _speech_seconds(regions):
+    return sum(end - start for start, end, _ in regions)
+
+
+def test_detect_speech_finds_bursts(tmp_path):
+    silence = np.zeros(2 * RATE)
+    path = _write_wav(tmp_path / 'bursts.wav',
+                      np.concatenate([silence, _voice(3), silence, _voice(3), silence]))
+    regions = detect_speech(path)
+    assert len(regions) == 2
+    for (start, end, confidence), expected in zip(regions, [(2.0, 5.0), (7.0, 10.0)]):
+        assert start == pytest.approx(expected[0], abs=0.15)
+        assert end == pytest.approx(expected[1], abs=0.15)
+        assert 0 < confidence <= 1
+
+
+def test_detect_speech_with_few_pauses(tmp_path):
+    # Пауз 5%, провалы между слогами неглубокие: нижний перцентиль по всему
+    # файлу пришелся бы на речь, и она целиком ушла бы под порог
+    signal = _voice(20, dip=0.3)
+    signal[10 * RATE:11 * RATE] = 0
+    regions = detect_speech(_write_wav(tmp_path / 'dense.wav', signal))
+    assert _speech_seconds(regions) > 17
+
+
+def test_detect_speech_noise_only(tmp_path):
+    assert detect_speech(_write_wav(tmp_path / 'noise.wav', np.zeros(5 * RATE))) == []
+
+
+def test_noise_floor_db_ignores_digital_silence():
+    block = int(2.0 / VAD_HOP_SECONDS)
+    energy = np.concatenate([np.full(block, -100.0), np.full(block, -10.0)])
+    assert noise_floor_db(energy) == pytest.approx(-10.0 - VAD_DYNAMIC_RANGE_DB)
+
+
+def test_noise_floor_db_uses_quietest_block():
+    block = int(2.0 / VAD_HOP_SECONDS)
+    quiet = np.full(block, -60.0)
+    # Речь с короткими провалами до -45 дБ: нижний перцентиль блока - провалы
+    loud = np.where(np.arange(block) % 5 == 0, -45.0, -20.0)
+    assert noise_floor_db(np.concatenate([loud, quiet, loud, loud])) == pytest.approx(-60.0)
+    assert noise_floor_db(np.array([])) == 0.0
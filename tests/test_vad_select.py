@@ -0,0 +1,17 @@
+from source import vad
+
+
+def test_auto_uses_numpy_when_installed(monkeypatch):
+    monkeypatch.setattr(vad, 'np', object())
+    assert vad.resolve_vad('auto') == 'numpy'
+
+
+def test_auto_falls_back_to_silencedetect(monkeypatch):
+    monkeypatch.setattr(vad, 'np', None)
+    assert vad.resolve_vad('auto') == 'silencedetect'
+
+
+def test_explicit_choice_is_kept(monkeypatch):
+    monkeypatch.setattr(vad, 'np', None)
+    assert vad.resolve_vad('numpy') == 'numpy'
+    assert vad.resolve_vad('silencedetect') == 'silencedetect'
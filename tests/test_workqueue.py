@@ -0,0 +1,95 @@
+import json
+import os
+import threading
+import time
+
+import pytest
+
+from source.workqueue import DONE, LEASES, WorkQueue, queue_status, task_key
+
+
+class FakeCleaner:
+    """Обработчик без ffmpeg: запоминает входы и пишет пустой выход"""
+    jobs = 1
+
+    def __init__(self):
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def process_video(self, input_path: str, output_path: str) -> bool:
+        with self.lock:
+            self.calls.append(os.path.basename(input_path))
+        with open(output_path, 'wb'):
+            pass
+        return True
+
+
+@pytest.fixture
+def dirs(tmp_path):
+    input_dir, output_dir, queue_dir = (str(tmp_path / name) for name in ('in', 'out', 'queue'))
+    os.makedirs(input_dir)
+    os.makedirs(queue_dir)
+    for number in range(4):
+        with open(os.path.join(input_dir, f"video{number}.mp4"), 'wb') as f:
+            f.write(b'x' * (number + 1))
+    return input_dir, output_dir, queue_dir
+
+
+def _key(input_dir: str, name: str) -> str:
+    return task_key(name, os.stat(os.path.join(input_dir, name)))
+
+
+def _lease(queue_dir: str, key: str, age: float):
+    os.makedirs(os.path.join(queue_dir, LEASES), exist_ok=True)
+    path = os.path.join(queue_dir, LEASES, f"{key}.lease")
+    with open(path, 'w') as f:
+        json.dump({'worker': 'gone-1', 'host': 'gone', 'input': 'video0.mp4',
+                   'token': 'old'}, f)
+    stale = time.time() - age
+    os.utime(path, (stale, stale))
+
+
+def test_workers_share_files_without_duplicates(dirs):
+    input_dir, output_dir, queue_dir = dirs
+    cleaners = [FakeCleaner(), FakeCleaner()]
+    workers = [threading.Thread(target=WorkQueue(queue_dir, poll_interval=0.05).run,
+                                args=(cleaner, input_dir, output_dir))
+               for cleaner in cleaners]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    calls = cleaners[0].calls + cleaners[1].calls
+    assert sorted(calls) == [f"video{number}.mp4" for number in range(4)]
+    status = queue_status(queue_dir)
+    assert (status['done'], status['failed'], status['leased']) == (4, 0, 0)
+
+
+def test_finished_file_is_skipped(dirs):
+    input_dir, output_dir, queue_dir = dirs
+    WorkQueue(queue_dir).run(FakeCleaner(), input_dir, output_dir)
+    cleaner = FakeCleaner()
+    assert WorkQueue(queue_dir).run(cleaner, input_dir, output_dir)['processed'] == 0
+    assert cleaner.calls == []
+
+
+def test_expired_lease_is_reclaimed(dirs):
+    input_dir, output_dir, queue_dir = dirs
+    # Обработчик пропал: аренда не обновлялась дольше lease_ttl
+    _lease(queue_dir, _key(input_dir, 'video0.mp4'), age=60)
+    cleaner = FakeCleaner()
+    WorkQueue(queue_dir, lease_ttl=30, poll_interval=0.05).run(cleaner, input_dir, output_dir)
+    assert 'video0.mp4' in cleaner.calls
+    assert os.listdir(os.path.join(queue_dir, LEASES)) == []
+    assert len(os.listdir(os.path.join(queue_dir, DONE))) == 4
+
+
+def test_queue_status_lease_age(dirs):
+    input_dir, _, queue_dir = dirs
+    _lease(queue_dir, _key(input_dir, 'video0.mp4'), age=200)
+    _lease(queue_dir, _key(input_dir, 'video1.mp4'), age=0)
+    leases = sorted(queue_status(queue_dir, lease_ttl=120)['leases'],
+                    key=lambda lease: lease['heartbeat_age'])
+    assert [lease['expired'] for lease in leases] == [False, True]
+    assert leases[1]['heartbeat_age'] == pytest.approx(200, abs=5)